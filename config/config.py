@@ -56,6 +56,77 @@ class Config:
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+    # Knowledge Base
+    KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "data/knowledge")
+    KNOWLEDGE_EMBED_BATCH_SIZE = int(os.getenv("KNOWLEDGE_EMBED_BATCH_SIZE", 64))  # Chunks per embedding request
+    KNOWLEDGE_EMBED_CONCURRENCY = int(os.getenv("KNOWLEDGE_EMBED_CONCURRENCY", 4))  # Embedding requests in flight
+    # Embedding provider requests: abandoned after this many seconds (0 waits), then retried with exponential backoff
+    KNOWLEDGE_EMBED_TIMEOUT = float(os.getenv("KNOWLEDGE_EMBED_TIMEOUT", 30))
+    KNOWLEDGE_EMBED_RETRIES = int(os.getenv("KNOWLEDGE_EMBED_RETRIES", 3))
+    KNOWLEDGE_EMBED_BACKOFF = float(os.getenv("KNOWLEDGE_EMBED_BACKOFF", 0.5))  # Seconds before the first retry
+    # Token-sized, heading-aware chunking; counts use this tiktoken encoding and are stored per chunk
+    KNOWLEDGE_CHUNK_TOKENS = int(os.getenv("KNOWLEDGE_CHUNK_TOKENS", 256))
+    KNOWLEDGE_CHUNK_OVERLAP_TOKENS = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP_TOKENS", 48))
+    KNOWLEDGE_TOKEN_ENCODING = os.getenv("KNOWLEDGE_TOKEN_ENCODING", "cl100k_base")
+    # PDF extraction processes, 0 = one per CPU
+    KNOWLEDGE_EXTRACT_WORKERS = int(os.getenv("KNOWLEDGE_EXTRACT_WORKERS", 0))
+    # Seconds per PDF before it is skipped
+    KNOWLEDGE_EXTRACT_TIMEOUT = float(os.getenv("KNOWLEDGE_EXTRACT_TIMEOUT", 300))
+    # Rewrite a full snapshot once the delta log holds this fraction of the snapshot's chunks
+    KNOWLEDGE_DELTA_COMPACT_RATIO = float(os.getenv("KNOWLEDGE_DELTA_COMPACT_RATIO", 0.25))
+    KNOWLEDGE_DELTA_COMPACT_MIN_RECORDS = int(os.getenv("KNOWLEDGE_DELTA_COMPACT_MIN_RECORDS", 500))
+    # Memory-map snapshot files so gunicorn workers share one copy of the index
+    KNOWLEDGE_MMAP_INDEX = os.getenv("KNOWLEDGE_MMAP_INDEX", "true").lower() == "true"
+    # Hash every snapshot file on load instead of checking sizes (reads the whole index)
+    KNOWLEDGE_VERIFY_CHECKSUMS = os.getenv("KNOWLEDGE_VERIFY_CHECKSUMS", "false").lower() == "true"
+    KNOWLEDGE_REFRESH_INTERVAL = float(os.getenv("KNOWLEDGE_REFRESH_INTERVAL", 1.0))  # Seconds between version checks
+    # Vector index backend: auto, flat, ivf_flat, hnsw or ivf_pq
+    KNOWLEDGE_INDEX_MODE = os.getenv("KNOWLEDGE_INDEX_MODE", "auto")
+    KNOWLEDGE_IVF_THRESHOLD = int(os.getenv("KNOWLEDGE_IVF_THRESHOLD", 20000))  # Auto mode: chunks before IVF-Flat
+    KNOWLEDGE_IVF_PQ_THRESHOLD = int(os.getenv("KNOWLEDGE_IVF_PQ_THRESHOLD", 500000))  # Auto mode: chunks before IVF-PQ
+    KNOWLEDGE_NPROBE = int(os.getenv("KNOWLEDGE_NPROBE", 16))  # IVF lists scanned per query
+    KNOWLEDGE_EF_SEARCH = int(os.getenv("KNOWLEDGE_EF_SEARCH", 64))  # HNSW candidate list size per query
+    KNOWLEDGE_HNSW_M = int(os.getenv("KNOWLEDGE_HNSW_M", 32))  # HNSW graph neighbours per node
+    # Compressed vector storage: none, fp16, sq8 (8-bit scalar) or pq (always IVF-PQ)
+    KNOWLEDGE_VECTOR_CODEC = os.getenv("KNOWLEDGE_VECTOR_CODEC", "none")
+    # Candidates per result re-ranked exactly (<=1 disables)
+    KNOWLEDGE_RERANK_FACTOR = int(os.getenv("KNOWLEDGE_RERANK_FACTOR", 4))
+    # Query embedding cache: in-memory LRU entries (0 disables) and on-disk entry limit
+    KNOWLEDGE_QUERY_CACHE_SIZE = int(os.getenv("KNOWLEDGE_QUERY_CACHE_SIZE", 1024))
+    KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES = int(os.getenv("KNOWLEDGE_QUERY_CACHE_MAX_ENTRIES", 100000))
+    # Content-addressed chunk embedding cache consulted before embedding document chunks
+    KNOWLEDGE_CHUNK_CACHE = os.getenv("KNOWLEDGE_CHUNK_CACHE", "true").lower() == "true"
+    KNOWLEDGE_CHUNK_CACHE_MAX_ENTRIES = int(os.getenv("KNOWLEDGE_CHUNK_CACHE_MAX_ENTRIES", 200000))
+    # Extracted PDF text keyed by file hash, shared with the protocol scripts
+    KNOWLEDGE_TEXT_CACHE = os.getenv("KNOWLEDGE_TEXT_CACHE", "true").lower() == "true"
+    KNOWLEDGE_TEXT_CACHE_MAX_ENTRIES = int(os.getenv("KNOWLEDGE_TEXT_CACHE_MAX_ENTRIES", 10000))
+    # Ingest default knowledge and DOCUMENTS_DIR in a background thread so workers serve requests at once
+    KNOWLEDGE_BACKGROUND_INGESTION = os.getenv("KNOWLEDGE_BACKGROUND_INGESTION", "true").lower() == "true"
+    # Rewrite the index without deleted chunks once they are this share of it (and at least the minimum)
+    KNOWLEDGE_COMPACT_DELETED_RATIO = float(os.getenv("KNOWLEDGE_COMPACT_DELETED_RATIO", 0.2))
+    KNOWLEDGE_COMPACT_MIN_DELETED = int(os.getenv("KNOWLEDGE_COMPACT_MIN_DELETED", 100))
+    KNOWLEDGE_BACKGROUND_COMPACTION = os.getenv("KNOWLEDGE_BACKGROUND_COMPACTION", "true").lower() == "true"
+    # Search mode: hybrid (vector + BM25 fused by reciprocal rank), vector or lexical (BM25 only, no embedding call)
+    KNOWLEDGE_SEARCH_MODE = os.getenv("KNOWLEDGE_SEARCH_MODE", "hybrid")
+    KNOWLEDGE_RRF_K = int(os.getenv("KNOWLEDGE_RRF_K", 60))  # Reciprocal rank fusion constant
+    # Queries per /search/batch request
+    KNOWLEDGE_SEARCH_BATCH_MAX_QUERIES = int(os.getenv("KNOWLEDGE_SEARCH_BATCH_MAX_QUERIES", 50))
+    # Link near-duplicate chunks (MinHash similarity at or above the threshold) instead of embedding them again
+    KNOWLEDGE_DEDUP = os.getenv("KNOWLEDGE_DEDUP", "true").lower() == "true"
+    KNOWLEDGE_DEDUP_THRESHOLD = float(os.getenv("KNOWLEDGE_DEDUP_THRESHOLD", 0.9))
+    # Token budgets for retrieved knowledge in guidance prompts and in Retell agent prompts;
+    # the Retell budget is raised to fit its retrieved chunks whole, so 0 sizes it to them
+    KNOWLEDGE_CONTEXT_TOKENS = int(os.getenv("KNOWLEDGE_CONTEXT_TOKENS", 1500))
+    KNOWLEDGE_CALL_CONTEXT_TOKENS = int(os.getenv("KNOWLEDGE_CALL_CONTEXT_TOKENS", 0))
+    # Embedding model: an OpenAI model, or hashed-ngram-<dimension> to embed in-process without network access.
+    # A change is rebuilt into a new index generation in the background and swapped in
+    KNOWLEDGE_EMBEDDING_MODEL = os.getenv("KNOWLEDGE_EMBEDDING_MODEL", "text-embedding-ada-002")
+    KNOWLEDGE_AUTO_REBUILD = os.getenv("KNOWLEDGE_AUTO_REBUILD", "false").lower() == "true"  # Otherwise POST /rebuild
+    # 0 = unthrottled
+    KNOWLEDGE_REBUILD_TOKENS_PER_MINUTE = int(os.getenv("KNOWLEDGE_REBUILD_TOKENS_PER_MINUTE", 1000000))
+    KNOWLEDGE_REBUILD_RECALL_QUERIES = int(os.getenv("KNOWLEDGE_REBUILD_RECALL_QUERIES", 100))
+    KNOWLEDGE_REBUILD_RECALL_TOLERANCE = float(os.getenv("KNOWLEDGE_REBUILD_RECALL_TOLERANCE", 0.02))
+
     # Retell AI Configuration - aligned with postgres-demo naming
     RETELLAI_API_KEY = os.getenv("RETELLAI_API_KEY")
     RETELLAI_LOCAL_AGENT_ID = os.getenv("RETELLAI_LOCAL_AGENT_ID")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Knowledge base ingestion benchmark for SteadywellOS
+Compares per-chunk embedding against batched, concurrent embedding using a
+local stub embedder that simulates provider latency (no network calls).
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+# Add the parent directory to sys.path to import src modules
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from src.core.knowledge_service import KnowledgeBaseService
+from src.core.knowledge_store import KnowledgeStore
+
+
+class StubEmbeddings:
+    """Local embedder that sleeps to simulate a network round trip per request."""
+
+    def __init__(self, dimension=1536, request_latency=0.05, per_text_latency=0.0005):
+        self.dimension = dimension
+        self.request_latency = request_latency
+        self.per_text_latency = per_text_latency
+        self.requests = 0
+
+    def _vector(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % (2**32))
+        return rng.random(self.dimension, dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        self.requests += 1
+        time.sleep(self.request_latency + self.per_text_latency)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        time.sleep(self.request_latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+
+class PerChunkEmbeddings(StubEmbeddings):
+    """Stub that forces the legacy one-request-per-chunk behaviour."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def build_corpus(num_paragraphs):
+    """Build a synthetic protocol document of roughly 1000-character chunks."""
+    paragraph = (
+        "Assess dyspnea severity on a 0-10 scale, review diuretic adherence, daily weights and "
+        "oedema. Escalate to the on-call physician for chest pain, syncope or rapid weight gain. "
+    )
+    return "\n\n".join(f"Section {i}. " + paragraph * 5 for i in range(num_paragraphs))
+
+
+def run_ingestion(embeddings, content, batch_size, concurrency):
+    """Ingest content into a throwaway knowledge base and return (chunks, seconds, requests)."""
+    with tempfile.TemporaryDirectory() as knowledge_dir:
+        service = KnowledgeBaseService()
+        service.knowledge_dir = Path(knowledge_dir)
+        service.store = KnowledgeStore(service.knowledge_dir)
+        service._initialize_empty_index()
+        service.embeddings = embeddings
+        service.embed_batch_size = batch_size
+        service.embed_concurrency = concurrency
+        service.app = SimpleNamespace(config={})
+
+        start = time.perf_counter()
+        service.add_document(content, title="Benchmark Protocol", category="protocols")
+        elapsed = time.perf_counter() - start
+        return len(service.documents), elapsed, embeddings.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base chunk ingestion")
+    parser.add_argument("--paragraphs", type=int, default=200, help="Number of synthetic paragraphs")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per provider request")
+    parser.add_argument("--batch-sizes", default="16,64", help="Comma-separated batch sizes to try")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated concurrency levels to try")
+    args = parser.parse_args()
+
+    content = build_corpus(args.paragraphs)
+
+    print("=== Knowledge Ingestion Benchmark ===")
+    print(f"Simulated request latency: {args.latency * 1000:.0f} ms")
+
+    chunks, elapsed, requests = run_ingestion(
+        PerChunkEmbeddings(request_latency=args.latency), content, batch_size=1, concurrency=1
+    )
+    baseline = chunks / elapsed
+    print(f"{'mode':<28}{'chunks':>8}{'requests':>10}{'seconds':>10}{'chunks/s':>10}{'speedup':>9}")
+    print(f"{'per-chunk (legacy)':<28}{chunks:>8}{requests:>10}{elapsed:>10.2f}{baseline:>10.1f}{1.0:>8.1f}x")
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            chunks, elapsed, requests = run_ingestion(
+                StubEmbeddings(request_latency=args.latency), content, batch_size, concurrency
+            )
+            rate = chunks / elapsed
+            label = f"batch={batch_size} workers={concurrency}"
+            print(f"{label:<28}{chunks:>8}{requests:>10}{elapsed:>10.2f}{rate:>10.1f}{rate / baseline:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Knowledge search benchmark for SteadywellOS
+Generates (or reuses) synthetic clinical corpora with deterministic local
+embeddings and measures build time, p50/p95/p99 search latency, memory per
+chunk and recall@k against exact search for each index mode and filter
+selectivity. Writes a JSON report and, given the report of a previous
+release, fails when recall (or latency) regressed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path to import src modules
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from src.core.knowledge_benchmark import (
+    DEFAULT_BENCHMARK_DIMENSION,
+    DEFAULT_BENCHMARK_K,
+    DEFAULT_BENCHMARK_QUERIES,
+    DEFAULT_BENCHMARK_SIZES,
+    DEFAULT_RECALL_TOLERANCE,
+    DEFAULT_SELECTIVITIES,
+    compare_reports,
+    run_benchmark,
+)
+from src.core.knowledge_index import DEFAULT_EF_SEARCH, DEFAULT_HNSW_M, DEFAULT_NPROBE, INDEX_MODES, VECTOR_CODECS
+from src.core.knowledge_service import SEARCH_MODES
+
+
+def _list(value, cast=str):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge search latency, memory and recall")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_BENCHMARK_SIZES),
+        help="Comma-separated corpus sizes in chunks",
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=os.getenv("KNOWLEDGE_BENCHMARK_DIR", "data/knowledge_benchmark"),
+        help="Where generated corpora are kept and reused between runs",
+    )
+    parser.add_argument("--dimension", type=int, default=DEFAULT_BENCHMARK_DIMENSION, help="Embedding dimension")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus and embedding seed")
+    parser.add_argument("--modes", default=",".join(INDEX_MODES), help="Comma-separated index modes")
+    parser.add_argument("--codecs", default="none", help=f"Comma-separated vector codecs ({', '.join(VECTOR_CODECS)})")
+    parser.add_argument(
+        "--search-modes", default="vector", help=f"Comma-separated search modes ({', '.join(SEARCH_MODES)})"
+    )
+    parser.add_argument(
+        "--selectivities",
+        default=",".join(str(s) for s in DEFAULT_SELECTIVITIES),
+        help="Comma-separated shares of the corpus a category filter selects (1 means no filter)",
+    )
+    parser.add_argument("--k", type=int, default=DEFAULT_BENCHMARK_K, help="Results per query for recall@k")
+    parser.add_argument("--queries", type=int, default=DEFAULT_BENCHMARK_QUERIES, help="Held-out queries per search")
+    parser.add_argument("--nprobe", type=int, default=int(os.getenv("KNOWLEDGE_NPROBE", DEFAULT_NPROBE)))
+    parser.add_argument("--ef-search", type=int, default=int(os.getenv("KNOWLEDGE_EF_SEARCH", DEFAULT_EF_SEARCH)))
+    parser.add_argument("--hnsw-m", type=int, default=int(os.getenv("KNOWLEDGE_HNSW_M", DEFAULT_HNSW_M)))
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to check for regressions")
+    parser.add_argument(
+        "--recall-tolerance",
+        type=float,
+        default=DEFAULT_RECALL_TOLERANCE,
+        help="Allowed drop in recall@k against the baseline",
+    )
+    parser.add_argument(
+        "--latency-tolerance",
+        type=float,
+        default=None,
+        help="Allowed relative growth of p95 latency against the baseline (not checked by default)",
+    )
+    args = parser.parse_args()
+
+    # Every benchmark query would otherwise be logged
+    logging.getLogger("palliative_care").setLevel(logging.WARNING)
+    report = run_benchmark(
+        Path(args.corpus_dir),
+        sizes=_list(args.sizes, int),
+        modes=_list(args.modes),
+        codecs=_list(args.codecs),
+        dimension=args.dimension,
+        seed=args.seed,
+        progress=lambda message: print(message, file=sys.stderr),
+        search_modes=_list(args.search_modes),
+        selectivities=_list(args.selectivities, float),
+        k=args.k,
+        num_queries=args.queries,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+        hnsw_m=args.hnsw_m,
+    )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+
+    print("=== Knowledge Search Benchmark ===", file=sys.stderr)
+    print(
+        f"{'chunks':>9} {'mode':<9}{'codec':<6}{'search':<8}{'filter':<20}{'select':>8}{'recall':>8}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'build s':>9}{'B/chunk':>9}",
+        file=sys.stderr,
+    )
+    for corpus in report["corpora"]:
+        for layout in corpus["layouts"]:
+            if "skipped" in layout:
+                print(
+                    f"{corpus['chunks']:>9} {layout['index_mode']:<9}{layout['codec']:<6}  skipped: {layout['skipped']}",
+                    file=sys.stderr,
+                )
+                continue
+            for search in layout["searches"]:
+                latency = search["latency_ms"]
+                print(
+                    f"{corpus['chunks']:>9} {layout['index_mode']:<9}{layout['codec']:<6}{search['search_mode']:<8}"
+                    f"{search['filter']:<20}{search['selectivity']:>8.3f}{search['recall_at_k']:>8.3f}"
+                    f"{latency['p50']:>9.2f}{latency['p95']:>9.2f}{latency['p99']:>9.2f}"
+                    f"{layout['build_seconds']:>9.2f}{layout['memory']['bytes_per_chunk']:>9.0f}",
+                    file=sys.stderr,
+                )
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare_reports(baseline, report, args.recall_tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(
+                f"❌ {regression['search']}: {regression['metric']} {regression['baseline']} -> {regression['current']}",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
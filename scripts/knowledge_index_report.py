@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Knowledge base index report for SteadywellOS
+Builds every index mode and vector codec over the committed knowledge base
+vectors and reports recall@k against the exact flat index (with and without
+exact re-ranking for compressed codecs), plus build time, latency and size.
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the parent directory to sys.path to import src modules
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from src.core.knowledge_index import (
+    DEFAULT_EF_SEARCH,
+    DEFAULT_HNSW_M,
+    DEFAULT_NPROBE,
+    DEFAULT_RERANK_FACTOR,
+    INDEX_MODES,
+    VECTOR_CODECS,
+    compare_index_modes,
+    extract_vectors,
+)
+from src.core.knowledge_store import KnowledgeStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare knowledge index modes against the flat index")
+    parser.add_argument("--knowledge-dir", default=os.getenv("KNOWLEDGE_BASE_DIR", "data/knowledge"))
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Stored vectors sampled as queries")
+    parser.add_argument("--modes", default=",".join(INDEX_MODES), help="Comma-separated modes to compare")
+    parser.add_argument("--nprobe", type=int, default=int(os.getenv("KNOWLEDGE_NPROBE", DEFAULT_NPROBE)))
+    parser.add_argument("--ef-search", type=int, default=int(os.getenv("KNOWLEDGE_EF_SEARCH", DEFAULT_EF_SEARCH)))
+    parser.add_argument("--codecs", default="none", help=f"Comma-separated vector codecs ({', '.join(VECTOR_CODECS)})")
+    parser.add_argument(
+        "--rerank-factor",
+        type=int,
+        default=int(os.getenv("KNOWLEDGE_RERANK_FACTOR", DEFAULT_RERANK_FACTOR)),
+        help="Candidates per result re-ranked exactly for compressed codecs",
+    )
+    parser.add_argument("--hnsw-m", type=int, default=int(os.getenv("KNOWLEDGE_HNSW_M", DEFAULT_HNSW_M)))
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    loaded = KnowledgeStore(Path(args.knowledge_dir)).load()
+    if not loaded:
+        print(f"No knowledge base found in {args.knowledge_dir}")
+        sys.exit(1)
+
+    index, _, _ = loaded
+    vectors = extract_vectors(index)
+    if len(vectors) == 0:
+        print("Knowledge base is empty")
+        sys.exit(1)
+
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    report = compare_index_modes(
+        vectors,
+        queries,
+        k=min(args.k, len(vectors)),
+        modes=[mode.strip() for mode in args.modes.split(",")],
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+        hnsw_m=args.hnsw_m,
+        codecs=[codec.strip() for codec in args.codecs.split(",")],
+        rerank_factor=args.rerank_factor,
+    )
+
+    if args.json:
+        print(
+            json.dumps(
+                {"chunks": len(vectors), "current_mode": index.mode, "current_codec": index.codec, "modes": report},
+                indent=2,
+            )
+        )
+        return
+
+    print("=== Knowledge Index Report ===")
+    print(f"Chunks: {len(vectors)}  current mode: {index.mode}/{index.codec}  queries: {len(queries)}")
+    print(
+        f"{'mode':<10}{'codec':<7}{'recall@k':>10}{'reranked':>10}{'build s':>10}"
+        f"{'ms/query':>10}{'rerank ms':>10}{'MB':>10}{'B/chunk':>10}"
+    )
+    for row in report:
+        if "skipped" in row:
+            print(f"{row['mode']:<10}{row['codec']:<7}  skipped: {row['skipped']}")
+            continue
+        reranked = f"{row['recall_at_k_reranked']:>10.3f}" if "recall_at_k_reranked" in row else f"{'-':>10}"
+        rerank_ms = f"{row['rerank_ms_per_query']:>10.3f}" if "rerank_ms_per_query" in row else f"{'-':>10}"
+        print(
+            f"{row['mode']:<10}{row['codec']:<7}{row['recall_at_k']:>10.3f}{reranked}{row['build_seconds']:>10.2f}"
+            f"{row['search_ms_per_query']:>10.3f}{rerank_ms}{row['bytes'] / 1e6:>10.1f}{row['bytes_per_chunk']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
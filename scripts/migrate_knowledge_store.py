@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Knowledge store migration for SteadywellOS
+Rewrites a knowledge store written by an older release (pickled metadata in
+faiss_index.bin + metadata.pkl, or a text file and pickle per snapshot) in the
+current snapshot format. Run it once, before starting workers on the store.
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path to import src modules
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(parent_dir))
+
+from src.core.knowledge_migration import migrate_knowledge_store, pending_migration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate a knowledge store written by an older release")
+    parser.add_argument("--knowledge-dir", default=os.getenv("KNOWLEDGE_BASE_DIR", "data/knowledge"))
+    parser.add_argument("--check", action="store_true", help="Only report whether the store needs migrating")
+    args = parser.parse_args()
+
+    directory = Path(args.knowledge_dir)
+    layout = pending_migration(directory)
+    if layout is None:
+        print(f"Knowledge store in {directory} is current; nothing to migrate")
+        return
+    if args.check:
+        print(f"Knowledge store in {directory} needs migrating ({layout})")
+        sys.exit(1)
+
+    version = migrate_knowledge_store(directory)
+    if version is None:
+        print(f"Knowledge store in {directory} was migrated by another process")
+        return
+    print(f"✅ Migrated knowledge store in {directory} ({layout}) to version {version}")
+
+
+if __name__ == "__main__":
+    main()
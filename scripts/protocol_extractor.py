@@ -13,20 +13,16 @@ from pathlib import Path
 from datetime import datetime
 import re
 
-try:
-    import fitz  # PyMuPDF
-except ImportError:
-    print("PyMuPDF is not installed. Install it with: pip install pymupdf")
-    sys.exit(1)
+# Add the parent directory to sys.path to import src modules
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+from src.core.knowledge_cache import open_text_cache
+from src.core.knowledge_ingestion import DEFAULT_EXTRACT_TIMEOUT, iter_cached_extractions
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file"""
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+
+def pages_to_text(pages):
+    """Join extracted ``(page_number, text)`` pages into one text"""
+    return "\n".join(text for _, text in pages)
 
 
 def parse_protocol_from_text(text, protocol_type):
@@ -140,7 +136,7 @@ def save_protocol_json(protocol_data, output_path):
 
 def main():
     parser = argparse.ArgumentParser(description="Extract protocol data from PDF documentation")
-    parser.add_argument("pdf_path", help="Path to the PDF file")
+    parser.add_argument("pdf_path", nargs="+", help="Path to the PDF file(s), parsed as one protocol")
     parser.add_argument(
         "--type",
         required=True,
@@ -148,6 +144,12 @@ def main():
         help="Protocol type to extract",
     )
     parser.add_argument("--output", help="Output JSON file path")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_EXTRACT_TIMEOUT,
+        help="Seconds allowed for extracting each PDF",
+    )
 
     args = parser.parse_args()
 
@@ -157,9 +159,15 @@ def main():
         os.makedirs(output_dir, exist_ok=True)
         args.output = os.path.join(output_dir, f"{args.type}_protocol.json")
 
-    # Extract text from PDF
-    print(f"Extracting text from {args.pdf_path}...")
-    text = extract_text_from_pdf(args.pdf_path)
+    # Extract text from the PDFs in parallel (or reuse the shared text cache), keeping the argument order
+    texts = {}
+    for pdf_path, pages, _, error in iter_cached_extractions(args.pdf_path, open_text_cache(), timeout=args.timeout):
+        if error is not None:
+            print(f"Error extracting text from {pdf_path}: {error!r}")
+            sys.exit(1)
+        print(f"Extracted text from {pdf_path}")
+        texts[pdf_path] = pages_to_text(pages)
+    text = "\n".join(texts[pdf_path] for pdf_path in args.pdf_path)
 
     # Parse protocol data
     print(f"Parsing {args.type} protocol data...")
@@ -53,12 +53,11 @@ def extract_protocol_content_from_knowledge():
     
     extracted_content = {}
     
-    for protocol_type, search_config in protocol_searches.items():
-        logger.info(f"Searching knowledge base for {protocol_type} protocol content...")
-        
-        # Search the knowledge base
-        results = knowledge_service.search(search_config['query'], k=10)
-        
+    # Search the knowledge base for all protocol types in one batch
+    logger.info(f"Searching knowledge base for {len(protocol_searches)} protocol types...")
+    all_results = knowledge_service.search_many([search_config['query'] for search_config in protocol_searches.values()], k=10)
+    
+    for (protocol_type, search_config), results in zip(protocol_searches.items(), all_results):
         if not results:
             logger.warning(f"No knowledge base results found for {protocol_type}")
             continue
@@ -63,6 +63,7 @@ def create_app(config_object="config.config.DevelopmentConfig"):
     from src.api.webhooks import webhook_bp
     from src.api.backup import backup_bp
     from src.api.knowledge import knowledge_bp
+    from src.api.health import health_bp
 
     # Register API blueprints
     app.register_blueprint(auth_bp, url_prefix="/api/v1/auth")
@@ -75,6 +76,7 @@ def create_app(config_object="config.config.DevelopmentConfig"):
     app.register_blueprint(backup_bp, url_prefix="/api/v1/backup")
     app.register_blueprint(knowledge_bp, url_prefix="/api/v1/knowledge")
     app.register_blueprint(webhook_bp)  # Register webhook blueprint
+    app.register_blueprint(health_bp)  # /healthz and /readyz probes
 
     # Web routes
     from src.api.routes import web_bp
@@ -118,7 +120,7 @@ def create_app(config_object="config.config.DevelopmentConfig"):
     try:
         from src.core.knowledge_service import init_knowledge_service
         init_knowledge_service(app)
-        app.logger.info("✅ Knowledge base service initialized")
+        app.logger.info("✅ Knowledge base service initialized (document ingestion continues in the background)")
     except Exception as e:
         app.logger.error(f"❌ Error initializing knowledge base: {e}")
         app.logger.warning("⚠️ Application starting without knowledge base")
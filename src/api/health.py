@@ -0,0 +1,49 @@
+"""Liveness and readiness endpoints for load balancers and orchestrators."""
+
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+from src import db
+from src.core.knowledge_service import get_knowledge_service
+from src.utils.logger import get_logger
+
+# Create blueprint
+health_bp = Blueprint("health", __name__)
+logger = get_logger()
+
+
+@health_bp.route("/healthz", methods=["GET"])
+def healthz():
+    """Report that the process is up and serving requests."""
+    return jsonify({"status": "ok"}), 200
+
+
+@health_bp.route("/readyz", methods=["GET"])
+def readyz():
+    """Report whether the database is reachable and a knowledge snapshot is loaded.
+
+    Knowledge ingestion runs in the background, so this returns 503 until the
+    first snapshot is searchable; the ingestion progress is included either way.
+    """
+    checks = {}
+
+    try:
+        db.session.execute(text("SELECT 1"))
+        checks["database"] = {"ready": True}
+    except Exception as e:
+        logger.warning(f"Readiness check: database unavailable: {e}")
+        checks["database"] = {"ready": False, "error": str(e)}
+
+    knowledge_service = get_knowledge_service()
+    try:
+        checks["knowledge_base"] = {
+            "ready": knowledge_service.is_ready(),
+            "store_version": knowledge_service.store.version if knowledge_service.store else 0,
+            "ingestion": knowledge_service.get_ingestion_status(),
+        }
+    except Exception as e:
+        logger.warning(f"Readiness check: knowledge base unavailable: {e}")
+        checks["knowledge_base"] = {"ready": False, "error": str(e)}
+
+    ready = all(check["ready"] for check in checks.values())
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), 200 if ready else 503
@@ -5,7 +5,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from typing import Dict, Any, List
 import json
 
-from src.core.knowledge_service import get_knowledge_service
+from src.core.knowledge_service import SEARCH_MODES, get_knowledge_service
 from src.models.user import User
 from src.utils.logger import get_logger
 
@@ -27,50 +27,146 @@ def search_knowledge():
         query = data["query"]
         k = data.get("k", 5)  # Number of results to return
         category_filter = data.get("category")
-        
+        tags_filter = data.get("tags")
+        source_filter = data.get("source")
+        mode = data.get("mode")  # vector, hybrid or lexical; defaults to KNOWLEDGE_SEARCH_MODE
+
         # Validate parameters
         if not isinstance(query, str) or len(query.strip()) == 0:
             return jsonify({"error": "Query must be a non-empty string"}), 400
-        
+
+        if mode is not None and mode not in SEARCH_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+
         if not isinstance(k, int) or k < 1 or k > 20:
             return jsonify({"error": "k must be an integer between 1 and 20"}), 400
-        
+
+        if tags_filter is not None and not (
+            isinstance(tags_filter, list) and all(isinstance(tag, str) for tag in tags_filter)
+        ):
+            return jsonify({"error": "tags must be a list of strings"}), 400
+
         # Get knowledge service
         knowledge_service = get_knowledge_service()
         if not knowledge_service:
             return jsonify({"error": "Knowledge base service not available"}), 503
-        
+
+        # While the first snapshot is still ingesting, serve whatever is loaded and say so
+        ready = knowledge_service.is_ready()
+
         # Perform search
-        results = knowledge_service.search(query, k=k, category_filter=category_filter)
-        
+        results = knowledge_service.search(
+            query, k=k, category_filter=category_filter, tags=tags_filter, source=source_filter, mode=mode
+        )
+
         # Format results for API response
-        formatted_results = []
-        for result in results:
-            formatted_result = {
-                "content": result["content"],
-                "score": result["score"],
-                "relevance": result["relevance"],
-                "metadata": {
-                    "title": result["metadata"].get("title", ""),
-                    "category": result["metadata"].get("category", ""),
-                    "tags": result["metadata"].get("tags", []),
-                    "source": result["metadata"].get("source", ""),
-                    "added_at": result["metadata"].get("added_at", "")
+        formatted_results = [_format_search_result(result) for result in results]
+
+        return jsonify(
+            {"query": query, "results": formatted_results, "total_results": len(formatted_results), "ready": ready}
+        )
+
+    except Exception as e:
+        logger.error(f"Error in knowledge search: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@knowledge_bp.route("/search/batch", methods=["POST"])
+@jwt_required()
+def search_knowledge_batch():
+    """Search the knowledge base for several queries in one request."""
+    try:
+        data = request.get_json()
+
+        if not data or "queries" not in data:
+            return jsonify({"error": "Queries are required"}), 400
+
+        queries = data["queries"]
+        k = data.get("k", 5)  # Number of results to return per query
+        mode = data.get("mode")
+        max_queries = current_app.config.get("KNOWLEDGE_SEARCH_BATCH_MAX_QUERIES", 50)
+
+        # Validate parameters; each query is a string or an object with its own filters
+        if not isinstance(queries, list) or not queries or len(queries) > max_queries:
+            return jsonify({"error": f"queries must be a list of 1 to {max_queries} queries"}), 400
+
+        if not isinstance(k, int) or k < 1 or k > 20:
+            return jsonify({"error": "k must be an integer between 1 and 20"}), 400
+
+        if mode is not None and mode not in SEARCH_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+
+        texts = []
+        filters = []
+        for item in queries:
+            if isinstance(item, str):
+                item = {"query": item}
+            query = item.get("query") if isinstance(item, dict) else None
+            if not isinstance(query, str) or len(query.strip()) == 0:
+                return jsonify({"error": "Each query must be a non-empty string"}), 400
+            tags_filter = item.get("tags", data.get("tags"))
+            if tags_filter is not None and not (
+                isinstance(tags_filter, list) and all(isinstance(tag, str) for tag in tags_filter)
+            ):
+                return jsonify({"error": "tags must be a list of strings"}), 400
+            texts.append(query)
+            filters.append(
+                {
+                    "category": item.get("category", data.get("category")),
+                    "tags": tags_filter,
+                    "source": item.get("source", data.get("source")),
                 }
+            )
+
+        # Get knowledge service
+        knowledge_service = get_knowledge_service()
+        if not knowledge_service:
+            return jsonify({"error": "Knowledge base service not available"}), 503
+
+        # While the first snapshot is still ingesting, serve whatever is loaded and say so
+        ready = knowledge_service.is_ready()
+
+        # Perform all searches with one embedding request
+        batch_results = knowledge_service.search_many(texts, k=k, filters=filters, mode=mode)
+
+        return jsonify(
+            {
+                "results": [
+                    {
+                        "query": query,
+                        "results": [_format_search_result(result) for result in results],
+                        "total_results": len(results),
+                    }
+                    for query, results in zip(texts, batch_results)
+                ],
+                "total_queries": len(texts),
+                "ready": ready,
             }
-            formatted_results.append(formatted_result)
-        
-        return jsonify({
-            "query": query,
-            "results": formatted_results,
-            "total_results": len(formatted_results)
-        })
-        
+        )
+
     except Exception as e:
-        logger.error(f"Error in knowledge search: {str(e)}")
+        logger.error(f"Error in batched knowledge search: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+def _format_search_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape one search result for API responses."""
+    return {
+        "content": result["content"],
+        "score": result["score"],
+        "score_type": result["score_type"],
+        "relevance": result["relevance"],
+        "metadata": {
+            "document_id": result["metadata"].get("document_id"),
+            "title": result["metadata"].get("title", ""),
+            "category": result["metadata"].get("category", ""),
+            "tags": result["metadata"].get("tags", []),
+            "source": result["metadata"].get("source", ""),
+            "added_at": result["metadata"].get("added_at", ""),
+        },
+    }
+
+
 @knowledge_bp.route("/guidance", methods=["POST"])
 @jwt_required()
 def get_enhanced_guidance():
@@ -175,6 +271,116 @@ def add_document():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@knowledge_bp.route("/documents/<int:document_id>", methods=["GET"])
+@jwt_required()
+def get_document(document_id):
+    """Get a knowledge base document and its chunks."""
+    try:
+        # Get knowledge service
+        knowledge_service = get_knowledge_service()
+        if not knowledge_service:
+            return jsonify({"error": "Knowledge base service not available"}), 503
+
+        document = knowledge_service.get_document(document_id)
+        if document is None:
+            return jsonify({"error": "Document not found"}), 404
+
+        return jsonify(document)
+
+    except Exception as e:
+        logger.error(f"Error getting document {document_id}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@knowledge_bp.route("/documents/<int:document_id>", methods=["PUT"])
+@jwt_required()
+def replace_document(document_id):
+    """Replace a knowledge base document with new content (admin only)."""
+    try:
+        # Check if user has admin privileges
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+
+        if not user or not user.is_admin:
+            return jsonify({"error": "Admin privileges required"}), 403
+
+        data = request.get_json()
+
+        if not data or "content" not in data:
+            return jsonify({"error": "content is required"}), 400
+
+        content = data["content"]
+        tags = data.get("tags")
+
+        # Validate parameters
+        if not isinstance(content, str) or len(content.strip()) == 0:
+            return jsonify({"error": "Content must be a non-empty string"}), 400
+
+        if tags is not None and not isinstance(tags, list):
+            return jsonify({"error": "Tags must be a list"}), 400
+
+        # Get knowledge service
+        knowledge_service = get_knowledge_service()
+        if not knowledge_service:
+            return jsonify({"error": "Knowledge base service not available"}), 503
+
+        if knowledge_service.get_document(document_id) is None:
+            return jsonify({"error": "Document not found"}), 404
+
+        new_document_id = knowledge_service.replace_document(
+            document_id,
+            content=content,
+            title=data.get("title"),
+            category=data.get("category"),
+            tags=tags,
+            source=data.get("source"),
+        )
+
+        if new_document_id is None:
+            return jsonify({"error": "Failed to replace document"}), 500
+
+        logger.info(f"Document {document_id} replaced by document {new_document_id} by user {user.username}")
+        return jsonify(
+            {
+                "message": "Document replaced successfully",
+                "document_id": new_document_id,
+                "replaced_document_id": document_id,
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"Error replacing document {document_id}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@knowledge_bp.route("/documents/<int:document_id>", methods=["DELETE"])
+@jwt_required()
+def delete_document(document_id):
+    """Delete a knowledge base document (admin only)."""
+    try:
+        # Check if user has admin privileges
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+
+        if not user or not user.is_admin:
+            return jsonify({"error": "Admin privileges required"}), 403
+
+        # Get knowledge service
+        knowledge_service = get_knowledge_service()
+        if not knowledge_service:
+            return jsonify({"error": "Knowledge base service not available"}), 503
+
+        if not knowledge_service.delete_document(document_id):
+            return jsonify({"error": "Document not found"}), 404
+
+        logger.info(f"Document {document_id} deleted by user {user.username}")
+        return jsonify({"message": "Document deleted successfully", "document_id": document_id})
+
+    except Exception as e:
+        logger.error(f"Error deleting document {document_id}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @knowledge_bp.route("/stats", methods=["GET"])
 @jwt_required()
 def get_knowledge_stats():
@@ -195,6 +401,41 @@ def get_knowledge_stats():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@knowledge_bp.route("/rebuild", methods=["POST"])
+@jwt_required()
+def rebuild_index_generation():
+    """Start a background rebuild of the index with the configured embedding model and chunker (admin only)."""
+    try:
+        # Check if user has admin privileges
+        current_user_id = get_jwt_identity()
+        user = User.query.get(current_user_id)
+
+        if not user or not user.is_admin:
+            return jsonify({"error": "Admin privileges required"}), 403
+
+        # Get knowledge service
+        knowledge_service = get_knowledge_service()
+        if not knowledge_service:
+            return jsonify({"error": "Knowledge base service not available"}), 503
+
+        knowledge_service.start_rebuild()
+        logger.info(f"Index generation rebuild requested by user {user.username}")
+        return (
+            jsonify(
+                {
+                    "message": "Index rebuild started; search serves the live generation until it is swapped in",
+                    "generation": knowledge_service.live_generation(),
+                    "rebuild": knowledge_service.rebuild_status.snapshot(),
+                }
+            ),
+            202,
+        )
+
+    except Exception as e:
+        logger.error(f"Error starting index rebuild: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @knowledge_bp.route("/categories", methods=["GET"])
 @jwt_required()
 def get_categories():
@@ -204,17 +445,9 @@ def get_categories():
         knowledge_service = get_knowledge_service()
         if not knowledge_service:
             return jsonify({"error": "Knowledge base service not available"}), 503
-        
-        # Extract categories from metadata
-        categories = set()
-        for metadata in knowledge_service.metadata:
-            category = metadata.get("category", "uncategorized")
-            categories.add(category)
-        
-        return jsonify({
-            "categories": sorted(list(categories))
-        })
-        
+
+        return jsonify({"categories": knowledge_service.get_categories()})
+
     except Exception as e:
         logger.error(f"Error getting categories: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
@@ -378,6 +611,7 @@ def test_knowledge_retrieval():
                     "title": r["metadata"].get("title", ""),
                     "relevance": r["relevance"],
                     "score": r["score"],
+                    "score_type": r["score_type"],
                     "content_preview": r["content"][:200] + "..." if len(r["content"]) > 200 else r["content"]
                 }
                 for r in search_results
@@ -0,0 +1,664 @@
+"""Synthetic clinical corpus, deterministic local embeddings and the knowledge search benchmark.
+
+The benchmark measures what ``KnowledgeBaseService.search`` costs end to
+end (query embedding, filters, FAISS, metadata) for every index layout and
+filter selectivity, and what it buys: recall@k against an exact search of
+the same filter. Reports are plain JSON so runs of two releases can be
+diffed or checked with ``compare_reports``.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+from src.utils.logger import get_logger
+from src.core.knowledge_filters import MetadataFilterIndex
+from src.core.knowledge_index import (
+    DEFAULT_EF_SEARCH,
+    DEFAULT_HNSW_M,
+    DEFAULT_NPROBE,
+    MIN_TRAINING_VECTORS,
+    build_id_index,
+    index_layouts,
+    needs_training,
+    recall_at_k,
+)
+from src.core.knowledge_ingestion import available_cpus
+from src.core.knowledge_lexical import BM25Index
+from src.core.knowledge_metadata import ChunkMetadata
+from src.core.knowledge_service import KnowledgeBaseService
+from src.core.knowledge_store import KnowledgeStore
+
+logger = get_logger()
+
+DEFAULT_BENCHMARK_SIZES = (10_000, 100_000, 1_000_000)
+# Vectors are smaller than ada-002's 1536 dimensions so a 1M chunk corpus fits in memory
+DEFAULT_BENCHMARK_DIMENSION = 256
+DEFAULT_BENCHMARK_QUERIES = 200
+DEFAULT_BENCHMARK_K = 10
+# Shares of the corpus in each category; filtering on a category searches that share of it
+CATEGORY_SHARES = (
+    ("symptom_management", 0.5),
+    ("medications", 0.25),
+    ("psychosocial", 0.14),
+    ("end_of_life", 0.1),
+    ("rare_conditions", 0.01),
+)
+DEFAULT_SELECTIVITIES = (1.0, 0.1, 0.01)
+# How far recall@k may fall below a baseline report before it counts as a regression
+DEFAULT_RECALL_TOLERANCE = 0.01
+REPORT_FORMAT = 1
+
+# Corpus rows are generated in blocks seeded by their position, so any block can be rebuilt alone
+_BLOCK_ROWS = 4096
+_CHUNK_WORDS = 48
+_QUERY_WORDS = 12
+_TOPICS = 400
+_TOPIC_WORDS = 24
+# Share of a chunk's words drawn from its topic rather than the whole vocabulary
+_TOPIC_SHARE = 0.6
+_VOCABULARY_SIZE = 6000
+_WARMUP_QUERIES = 5
+_CORPUS_FILE = "corpus.json"
+_VECTORS_FILE = "vectors.npy"
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+CLINICAL_TERMS = (
+    "dyspnea",
+    "nausea",
+    "vomiting",
+    "constipation",
+    "delirium",
+    "agitation",
+    "fatigue",
+    "anorexia",
+    "cachexia",
+    "pain",
+    "breakthrough",
+    "opioid",
+    "morphine",
+    "oxycodone",
+    "hydromorphone",
+    "fentanyl",
+    "methadone",
+    "naloxone",
+    "laxative",
+    "senna",
+    "docusate",
+    "haloperidol",
+    "lorazepam",
+    "midazolam",
+    "ondansetron",
+    "metoclopramide",
+    "dexamethasone",
+    "furosemide",
+    "diuretic",
+    "oxygen",
+    "saturation",
+    "nebulizer",
+    "secretions",
+    "glycopyrrolate",
+    "scopolamine",
+    "edema",
+    "ascites",
+    "paracentesis",
+    "pressure",
+    "ulcer",
+    "wound",
+    "turning",
+    "mouth",
+    "care",
+    "hydration",
+    "dysphagia",
+    "aspiration",
+    "insomnia",
+    "anxiety",
+    "depression",
+    "grief",
+    "bereavement",
+    "caregiver",
+    "spiritual",
+    "chaplain",
+    "hospice",
+    "palliative",
+    "goals",
+    "advance",
+    "directive",
+    "proxy",
+    "resuscitation",
+    "comfort",
+    "escalation",
+    "physician",
+    "nurse",
+    "triage",
+    "assessment",
+    "reassess",
+    "titrate",
+    "dose",
+    "daily",
+    "weights",
+    "heart",
+    "failure",
+    "copd",
+    "exacerbation",
+    "cancer",
+    "metastatic",
+    "renal",
+    "hepatic",
+    "dementia",
+    "seizure",
+    "bleeding",
+    "hemorrhage",
+    "fever",
+    "infection",
+    "sepsis",
+    "fall",
+    "syncope",
+    "chest",
+    "cough",
+    "hiccups",
+    "pruritus",
+    "myoclonus",
+    "terminal",
+    "restlessness",
+    "family",
+    "meeting",
+)
+_SYLLABLES = (
+    "ka",
+    "lo",
+    "mi",
+    "ne",
+    "zor",
+    "ex",
+    "an",
+    "ol",
+    "ide",
+    "pra",
+    "vel",
+    "tin",
+    "dro",
+    "cor",
+    "su",
+    "fen",
+    "ta",
+    "rel",
+    "mab",
+    "zep",
+    "ri",
+    "lum",
+    "on",
+    "cil",
+    "dex",
+    "tra",
+    "mor",
+    "val",
+    "quin",
+    "ase",
+)
+
+
+def clinical_vocabulary(size: int = _VOCABULARY_SIZE) -> List[str]:
+    """Clinical terms followed by made-up drug and procedure names, the same in every process."""
+    vocabulary = list(CLINICAL_TERMS)
+    seen = set(vocabulary)
+    rng = np.random.default_rng(0)
+    while len(vocabulary) < size:
+        word = "".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+    return vocabulary
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class HashedTokenEmbeddings:
+    """Deterministic local embedder: the normalized sum of a seeded random vector per word.
+
+    Each word's vector is drawn from a generator seeded with its CRC32, so
+    any process embeds the same text to the same vector without a
+    vocabulary or a network call. Texts sharing words end up close.
+    """
+
+    def __init__(self, dimension: int = DEFAULT_BENCHMARK_DIMENSION, seed: int = 0):
+        self.dimension = dimension
+        self.seed = seed
+        self.model = f"hashed-token-{dimension}-{seed}"
+        self._vectors: Dict[str, np.ndarray] = {}
+
+    def token_vector(self, token: str) -> np.ndarray:
+        vector = self._vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng([self.seed, zlib.crc32(token.encode("utf-8"))])
+            vector = self._vectors[token] = rng.standard_normal(self.dimension, dtype=np.float32)
+        return vector
+
+    def embed_matrix(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _WORD.findall(text.lower()):
+                matrix[row] += self.token_vector(token)
+        return _normalize(matrix)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+
+class SyntheticCorpus:
+    """Deterministic synthetic clinical chunks with categories, tags and their embeddings.
+
+    Every chunk belongs to one of ``_TOPICS`` topics and draws most of its
+    words from that topic's vocabulary; categories are assigned
+    independently with the shares in ``CATEGORY_SHARES``, so a category
+    filter selects a random subset of every topic. Rows are generated in
+    blocks seeded by ``seed`` and the block number, so the corpus does not
+    depend on how it is read.
+    """
+
+    def __init__(self, num_chunks: int, embeddings: HashedTokenEmbeddings, seed: int = 0):
+        self.num_chunks = num_chunks
+        self.embeddings = embeddings
+        self.seed = seed
+        self.vocabulary = np.array(clinical_vocabulary())
+        self.topics = np.random.default_rng([seed, 1]).integers(0, len(self.vocabulary), size=(_TOPICS, _TOPIC_WORDS))
+        self.categories = [category for category, _ in CATEGORY_SHARES]
+        self._category_bounds = np.cumsum([share for _, share in CATEGORY_SHARES])
+        self._token_matrix: Optional[np.ndarray] = None
+
+    @property
+    def token_matrix(self) -> np.ndarray:
+        """The embedder's vector of every vocabulary word, in vocabulary order."""
+        if self._token_matrix is None:
+            self._token_matrix = np.vstack([self.embeddings.token_vector(word) for word in self.vocabulary.tolist()])
+        return self._token_matrix
+
+    def _words(self, rng: np.random.Generator, topics: np.ndarray, length: int, topic_share: float) -> np.ndarray:
+        from_topic = self.topics[topics[:, None], rng.integers(0, _TOPIC_WORDS, size=(len(topics), length))]
+        anywhere = rng.integers(0, len(self.vocabulary), size=(len(topics), length))
+        return np.where(rng.random((len(topics), length)) < topic_share, from_topic, anywhere)
+
+    def block(self, number: int) -> Dict[str, Any]:
+        """Rows of one block: ``texts``, ``vectors``, ``topics`` and ``categories`` (indexes into ``categories``)."""
+        start = number * _BLOCK_ROWS
+        rows = min(_BLOCK_ROWS, self.num_chunks - start)
+        rng = np.random.default_rng([self.seed, 2, number])
+        topics = rng.integers(0, _TOPICS, size=rows)
+        categories = np.minimum(
+            np.searchsorted(self._category_bounds, rng.random(rows) * self._category_bounds[-1], side="right"),
+            len(self.categories) - 1,
+        )
+        words = self._words(rng, topics, _CHUNK_WORDS, _TOPIC_SHARE)
+        # Summed word by word in text order, exactly as the embedder sums a text
+        vectors = np.zeros((rows, self.embeddings.dimension), dtype=np.float32)
+        for position in range(_CHUNK_WORDS):
+            vectors += self.token_matrix[words[:, position]]
+        texts = [" ".join(row) + "." for row in self.vocabulary[words].tolist()]
+        return {"texts": texts, "vectors": _normalize(vectors), "topics": topics, "categories": categories}
+
+    def blocks(self) -> Iterator[Dict[str, Any]]:
+        for number in range(-(-self.num_chunks // _BLOCK_ROWS)):
+            yield self.block(number)
+
+    def metadata(self, chunk_id: int, text: str, topic: int, category: int) -> Dict[str, Any]:
+        """Chunk metadata as ingestion records it; every chunk is a one-chunk document."""
+        return {
+            "id": chunk_id,
+            "document_id": chunk_id,
+            "title": f"Synthetic Protocol {topic}",
+            "category": self.categories[category],
+            "tags": ["synthetic", f"topic-{topic % 20}"],
+            "source": "Synthetic clinical corpus",
+            "chunk_index": 0,
+            "total_chunks": 1,
+            "added_at": "2024-01-01T00:00:00",
+            "content_hash": hashlib.md5(text.encode()).hexdigest(),
+            "token_count": _CHUNK_WORDS,
+        }
+
+    def queries(self, count: int) -> List[str]:
+        """Held-out queries: runs of words from random topics, never indexed themselves."""
+        rng = np.random.default_rng([self.seed, 3])
+        words = self._words(rng, rng.integers(0, _TOPICS, size=count), _QUERY_WORDS, 0.8)
+        return [" ".join(row) for row in self.vocabulary[words].tolist()]
+
+
+def corpus_description(num_chunks: int, dimension: int, seed: int) -> Dict[str, Any]:
+    return {"format": REPORT_FORMAT, "chunks": num_chunks, "dimension": dimension, "seed": seed}
+
+
+def prepare_corpus(
+    directory: Path, num_chunks: int, dimension: int = DEFAULT_BENCHMARK_DIMENSION, seed: int = 0
+) -> Tuple[Path, Dict[str, Any]]:
+    """Generate a synthetic corpus as a knowledge store in ``directory``, or reuse the one there.
+
+    The store holds a flat snapshot of the corpus with its BM25 postings;
+    the exact vectors are kept beside it for reference searches. Returns
+    the directory and a description including how long generation took.
+    """
+    directory = Path(directory)
+    description = corpus_description(num_chunks, dimension, seed)
+    descriptor = directory / _CORPUS_FILE
+    if descriptor.exists() and (directory / _VECTORS_FILE).exists():
+        cached = json.loads(descriptor.read_text())
+        if all(cached.get(key) == value for key, value in description.items()):
+            return directory, dict(cached, cached=True)
+
+    start = time.perf_counter()
+    embeddings = HashedTokenEmbeddings(dimension, seed)
+    corpus = SyntheticCorpus(num_chunks, embeddings, seed)
+    texts: List[str] = []
+    vectors = np.empty((num_chunks, dimension), dtype=np.float32)
+    metadata = ChunkMetadata()
+    for block in corpus.blocks():
+        first = len(texts)
+        vectors[first : first + len(block["texts"])] = block["vectors"]
+        for offset, (text, topic, category) in enumerate(
+            zip(block["texts"], block["topics"].tolist(), block["categories"].tolist())
+        ):
+            metadata.append(corpus.metadata(first + offset, text, topic, category))
+        texts.extend(block["texts"])
+    logger.info(f"Generated {num_chunks} synthetic chunks in {time.perf_counter() - start:.1f}s")
+
+    directory.mkdir(parents=True, exist_ok=True)
+    np.save(directory / _VECTORS_FILE, vectors, allow_pickle=False)
+    KnowledgeStore(directory).write_snapshot(
+        build_id_index("flat", vectors, np.arange(num_chunks)),
+        texts,
+        metadata,
+        lexical=BM25Index.build(texts),
+        generation={"embedding_model": embeddings.model, "chunk_params": f"synthetic:{_CHUNK_WORDS}"},
+    )
+    description["generate_seconds"] = round(time.perf_counter() - start, 2)
+    descriptor.write_text(json.dumps(description, indent=2))
+    return directory, dict(description, cached=False)
+
+
+def _resident_bytes() -> Optional[int]:
+    """Resident set size of this process, where ``/proc`` provides it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 95, 99]).tolist()
+    return {
+        "p50": round(p50, 3),
+        "p95": round(p95, 3),
+        "p99": round(p99, 3),
+        "mean": round(1000 * float(np.mean(latencies)), 3),
+    }
+
+
+def _benchmark_service(
+    directory: Path, embeddings: HashedTokenEmbeddings, nprobe: int, ef_search: int, rerank_factor: Optional[int]
+) -> KnowledgeBaseService:
+    """A service over the corpus store that only searches: no ingestion, caches or near-duplicate index."""
+    service = KnowledgeBaseService()
+    service.knowledge_dir = directory
+    service.store = KnowledgeStore(directory)
+    service.embeddings = embeddings
+    service.embeddings_factory = lambda model: embeddings
+    service.dedup = None
+    service.nprobe = nprobe
+    service.ef_search = ef_search
+    if rerank_factor is not None:
+        service.rerank_factor = rerank_factor
+    service.refresh_interval = float("inf")
+    return service
+
+
+def benchmark_corpus(
+    directory: Path,
+    layouts: Sequence[Tuple[str, str]],
+    search_modes: Sequence[str] = ("vector",),
+    selectivities: Sequence[float] = DEFAULT_SELECTIVITIES,
+    k: int = DEFAULT_BENCHMARK_K,
+    num_queries: int = DEFAULT_BENCHMARK_QUERIES,
+    nprobe: int = DEFAULT_NPROBE,
+    ef_search: int = DEFAULT_EF_SEARCH,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    rerank_factor: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Benchmark ``search`` on a corpus prepared by ``prepare_corpus`` for each ``(mode, codec)`` layout.
+
+    Each layout is built from the exact vectors, committed as a snapshot of
+    the corpus store and hot-loaded by the service the way a worker follows
+    another worker's snapshot. Every query is then searched once per search
+    mode and filter; recall@k is measured against an exact search of the
+    same filter, so it isolates what the index layout loses.
+    """
+    directory = Path(directory)
+    description = json.loads((directory / _CORPUS_FILE).read_text())
+    vectors = np.load(directory / _VECTORS_FILE, mmap_mode="r")
+    ids = np.arange(len(vectors), dtype=np.int64)
+    embeddings = HashedTokenEmbeddings(description["dimension"], description["seed"])
+    corpus = SyntheticCorpus(len(vectors), embeddings, description["seed"])
+    queries = corpus.queries(num_queries)
+    query_vectors = embeddings.embed_matrix(queries)
+
+    writer = KnowledgeStore(directory)
+    _, documents, metadata = writer.load()
+    lexical = writer.load_lexical()
+    filters = MetadataFilterIndex()
+    filters.sync(metadata)
+    shares = dict(CATEGORY_SHARES)
+    filter_values: List[Optional[str]] = []
+    for selectivity in selectivities:
+        if selectivity >= 1.0:
+            filter_values.append(None)
+            continue
+        category = min(shares, key=lambda name: abs(shares[name] - selectivity))
+        if category not in filter_values:
+            filter_values.append(category)
+
+    # Exact filtered neighbours of every query, the reference for recall
+    exact = build_id_index("flat", vectors, ids)
+    references: Dict[Optional[str], Tuple[np.ndarray, float]] = {}
+    for category in filter_values:
+        selection = filters.select(category=category)
+        params = faiss.SearchParameters(sel=selection.selector) if selection is not None else None
+        _, labels = exact.search(query_vectors, k, params=params)
+        selected = len(vectors) if selection is None else selection.count
+        references[category] = (labels, selected / max(len(vectors), 1))
+    del exact
+
+    service = _benchmark_service(directory, embeddings, nprobe, ef_search, rerank_factor)
+    results = []
+    for mode, codec in layouts:
+        if needs_training(mode, codec) and len(vectors) < MIN_TRAINING_VECTORS:
+            results.append(
+                {
+                    "index_mode": mode,
+                    "codec": codec,
+                    "skipped": f"needs at least {MIN_TRAINING_VECTORS} vectors to train",
+                }
+            )
+            continue
+
+        start = time.perf_counter()
+        index = build_id_index(mode, vectors, ids, hnsw_m=hnsw_m, codec=codec)
+        build_seconds = time.perf_counter() - start
+        writer.write_snapshot(index, documents, metadata, vectors=vectors if codec != "none" else None, lexical=lexical)
+        snapshot = writer.manifest["snapshot"]
+        del index
+
+        start = time.perf_counter()
+        service.refresh(force=True)
+        load_seconds = time.perf_counter() - start
+        for query in queries[:_WARMUP_QUERIES]:
+            service.search(query, k=k, mode=search_modes[0])
+
+        searches = []
+        for search_mode in search_modes:
+            for category in filter_values:
+                reference, selectivity = references[category]
+                latencies, labels = [], np.full((len(queries), k), -1, dtype=np.int64)
+                for row, query in enumerate(queries):
+                    start = time.perf_counter()
+                    found = service.search(query, k=k, category_filter=category, mode=search_mode)
+                    latencies.append(time.perf_counter() - start)
+                    chunk_ids = [result["metadata"]["id"] for result in found][:k]
+                    labels[row, : len(chunk_ids)] = chunk_ids
+                searches.append(
+                    {
+                        "search_mode": search_mode,
+                        "filter": category or "none",
+                        "selectivity": round(selectivity, 4),
+                        "latency_ms": _percentiles(latencies),
+                        "recall_at_k": round(recall_at_k(reference, labels, k), 4),
+                    }
+                )
+
+        stats = service.get_stats()
+        index_bytes = (directory / snapshot["index"]).stat().st_size
+        memory = {
+            "index_bytes": index_bytes,
+            "exact_vector_bytes": (directory / snapshot["vectors"]).stat().st_size if "vectors" in snapshot else 0,
+            "metadata_bytes": stats["metadata_bytes"],
+            "lexical_bytes": stats["lexical_bytes"],
+            "resident_bytes": _resident_bytes(),
+        }
+        # What a worker keeps in memory per chunk to search: index, metadata and BM25 postings
+        memory["bytes_per_chunk"] = round(
+            (index_bytes + memory["metadata_bytes"] + memory["lexical_bytes"]) / max(len(vectors), 1), 1
+        )
+        results.append(
+            {
+                "index_mode": stats["index_mode"],
+                "codec": stats["index_codec"],
+                "k": k,
+                "build_seconds": round(build_seconds, 3),
+                "load_seconds": round(load_seconds, 3),
+                "memory": memory,
+                "searches": searches,
+            }
+        )
+        logger.info(
+            f"Benchmarked {mode}/{codec} on {len(vectors)} chunks: "
+            + ", ".join(
+                f"{s['search_mode']}/{s['filter']} p95 {s['latency_ms']['p95']}ms " f"recall {s['recall_at_k']}"
+                for s in searches
+            )
+        )
+    return results
+
+
+def run_benchmark(
+    corpus_dir: Path,
+    sizes: Sequence[int] = DEFAULT_BENCHMARK_SIZES,
+    modes: Sequence[str] = ("flat", "ivf_flat", "hnsw", "ivf_pq"),
+    codecs: Sequence[str] = ("none",),
+    dimension: int = DEFAULT_BENCHMARK_DIMENSION,
+    seed: int = 0,
+    progress: Optional[Callable[[str], None]] = None,
+    **options,
+) -> Dict[str, Any]:
+    """Prepare (or reuse) a corpus per size under ``corpus_dir`` and benchmark it; returns the JSON report.
+
+    ``options`` are passed to ``benchmark_corpus``.
+    """
+    layouts = index_layouts(modes, codecs)
+    report = {
+        "format": REPORT_FORMAT,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "faiss": faiss.__version__,
+            "platform": sys.platform,
+            "cpus": available_cpus(),
+        },
+        "config": dict(options, dimension=dimension, seed=seed, layouts=[list(layout) for layout in layouts]),
+        "corpora": [],
+    }
+    for size in sizes:
+        if progress:
+            progress(f"Preparing {size} chunk corpus")
+        directory, description = prepare_corpus(
+            Path(corpus_dir) / f"corpus-{size}-d{dimension}-s{seed}", size, dimension, seed
+        )
+        if progress:
+            progress(f"Benchmarking {size} chunks")
+        report["corpora"].append(
+            {
+                "chunks": size,
+                "generate_seconds": description.get("generate_seconds"),
+                "corpus_cached": description["cached"],
+                "layouts": benchmark_corpus(directory, layouts, **options),
+            }
+        )
+    return report
+
+
+def _entries(report: Dict[str, Any]) -> Dict[Tuple, Dict[str, Any]]:
+    """Search measurements of a report keyed by (chunks, mode, codec, search mode, filter)."""
+    entries = {}
+    for corpus in report.get("corpora", []):
+        for layout in corpus["layouts"]:
+            for search in layout.get("searches", []):
+                key = (corpus["chunks"], layout["index_mode"], layout["codec"], search["search_mode"], search["filter"])
+                entries[key] = search
+    return entries
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    recall_tolerance: float = DEFAULT_RECALL_TOLERANCE,
+    latency_tolerance: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Regressions of ``current`` against ``baseline`` for measurements both reports hold.
+
+    Recall@k regresses when it falls more than ``recall_tolerance`` below
+    the baseline; with ``latency_tolerance`` the p95 latency regresses when
+    it grows by more than that fraction.
+    """
+    regressions = []
+    previous = _entries(baseline)
+    for key, search in _entries(current).items():
+        before = previous.get(key)
+        if before is None:
+            continue
+        name = "/".join(str(part) for part in key)
+        if search["recall_at_k"] < before["recall_at_k"] - recall_tolerance:
+            regressions.append(
+                {
+                    "search": name,
+                    "metric": "recall_at_k",
+                    "baseline": before["recall_at_k"],
+                    "current": search["recall_at_k"],
+                }
+            )
+        if latency_tolerance is not None and (
+            search["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + latency_tolerance)
+        ):
+            regressions.append(
+                {
+                    "search": name,
+                    "metric": "latency_ms.p95",
+                    "baseline": before["latency_ms"]["p95"],
+                    "current": search["latency_ms"]["p95"],
+                }
+            )
+    return regressions
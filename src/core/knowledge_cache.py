@@ -0,0 +1,404 @@
+"""Persistent embedding and extracted-text caches for the knowledge base service and scripts."""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.knowledge_embeddings import (
+    DEFAULT_EMBED_BATCH_SIZE,
+    DEFAULT_EMBED_CONCURRENCY,
+    ProgressCallback,
+    iter_embedding_batches,
+)
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_QUERY_CACHE_MEMORY_SIZE = 1024
+DEFAULT_QUERY_CACHE_MAX_ENTRIES = 100000
+DEFAULT_CHUNK_CACHE_MAX_ENTRIES = 200000
+DEFAULT_TEXT_CACHE_MAX_ENTRIES = 10000
+# File name of the extracted-text cache inside the knowledge base directory
+TEXT_CACHE_NAME = "extracted_text.sqlite3"
+
+# SQLite limits the number of bound parameters per statement
+SQL_BATCH_SIZE = 500
+
+# Evict from disk after this many inserts rather than on every write
+EVICT_EVERY = 100
+
+
+def count_entries(conn: sqlite3.Connection, table: str):
+    """Keep the row count of ``table`` in an ``entry_counts`` row maintained by triggers.
+
+    Inserts, deletes and evictions from any process update it inside their
+    own transaction, so reading it is a single-row lookup instead of a
+    ``COUNT(*)`` scan. ``INSERT OR REPLACE`` fires the delete trigger for
+    the row it replaces only with recursive triggers on, so every
+    connection enables them. A table that predates the counter is counted
+    once when it is added.
+    """
+    conn.execute("PRAGMA recursive_triggers = ON")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS entry_counts (name TEXT PRIMARY KEY, entries INTEGER NOT NULL)")
+        conn.execute(f"INSERT OR IGNORE INTO entry_counts (name, entries) SELECT '{table}', COUNT(*) FROM {table}")
+        for event, change in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_count AFTER {event} ON {table} "
+                f"BEGIN UPDATE entry_counts SET entries = entries {change} WHERE name = '{table}'; END"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def read_entry_count(conn: sqlite3.Connection, table: str) -> int:
+    """Rows of ``table`` as kept by ``count_entries``."""
+    row = conn.execute("SELECT entries FROM entry_counts WHERE name = ?", (table,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups (case and whitespace insensitive)."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class VectorStore:
+    """Size-bounded SQLite table of float32 vectors keyed by a hex digest.
+
+    Entries record when they were last used and the least recently used
+    ones are evicted once ``max_entries`` is exceeded. SQLite's own locking
+    makes the file safe to share between gunicorn workers.
+    """
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+            self._conn.commit()
+            count_entries(self._conn, "vectors")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM vectors WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE vectors SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return the stored vectors for whichever ``keys`` are present."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH_SIZE):
+                batch = list(keys[start : start + SQL_BATCH_SIZE])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                if rows:
+                    self._conn.execute(f"UPDATE vectors SET last_used = ? WHERE key IN ({placeholders})", [now] + batch)
+            self._conn.commit()
+        return found
+
+    def put(self, key: str, vector: np.ndarray):
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Sequence[Tuple[str, np.ndarray]]):
+        now = time.time()
+        rows = [(key, np.ascontiguousarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            previous = self._inserts
+            self._inserts += len(rows)
+            if self._inserts // EVICT_EVERY != previous // EVICT_EVERY:
+                self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        self._conn.execute(
+            "DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def evict(self):
+        """Trim the table to ``max_entries`` least recently used entries now."""
+        with self._lock:
+            self._evict_locked()
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return read_entry_count(self._conn, "vectors")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings backed by an on-disk ``VectorStore``.
+
+    Keys are the sha256 of the embedding model name and the normalized
+    query, so repeated searches skip the embedding round trip and a model
+    change never returns stale vectors.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        memory_size: int = DEFAULT_QUERY_CACHE_MEMORY_SIZE,
+        max_entries: int = DEFAULT_QUERY_CACHE_MAX_ENTRIES,
+    ):
+        self.memory_size = memory_size
+        self.store = VectorStore(path, max_entries)
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{normalize_query(query)}".encode()).hexdigest()
+
+    def get(self, query: str, model: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for ``query`` or ``None`` on a miss."""
+        key = self.key(query, model)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        vector = self.store.get(key)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def put(self, query: str, model: str, vector: np.ndarray):
+        """Cache an embedding in memory and on disk."""
+        key = self.key(query, model)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        self.store.put(key, vector)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.store),
+        }
+
+
+class ChunkEmbeddingCache:
+    """Content-addressed store of chunk embeddings.
+
+    Keys combine the chunk's content hash, the embedding model and the
+    chunker parameters, so re-ingesting, re-uploading or rebuilding only
+    embeds chunks whose text actually changed.
+    """
+
+    def __init__(self, path: Path, max_entries: int = DEFAULT_CHUNK_CACHE_MAX_ENTRIES):
+        self.store = VectorStore(path, max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(content_hash: str, model: str, chunk_params: str) -> str:
+        return hashlib.sha256(f"{model}\0{chunk_params}\0{content_hash}".encode()).hexdigest()
+
+    def iter_embeddings(
+        self,
+        embeddings,
+        texts: List[str],
+        content_hashes: List[str],
+        model: str,
+        chunk_params: str,
+        batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+        max_workers: int = DEFAULT_EMBED_CONCURRENCY,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield ``(offset, matrix)`` runs covering every text in order.
+
+        Cached vectors are served from disk; only the misses are sent to the
+        provider, in batches, and stored as soon as they arrive.
+        """
+        total = len(texts)
+        keys = [self.key(content_hash, model, chunk_params) for content_hash in content_hashes]
+        vectors: Dict[int, np.ndarray] = {}
+        cached = self.store.get_many(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                vectors[i] = cached[key]
+            else:
+                missing.append(i)
+
+        with self._lock:
+            self.hits += total - len(missing)
+            self.misses += len(missing)
+
+        next_row = 0
+
+        def _ready_run(end: int):
+            matrix = np.vstack([vectors.pop(i) for i in range(next_row, end)])
+            if progress_callback:
+                try:
+                    progress_callback(end, total)
+                except Exception as e:
+                    logger.debug(f"Embedding progress callback failed: {e}")
+            return next_row, matrix
+
+        for offset, matrix in iter_embedding_batches(
+            embeddings,
+            [texts[i] for i in missing],
+            batch_size=batch_size,
+            max_workers=max_workers,
+        ):
+            rows = missing[offset : offset + matrix.shape[0]]
+            self.store.put_many([(keys[row], vector) for row, vector in zip(rows, matrix)])
+            vectors.update(zip(rows, matrix))
+            # Everything up to the last embedded row is now available
+            end = rows[-1] + 1
+            yield _ready_run(end)
+            next_row = end
+
+        if next_row < total:
+            yield _ready_run(total)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "disk_entries": len(self.store)}
+
+
+class ExtractedTextCache:
+    """Size-bounded SQLite store of extracted document text keyed by file content hash.
+
+    Each entry holds one file's normalized page texts joined into a single
+    zlib-compressed blob, plus an ``int64`` array of ``(page_number, start,
+    end)`` boundaries (page number -1 for unnumbered pages). Keys combine
+    the sha256 of the file with the extractor, so the service and the
+    protocol scripts parse each PDF once per content version and an
+    extractor upgrade never returns stale text. Like ``VectorStore`` the
+    file is shared by processes through SQLite's locking and least
+    recently used entries are evicted past ``max_entries``.
+    """
+
+    def __init__(self, path: Path, max_entries: int = DEFAULT_TEXT_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts (key TEXT PRIMARY KEY, pages BLOB NOT NULL, "
+                "text BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS texts_last_used ON texts (last_used)")
+            self._conn.commit()
+            count_entries(self._conn, "texts")
+
+    @staticmethod
+    def key(content_hash: str, extractor: str) -> str:
+        return hashlib.sha256(f"{extractor}\0{content_hash}".encode()).hexdigest()
+
+    def get(self, content_hash: str, extractor: str) -> Optional[List[Tuple[Optional[int], str]]]:
+        """Return the cached ``(page_number, text)`` pages of a file, or ``None`` on a miss."""
+        key = self.key(content_hash, extractor)
+        with self._lock:
+            row = self._conn.execute("SELECT pages, text FROM texts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE texts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        boundaries = np.frombuffer(row[0], dtype=np.int64).reshape(-1, 3)
+        text = zlib.decompress(row[1]).decode("utf-8")
+        return [(number if number >= 0 else None, text[start:end]) for number, start, end in boundaries.tolist()]
+
+    def put(self, content_hash: str, extractor: str, pages: Sequence[Tuple[Optional[int], str]]):
+        """Store a file's pages; a failed write is logged and the pages are simply not cached."""
+        boundaries = np.empty((len(pages), 3), dtype=np.int64)
+        start = 0
+        for i, (number, page) in enumerate(pages):
+            boundaries[i] = (-1 if number is None else number, start, start + len(page))
+            start += len(page)
+        blob = zlib.compress("".join(page for _, page in pages).encode("utf-8"))
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO texts (key, pages, text, last_used) VALUES (?, ?, ?, ?)",
+                    (self.key(content_hash, extractor), boundaries.tobytes(), blob, time.time()),
+                )
+                self._conn.execute(
+                    "DELETE FROM texts WHERE key IN (SELECT key FROM texts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cache extracted text: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return read_entry_count(self._conn, "texts")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "disk_entries": len(self)}
+
+
+def open_text_cache(knowledge_dir: Optional[str] = None) -> ExtractedTextCache:
+    """Open the extracted-text cache of ``knowledge_dir`` (default ``KNOWLEDGE_BASE_DIR``) for scripts."""
+    return ExtractedTextCache(
+        Path(knowledge_dir or os.getenv("KNOWLEDGE_BASE_DIR", "data/knowledge")) / TEXT_CACHE_NAME
+    )
@@ -0,0 +1,129 @@
+"""Token-sized, heading-aware chunking of knowledge base documents."""
+
+import re
+import threading
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from src.core.knowledge_ingestion import DEFAULT_PAGE_WINDOW, iter_page_chunks
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+# Chunk size and overlap in tokens (about 1000 and 200 characters of English prose)
+DEFAULT_CHUNK_TOKENS = 256
+DEFAULT_CHUNK_OVERLAP_TOKENS = 48
+# tiktoken encoding used to count tokens; close to Claude's tokenizer for English prose
+DEFAULT_TOKEN_ENCODING = "cl100k_base"
+# Regex estimate of token counts, used when KNOWLEDGE_TOKEN_ENCODING names it or cannot be loaded
+APPROXIMATE_ENCODING = "approx"
+
+# Break before protocol headings first: markdown headings, "Section 4"/"Chapter 2" style titles,
+# numbered headings ("3.2 Assessment") and short ALL CAPS lines, then paragraphs, lines and words
+HEADING_SEPARATOR = (
+    r"\n+(?=#{1,6}\s"
+    r"|(?:Section|SECTION|Chapter|CHAPTER|Part|PART|Protocol|PROTOCOL)\s+[\w.]+"
+    r"|\d{1,2}(?:\.\d{1,2})*\.?\s+[A-Z]"
+    r"|[A-Z][A-Z0-9 ,/&()'-]{3,60}(?:\n|\Z))"
+)
+SEPARATORS = [HEADING_SEPARATOR, r"\n\n", r"\n", r"(?<=[.!?])\s+", r"\s+", ""]
+
+# Roughly one token per short word, per four characters of a longer one and per punctuation mark
+_APPROXIMATE_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class TokenCounter:
+    """Counts tokens with a tiktoken encoding, or with a regex estimate for ``"approx"``.
+
+    tiktoken downloads an encoding's ranks on first use. Where that fails (an
+    offline container without ``TIKTOKEN_CACHE_DIR``) the counter logs a
+    warning and falls back to the regex estimate, so chunking and prompt
+    packing keep working; ``approximate`` tells the two apart.
+    """
+
+    def __init__(self, encoding: str = DEFAULT_TOKEN_ENCODING):
+        self._encoding = None
+        self.name = encoding
+        if encoding != APPROXIMATE_ENCODING:
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(
+                    f"Token encoding '{encoding}' could not be loaded ({e}); counting tokens approximately. "
+                    "Provide its ranks through TIKTOKEN_CACHE_DIR, or set "
+                    f"KNOWLEDGE_TOKEN_ENCODING={APPROXIMATE_ENCODING} to silence this"
+                )
+        self.approximate = self._encoding is None
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(_APPROXIMATE_TOKEN.findall(text))
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(encoding: str = DEFAULT_TOKEN_ENCODING) -> TokenCounter:
+    """The process-wide counter for ``encoding``, loaded once; a failed load is not retried."""
+    with _counters_lock:
+        counter = _counters.get(encoding)
+        if counter is None:
+            counter = _counters[encoding] = TokenCounter(encoding)
+        return counter
+
+
+def chunk_params(encoding: str, max_tokens: int, overlap_tokens: int) -> str:
+    """Chunker identity for content-addressed caches: changing any part re-embeds.
+
+    Built from the configured encoding name, not from a loaded counter, so
+    it is the same in every worker whatever the network was doing.
+    """
+    return f"tokens:{encoding}:{max_tokens}:{overlap_tokens}"
+
+
+def iter_token_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    counter: TokenCounter,
+    max_tokens: int = DEFAULT_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_CHUNK_OVERLAP_TOKENS,
+    window: int = DEFAULT_PAGE_WINDOW,
+) -> Iterator[Tuple[str, Optional[int], Optional[int], int]]:
+    """Split a stream of pages into ``(chunk, first_page, last_page, tokens)``, at most ``max_tokens`` each.
+
+    Chunk boundaries fall before headings wherever a section fits, so a
+    heading starts the chunk holding its section; longer sections fall back to
+    paragraph, line, sentence and word breaks. A heading left on its own
+    that way is joined to the start of the next chunk; chunks are split a
+    little under ``max_tokens`` to leave room for it.
+    ``tokens`` is the chunk's token count, stored so prompt builders need
+    not tokenize at request time. Streaming and page spans work as in
+    ``iter_page_chunks``.
+    """
+    reserve = max(1, min(overlap_tokens, max_tokens // 8))
+    heading: Optional[Tuple[str, Optional[int], int]] = None
+    for chunk, page, page_end in iter_page_chunks(
+        pages,
+        max_tokens - reserve,
+        min(overlap_tokens, max_tokens // 2),
+        window,
+        length_function=counter.count,
+        separators=SEPARATORS,
+    ):
+        tokens = counter.count(chunk)
+        if heading is not None:
+            joined = f"{heading[0]}\n{chunk}"
+            joined_tokens = counter.count(joined)
+            if joined_tokens <= max_tokens:
+                chunk, page, tokens = joined, heading[1], joined_tokens
+            else:
+                yield heading[0], heading[1], heading[1], heading[2]
+            heading = None
+        if "\n" not in chunk and tokens < reserve and re.match(HEADING_SEPARATOR, "\n" + chunk):
+            heading = (chunk, page, tokens)
+            continue
+        yield chunk, page, page_end, tokens
+    if heading is not None:
+        yield heading[0], heading[1], heading[1], heading[2]
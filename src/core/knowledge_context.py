@@ -0,0 +1,189 @@
+"""Token-budgeted assembly of retrieved chunks into prompt context."""
+
+import math
+import re
+from typing import Any, Callable, Dict, List
+
+# Tokens of retrieved knowledge placed in an enhanced-guidance prompt
+DEFAULT_CONTEXT_TOKENS = 1500
+# Tokens of retrieved knowledge placed in a Retell agent prompt; 0 sizes it to the retrieved chunks
+DEFAULT_CALL_CONTEXT_TOKENS = 0
+# Allowance for one rendered reference header when a budget is sized in whole chunks
+REFERENCE_HEADER_TOKENS = 24
+# Joins non-adjacent spans of the same document within one reference
+SPAN_SEPARATOR = "\n[...]\n"
+# Characters of a chunk's start used to find where it overlaps the previous chunk
+_OVERLAP_PROBE = 16
+
+_WHITESPACE = re.compile(r"\s+")
+
+FormatReference = Callable[[int, Dict[str, Any]], str]
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """Length of the longest suffix of ``previous`` that ``following`` starts with."""
+    probe = following[:_OVERLAP_PROBE]
+    if not probe:
+        return 0
+    start = previous.find(probe, max(0, len(previous) - len(following)))
+    while start != -1:
+        if following.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(probe, start + 1)
+    return 0
+
+
+def _normalized(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def _document_key(result: Dict[str, Any]) -> tuple:
+    metadata = result.get("metadata") or {}
+    if metadata.get("document_id") is not None:
+        return ("document", metadata["document_id"])
+    return ("source", metadata.get("source", ""), metadata.get("title", ""))
+
+
+def _merge_spans(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge a document's retrieved chunks, in document order, into non-overlapping spans.
+
+    Positions count every chunk the document was split into, including
+    near duplicates linked away at ingestion, so chunks that were not
+    neighbours in the source are never joined. Consecutive chunks are
+    joined at their shared overlap; a chunk whose text is already inside
+    the current span is dropped. A span's token
+    count is estimated from the stored counts of its chunks, scaling each
+    appended chunk by the share of its characters that were new.
+    """
+    spans: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        text, tokens = chunk["text"], chunk["tokens"]
+        span = spans[-1] if spans else None
+        if span is not None and text in span["text"]:
+            span["ranks"].append(chunk["rank"])
+            continue
+        if span is not None and chunk["position"] is not None and chunk["position"] == span["end"] + 1:
+            overlap = overlap_length(span["text"], text)
+            new_text = text[overlap:]
+            span["text"] += new_text if overlap else "\n" + new_text
+            span["tokens"] += math.ceil(tokens * len(new_text) / max(len(text), 1))
+            span["end"] = chunk["position"]
+            span["ranks"].append(chunk["rank"])
+            span["pages"].append(chunk["page"])
+            continue
+        spans.append(
+            {
+                "text": text,
+                "tokens": tokens,
+                "end": chunk["position"],
+                "ranks": [chunk["rank"]],
+                "pages": [chunk["page"]],
+            }
+        )
+    return spans
+
+
+def pack_context(
+    results: List[Dict[str, Any]],
+    budget_tokens: int,
+    count_tokens: Callable[[str], int],
+    format_reference: FormatReference,
+) -> Dict[str, Any]:
+    """Pack search results into at most ``budget_tokens`` of prompt context.
+
+    Results (best first, as returned by ``search``) are grouped by
+    document; each document's chunks are merged into spans where they are
+    adjacent or overlap, and spans whose text already appears in a more
+    relevant reference are dropped. References are then added in order of
+    their best chunk's rank while they fit; a reference that does not fit
+    whole contributes the spans that do, so nothing is cut mid-sentence.
+
+    Chunk costs come from the ``token_count`` stored at ingestion, so only
+    reference headers and chunks without a stored count are passed to
+    ``count_tokens``. ``format_reference(number, reference)`` renders one
+    reference; the returned report holds the rendered ``context``, the
+    packed ``references`` and token accounting: ``tokens_used``,
+    ``tokens_saved`` (duplicate and overlapping text and repeated headers
+    removed from what was packed) and ``tokens_omitted`` (content left out
+    to stay within the budget).
+    """
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for rank, result in enumerate(results):
+        metadata = result.get("metadata") or {}
+        tokens = metadata.get("token_count") or count_tokens(result["content"])
+        group = groups.setdefault(_document_key(result), {"result": result, "chunks": []})
+        group["chunks"].append(
+            {
+                "text": result["content"].strip(),
+                "tokens": tokens,
+                "position": metadata.get("source_position", metadata.get("chunk_index")),
+                "page": metadata.get("page"),
+                "rank": rank,
+            }
+        )
+
+    separator_cost = count_tokens(SPAN_SEPARATOR)
+    references: List[Dict[str, Any]] = []
+    packed_texts: List[str] = []
+    tokens_used = tokens_saved = tokens_omitted = 0
+    for group in sorted(groups.values(), key=lambda g: min(c["rank"] for c in g["chunks"])):
+        result, chunks = group["result"], group["chunks"]
+        metadata = result.get("metadata") or {}
+        chunks.sort(key=lambda c: (c["position"] is None, c["position"] or 0, c["rank"]))
+        spans = _merge_spans(chunks)
+        original = {c["rank"]: c["tokens"] for c in chunks}
+
+        # Spans already present in a more relevant reference add nothing
+        kept_spans = []
+        for span in spans:
+            normalized = _normalized(span["text"])
+            if any(normalized in packed for packed in packed_texts):
+                tokens_saved += sum(original[rank] for rank in span["ranks"])
+            else:
+                kept_spans.append(span)
+        if not kept_spans:
+            continue
+
+        reference = {
+            "title": metadata.get("title", "Unknown"),
+            "source": metadata.get("source", "Internal Knowledge Base"),
+            "category": metadata.get("category", "general"),
+            "relevance": result.get("relevance"),
+            "document_id": metadata.get("document_id"),
+            "content": "",
+            "pages": [],
+        }
+        header_tokens = count_tokens(format_reference(len(references) + 1, reference))
+        remaining = budget_tokens - tokens_used - header_tokens
+        chosen = []
+        for span in sorted(kept_spans, key=lambda s: min(s["ranks"])):
+            separator_tokens = separator_cost if chosen else 0
+            if span["tokens"] + separator_tokens <= remaining:
+                chosen.append(span)
+                remaining -= span["tokens"] + separator_tokens
+            else:
+                tokens_omitted += sum(original[rank] for rank in span["ranks"])
+        if not chosen:
+            continue
+
+        chosen.sort(key=lambda s: kept_spans.index(s))
+        reference["content"] = SPAN_SEPARATOR.join(span["text"] for span in chosen)
+        reference["pages"] = sorted({page for span in chosen for page in span["pages"] if page})
+        reference_tokens = header_tokens + sum(span["tokens"] for span in chosen) + separator_cost * (len(chosen) - 1)
+        # Unpacked, every chunk would have carried its own header and full text
+        unpacked = sum(header_tokens + original[rank] for span in chosen for rank in span["ranks"])
+        tokens_saved += max(0, unpacked - reference_tokens)
+        tokens_used += reference_tokens
+        references.append(reference)
+        packed_texts.extend(_normalized(span["text"]) for span in chosen)
+
+    context = "\n".join(format_reference(number, reference) for number, reference in enumerate(references, 1))
+    return {
+        "context": context,
+        "references": references,
+        "chunks_retrieved": len(results),
+        "tokens_used": tokens_used,
+        "tokens_saved": tokens_saved,
+        "tokens_omitted": tokens_omitted,
+        "budget_tokens": budget_tokens,
+    }
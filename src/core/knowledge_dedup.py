@@ -0,0 +1,217 @@
+"""MinHash signatures and LSH buckets for suppressing near-duplicate chunks at ingestion."""
+
+import re
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.knowledge_metadata import Column
+
+# Estimated Jaccard similarity of word shingles at which a chunk is linked instead of indexed
+DEFAULT_DEDUP_THRESHOLD = 0.9
+# 8 bands of 8 MinHash rows: chunks 0.9 similar share a band 99% of the time, 0.5 similar 3%
+DEFAULT_NUM_PERMUTATIONS = 64
+DEFAULT_BANDS = 8
+SHINGLE_SIZE = 3
+# Fixed so signatures and bucket keys agree across processes and restarts
+_SEED = 20240501
+# Tail buckets are merged into the sorted base arrays once they outgrow this share of them
+_TAIL_MERGE_RATIO = 0.125
+_TAIL_MERGE_MIN = 1024
+# Candidates checked per band when several chunks share a bucket
+_MAX_BUCKET_CANDIDATES = 4
+
+_WORD = re.compile(r"[a-z0-9]+")
+_MASK64 = (1 << 64) - 1
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """CRC32 of each distinct word ``size``-gram of ``text``; shorter texts are one shingle."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def dedup_scope(category: Optional[str], source: Optional[str], tags: Iterable[str]) -> str:
+    """Chunks are only linked within the same category, source and tags, so filtered searches still find them."""
+    return "\x1f".join([category or "", source or ""] + sorted(tags or ()))
+
+
+class NearDuplicateIndex:
+    """LSH buckets of chunk MinHash signatures, for finding a chunk's canonical near duplicate.
+
+    Each signature is cut into ``bands``; chunks sharing a band in the same
+    scope are candidates and match when their estimated similarity (the
+    share of equal MinHash values) reaches ``threshold``. Bucket keys of
+    chunks known at the last merge are sorted NumPy arrays searched with
+    ``searchsorted``; chunks added since sit in a small dict until the next
+    merge. The first chunk to fill a bucket stays its canonical chunk.
+
+    The index lives in the writer's memory only. It is built from stored
+    chunk texts on the first ingestion and extended as chunks are added.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_DEDUP_THRESHOLD,
+        num_permutations: int = DEFAULT_NUM_PERMUTATIONS,
+        bands: int = DEFAULT_BANDS,
+    ):
+        if num_permutations % bands:
+            raise ValueError(f"{num_permutations} permutations cannot be split into {bands} bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.num_permutations = num_permutations
+        rng = np.random.default_rng(_SEED)
+        # Multiply-shift hashing of 32-bit shingles: the high half of a * x + b (mod 2**64)
+        self._a = rng.integers(1, 2**63, size=num_permutations, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=num_permutations, dtype=np.uint64)
+        self._band_weights = rng.integers(1, 2**63, size=num_permutations // bands, dtype=np.uint64) | np.uint64(1)
+        self._band_salts = rng.integers(0, 2**63, size=bands, dtype=np.uint64)
+        self.clear()
+
+    def clear(self):
+        """Forget every chunk."""
+        self._ids = Column(np.int64)
+        self._signatures = np.empty((0, self.num_permutations), dtype=np.uint32)
+        self._base_keys = np.empty(0, dtype=np.uint64)
+        self._base_slots = np.empty(0, dtype=np.int64)
+        self._tail: Dict[int, int] = {}
+        # Chunks with ids up to here have been offered to the index
+        self.max_id = -1
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of ``text``'s word shingles, or None for text without words."""
+        hashes = shingles(text)
+        if not len(hashes):
+            return None
+        mixed = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return mixed.min(axis=1).astype(np.uint32)
+
+    def _keys(self, signature: np.ndarray, scope: str) -> np.ndarray:
+        """One bucket key per band, salted with the band number and the scope."""
+        rows = signature.astype(np.uint64).reshape(self.bands, -1)
+        keys = (rows * self._band_weights).sum(axis=1, dtype=np.uint64) ^ self._band_salts
+        scope_salt = (zlib.crc32(scope.encode("utf-8")) * 0x9E3779B97F4A7C15) & _MASK64
+        return keys ^ np.uint64(scope_salt)
+
+    def _candidate_slots(self, keys: np.ndarray) -> List[int]:
+        slots: List[int] = []
+        if len(self._base_keys):
+            starts = np.searchsorted(self._base_keys, keys, side="left")
+            ends = np.searchsorted(self._base_keys, keys, side="right")
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                slots.extend(self._base_slots[start : min(end, start + _MAX_BUCKET_CANDIDATES)].tolist())
+        for key in keys.tolist():
+            slot = self._tail.get(key)
+            if slot is not None:
+                slots.append(slot)
+        return slots
+
+    def find(
+        self, signature: np.ndarray, scope: str, is_live: Optional[Callable[[int], bool]] = None
+    ) -> Optional[Tuple[int, float]]:
+        """The chunk most similar to ``signature`` in ``scope`` and its estimated similarity, or None.
+
+        Chunks that ``is_live`` rejects (deleted since they were added) are
+        dropped from the index as they are found.
+        """
+        best = None
+        for slot in sorted(set(self._candidate_slots(self._keys(signature, scope)))):
+            chunk_id = int(self._ids[slot])
+            if chunk_id < 0:
+                continue
+            if is_live is not None and not is_live(chunk_id):
+                self._ids[slot] = -1
+                continue
+            similarity = float(np.count_nonzero(self._signatures[slot] == signature)) / self.num_permutations
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (chunk_id, similarity)
+        return best
+
+    def add(self, chunk_id: int, signature: np.ndarray, scope: str):
+        """Add a chunk; buckets that already hold a live chunk keep it as canonical."""
+        slot = len(self._ids)
+        self._ids.append(chunk_id)
+        if slot == len(self._signatures):
+            grown = np.empty((max(16, 2 * slot), self.num_permutations), dtype=np.uint32)
+            grown[:slot] = self._signatures[:slot]
+            self._signatures = grown
+        self._signatures[slot] = signature
+        self.max_id = max(self.max_id, int(chunk_id))
+
+        keys = self._keys(signature, scope)
+        for key in keys.tolist():
+            current = self._tail.get(key)
+            if current is None or self._ids[current] < 0:
+                self._tail[key] = slot
+        if len(self._tail) > max(_TAIL_MERGE_MIN, _TAIL_MERGE_RATIO * len(self._base_keys)):
+            self._merge_tail()
+
+    def _merge_tail(self):
+        """Move tail buckets into the sorted base arrays, keeping the earliest slot of each key first."""
+        keys = np.concatenate([self._base_keys, np.fromiter(self._tail.keys(), dtype=np.uint64, count=len(self._tail))])
+        slots = np.concatenate(
+            [self._base_slots, np.fromiter(self._tail.values(), dtype=np.int64, count=len(self._tail))]
+        )
+        order = np.lexsort((slots, keys))
+        self._base_keys, self._base_slots = keys[order], slots[order]
+        self._tail = {}
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._ids.nbytes
+            + len(self._ids) * self.num_permutations * 4
+            + self._base_keys.nbytes
+            + self._base_slots.nbytes
+            + 16 * len(self._tail)
+        )
+
+
+def link_near_duplicates(
+    index: NearDuplicateIndex,
+    chunks: Sequence[str],
+    scope: str,
+    is_live: Optional[Callable[[int], bool]] = None,
+    local: Optional[NearDuplicateIndex] = None,
+    start: int = 0,
+) -> Tuple[List[int], Dict[int, Tuple[str, int]], List[Optional[np.ndarray]]]:
+    """Split a document's chunks into those to index and those to link.
+
+    ``chunks`` may be one window of a streamed document: ``start`` is the
+    position of its first chunk and ``local`` holds the kept chunks of
+    earlier windows (it is updated in place). Returns the positions of the
+    chunks to keep, a map from each linked position to ``("chunk", id)`` of
+    a canonical chunk already in ``index`` or ``("position", p)`` of an
+    earlier kept chunk of the same document, and the signatures of the kept
+    chunks. The first chunk is always kept so the document keeps an indexed
+    chunk of its own.
+    """
+    if local is None:
+        local = NearDuplicateIndex(index.threshold, index.num_permutations, index.bands)
+    kept: List[int] = []
+    links: Dict[int, Tuple[str, int]] = {}
+    signatures: List[Optional[np.ndarray]] = []
+    for position, chunk in enumerate(chunks, start):
+        signature = index.signature(chunk)
+        if position and signature is not None:
+            match = local.find(signature, scope)
+            if match is not None:
+                links[position] = ("position", match[0])
+                continue
+            match = index.find(signature, scope, is_live)
+            if match is not None:
+                links[position] = ("chunk", match[0])
+                continue
+        kept.append(position)
+        signatures.append(signature)
+        if signature is not None:
+            local.add(position, signature, scope)
+    return kept, links, signatures
@@ -0,0 +1,373 @@
+"""Embedding providers and batched, concurrent embedding helpers for the knowledge base service."""
+
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import openai
+from langchain_openai import OpenAIEmbeddings
+
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_EMBED_CONCURRENCY = 4
+# Seconds before an embedding request is abandoned, and how often a failed one is sent again
+DEFAULT_EMBED_TIMEOUT = 30.0
+DEFAULT_EMBED_RETRIES = 3
+DEFAULT_EMBED_BACKOFF = 0.5
+MAX_EMBED_BACKOFF = 8.0
+
+# Vector size of ada-002, the default model, used when an embedder does not state its own
+DEFAULT_EMBEDDING_DIMENSION = 1536
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+# Models named hashed-ngram-<dimension> are embedded in-process without network access
+LOCAL_MODEL_PREFIX = "hashed-ngram"
+DEFAULT_LOCAL_EMBEDDING_DIMENSION = 512
+# Character n-gram lengths of the local embedder, and the weight of a word bigram relative to a word
+CHAR_NGRAM_SIZES = (3, 4, 5)
+BIGRAM_WEIGHT = 0.5
+WORD_FEATURE_CACHE_SIZE = 100_000
+_WORD = re.compile(r"[a-z0-9]+")
+# Words too common to tell texts apart; without corpus statistics they would outweigh clinical terms
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the their this to was were will with "
+    "can may should if not no any all per".split()
+)
+
+# Called with (chunks_embedded, total_chunks) after every completed batch
+ProgressCallback = Callable[[int, int], None]
+
+
+def embedding_model_name(embeddings) -> str:
+    """Name identifying the vectors an embedder produces, used in cache keys."""
+    for attribute in ("model", "model_name"):
+        name = getattr(embeddings, attribute, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+def embedding_dimension(embeddings) -> int:
+    """Vector size an embedder produces, or ada-002's when it does not say."""
+    dimension = getattr(embeddings, "dimension", None)
+    if isinstance(dimension, int) and dimension > 0:
+        return dimension
+    return DEFAULT_EMBEDDING_DIMENSION
+
+
+def is_local_model(model: str) -> bool:
+    """Whether ``model`` names the in-process hashed n-gram embedder."""
+    return model.startswith(f"{LOCAL_MODEL_PREFIX}-")
+
+
+class EmbeddingTimeout(TimeoutError):
+    """Raised by a provider's client for a request that did not answer within its timeout."""
+
+
+class EmbeddingProvider:
+    """Base class of embedding providers with request batching, timeouts and retries.
+
+    Subclasses embed one request's texts in ``_embed``. Inputs are split
+    into requests of at most ``batch_size`` texts. ``timeout`` (None waits)
+    is enforced by the subclass's client, which closes a request still
+    running after that many seconds; a failed or timed-out request is sent
+    again up to ``max_retries`` times with jittered
+    exponential backoff. ``model`` names the vectors in cache keys and
+    index generations, ``dimension`` their size.
+    """
+
+    model = ""
+    dimension: Optional[int] = None
+
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+        timeout: Optional[float] = DEFAULT_EMBED_TIMEOUT,
+        max_retries: int = DEFAULT_EMBED_RETRIES,
+        backoff: float = DEFAULT_EMBED_BACKOFF,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.timeout = float(timeout) if timeout and timeout > 0 else None
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = max(0.0, float(backoff))
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "retries": 0, "timeouts": 0, "failures": 0}
+
+    def _embed(self, texts: List[str]) -> Any:
+        """Embed ``texts`` with one request and return one vector per text."""
+        raise NotImplementedError
+
+    def _retryable(self, error: Exception) -> bool:
+        """Whether a request that failed with ``error`` may succeed when sent again."""
+        return not isinstance(error, (ValueError, TypeError, NotImplementedError))
+
+    def _timed_out(self, error: Exception) -> bool:
+        """Whether ``error`` reports a request that ran past ``timeout``."""
+        return isinstance(error, TimeoutError)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        """Embed one request's texts, retrying failures with backoff."""
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                matrix = np.asarray(self._embed(texts), dtype=np.float32)
+                if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+                    raise ValueError(f"{self.model} returned {matrix.shape} for a request of {len(texts)} texts")
+                self._count("texts", len(texts))
+                return matrix
+            except Exception as e:
+                if self._timed_out(e):
+                    self._count("timeouts")
+                if attempt >= self.max_retries or not self._retryable(e):
+                    self._count("failures")
+                    raise
+                delay = min(MAX_EMBED_BACKOFF, self.backoff * 2**attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                self._count("retries")
+                logger.warning(
+                    f"Embedding request to {self.model} failed ({e}) - retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                self._sleep(delay)
+
+    def embed_matrix(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """Embed texts into a ``(len(texts), dimension)`` float32 matrix.
+
+        Requests hold at most ``batch_size`` texts, the provider's own batch
+        size unless the caller has already sized its batches.
+        """
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        size = max(1, int(batch_size)) if batch_size else self.batch_size
+        return np.vstack([self._request(texts[offset : offset + size]) for offset in range(0, len(texts), size)])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Requests, embedded texts, retries, timeouts and failed requests so far."""
+        with self._lock:
+            return dict(self._stats, model=self.model, dimension=self.dimension)
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings API; the client enforces the timeout, retries are the provider's, so the client's are off."""
+
+    def __init__(self, api_key: str, model: str, **options):
+        super().__init__(**options)
+        self.model = model
+        self.dimension = OPENAI_EMBEDDING_DIMENSIONS.get(model)
+        self.client = OpenAIEmbeddings(
+            openai_api_key=api_key,
+            model=model,
+            chunk_size=self.batch_size,
+            max_retries=0,
+            request_timeout=self.timeout,
+        )
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts, chunk_size=len(texts))
+
+    def _timed_out(self, error: Exception) -> bool:
+        return isinstance(error, openai.APITimeoutError) or super()._timed_out(error)
+
+    def _retryable(self, error: Exception) -> bool:
+        # Rate limits, conflicts and server errors pass; bad requests and authentication errors do not
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status in (408, 409, 429) or status >= 500
+        return super()._retryable(error)
+
+
+@lru_cache(maxsize=WORD_FEATURE_CACHE_SIZE)
+def _word_features(word: str, dimension: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed buckets and signed weights of a word and its character n-grams."""
+    padded = f"<{word}>"
+    grams = [padded[i : i + n] for n in CHAR_NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    features = [f"w:{word}"] + [f"c:{gram}" for gram in grams]
+    # The n-grams together weigh as much as the word itself
+    weights = [1.0] + [len(grams) ** -0.5] * len(grams)
+    hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.int64)
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    return (hashes & 0x7FFFFFFF) % dimension, (signs * weights).astype(np.float32)
+
+
+class HashedNgramEmbeddings(EmbeddingProvider):
+    """In-process embeddings from signed feature hashing of words, word bigrams and character n-grams.
+
+    Needs no network access or model files. Stopwords are skipped; every
+    other feature adds its signed weight to one of ``dimension`` buckets
+    chosen by CRC32, counts are damped with ``log1p`` and vectors
+    normalised, so L2 distance ranks texts by the cosine similarity of
+    their hashed term vectors. Character
+    n-grams place inflections and misspellings ("opioid", "opiods") near
+    each other. Vectors depend only on the dimension, so every worker and
+    process embeds the same text alike.
+    """
+
+    def __init__(self, dimension: int = DEFAULT_LOCAL_EMBEDDING_DIMENSION, batch_size: int = DEFAULT_EMBED_BATCH_SIZE):
+        # CPU-bound and local: nothing to time out or retry
+        super().__init__(batch_size=batch_size, timeout=None, max_retries=0)
+        self.dimension = int(dimension)
+        if self.dimension <= 0:
+            raise ValueError(f"Embedding dimension must be positive, got {dimension}")
+        self.model = f"{LOCAL_MODEL_PREFIX}-{self.dimension}"
+
+    def _features(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        words = [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+        buckets, weights = [], []
+        for word, count in Counter(words).items():
+            word_buckets, word_weights = _word_features(word, self.dimension)
+            buckets.append(word_buckets)
+            weights.append(word_weights * count)
+        bigrams = Counter(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+        if bigrams:
+            hashes = np.array([zlib.crc32(bigram.encode()) for bigram in bigrams], dtype=np.int64)
+            signs = np.where(hashes & 0x80000000, -BIGRAM_WEIGHT, BIGRAM_WEIGHT)
+            buckets.append((hashes & 0x7FFFFFFF) % self.dimension)
+            weights.append((signs * np.fromiter(bigrams.values(), dtype=np.float64)).astype(np.float32))
+        if not buckets:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(buckets), np.concatenate(weights)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        # One bincount over every text's features, offset by row
+        rows, weights = [], []
+        for row, text in enumerate(texts):
+            buckets, values = self._features(text)
+            rows.append(buckets + row * self.dimension)
+            weights.append(values)
+        counts = np.bincount(
+            np.concatenate(rows), weights=np.concatenate(weights), minlength=len(texts) * self.dimension
+        ).reshape(len(texts), self.dimension)
+        matrix = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+def create_embedding_provider(
+    model: str, openai_api_key: Optional[str] = None, **options
+) -> Optional[EmbeddingProvider]:
+    """Embedding provider for ``model``.
+
+    ``hashed-ngram-<dimension>`` names the local embedder; any other name is
+    an OpenAI model, for which None is returned without an API key.
+    ``options`` (batch size, timeout, retries, backoff) configure requests.
+    Raises ValueError for a malformed local model name.
+    """
+    if is_local_model(model):
+        dimension = model[len(LOCAL_MODEL_PREFIX) + 1 :]
+        if not dimension.isdigit():
+            raise ValueError(f"Local embedding models are named {LOCAL_MODEL_PREFIX}-<dimension>, got '{model}'")
+        return HashedNgramEmbeddings(int(dimension), batch_size=options.get("batch_size", DEFAULT_EMBED_BATCH_SIZE))
+    if not openai_api_key:
+        return None
+    return OpenAIEmbeddingProvider(openai_api_key, model, **options)
+
+
+def _embed_batch(embeddings, texts: List[str]) -> np.ndarray:
+    """Embed one batch of texts with a single provider request."""
+    embed_matrix = getattr(embeddings, "embed_matrix", None)
+    vectors = embed_matrix(texts, batch_size=len(texts)) if embed_matrix else embeddings.embed_documents(texts)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(texts):
+        raise ValueError(f"Embedding provider returned {matrix.shape} for a batch of {len(texts)} texts")
+    return matrix
+
+
+def iter_embedding_batches(
+    embeddings,
+    texts: List[str],
+    batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+    max_workers: int = DEFAULT_EMBED_CONCURRENCY,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Embed texts in batches and yield ``(offset, matrix)`` pairs in input order.
+
+    At most ``max_workers`` batches are in flight at any time. Batches are
+    yielded in submission order, so callers can add each matrix to FAISS as
+    soon as it arrives without disturbing row positions.
+    """
+    total = len(texts)
+    if total == 0:
+        return
+
+    batch_size = max(1, int(batch_size))
+    max_workers = max(1, int(max_workers))
+    offsets = list(range(0, total, batch_size))
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-embed") as executor:
+        pending = deque()
+        next_batch = 0
+
+        while next_batch < len(offsets) or pending:
+            # Keep the window of in-flight batches full
+            while next_batch < len(offsets) and len(pending) < max_workers:
+                offset = offsets[next_batch]
+                batch = texts[offset : offset + batch_size]
+                pending.append((offset, executor.submit(_embed_batch, embeddings, batch)))
+                next_batch += 1
+
+            offset, future = pending.popleft()
+            try:
+                matrix = future.result()
+            except Exception:
+                for _, remaining in pending:
+                    remaining.cancel()
+                raise
+
+            done += matrix.shape[0]
+            if progress_callback:
+                try:
+                    progress_callback(done, total)
+                except Exception as e:
+                    logger.debug(f"Embedding progress callback failed: {e}")
+
+            yield offset, matrix
+
+
+def embed_texts(
+    embeddings,
+    texts: List[str],
+    batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+    max_workers: int = DEFAULT_EMBED_CONCURRENCY,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> np.ndarray:
+    """Embed all texts and return a single ``(len(texts), dim)`` float32 matrix."""
+    matrices = [
+        matrix
+        for _, matrix in iter_embedding_batches(
+            embeddings,
+            texts,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            progress_callback=progress_callback,
+        )
+    ]
+    if not matrices:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(matrices)
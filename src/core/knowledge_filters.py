@@ -0,0 +1,118 @@
+"""Inverted metadata index used to push knowledge search filters into FAISS."""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from src.core.knowledge_index import RowSelection
+from src.core.knowledge_metadata import ChunkMetadata
+
+# Metadata fields that can be filtered on; ``tags`` holds a list per chunk
+FILTER_FIELDS = ("category", "tags", "source")
+
+FilterValue = Union[str, Iterable[str], None]
+
+
+def _filter_values(value: FilterValue) -> List[str]:
+    """Normalize a filter argument to a list of values (empty means no filter)."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value else []
+    return [v for v in value if v]
+
+
+class MetadataFilterIndex:
+    """Postings lists from category, tag and source values to stable chunk ids.
+
+    ``select`` turns the postings for a filter into a ``RowSelection``
+    bitmap that FAISS applies while searching, so filtered searches return
+    the nearest matching chunks instead of filtering an over-fetched list.
+    Values within one field are OR-ed; different fields are AND-ed.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self, source_list=None):
+        self._postings: Dict[str, Dict[str, array]] = {field: {} for field in FILTER_FIELDS}
+        self._rows = 0
+        self._size = 0
+        self._source_list = source_list
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def sync(self, metadata: List[Dict[str, Any]]):
+        """Index any rows of ``metadata`` added since the last sync.
+
+        A different metadata list (after a full reload) is re-indexed from
+        scratch; appends to the same list are indexed incrementally.
+        """
+        if metadata is not self._source_list or len(metadata) < self._rows:
+            self._reset(metadata)
+        if isinstance(metadata, ChunkMetadata):
+            # Read the interned columns directly instead of building a dict per row
+            for row in range(self._rows, len(metadata)):
+                self._add(*metadata.filter_fields(row))
+            return
+        for row in range(self._rows, len(metadata)):
+            self.add(metadata[row])
+
+    def add(self, meta: Dict[str, Any]):
+        """Add one chunk's metadata; chunks must be added in increasing id order."""
+        self._add(meta.get("id", self._rows), meta.get("category"), meta.get("source"), meta.get("tags"))
+
+    def _add(self, chunk_id: int, category: Optional[str], source: Optional[str], tags: Optional[Iterable[str]]):
+        self._post("category", category or "", chunk_id)
+        self._post("source", source or "", chunk_id)
+        for tag in set(tags or ()):
+            self._post("tags", tag, chunk_id)
+        self._rows += 1
+        self._size = max(self._size, chunk_id + 1)
+
+    def _post(self, field: str, value: str, chunk_id: int):
+        postings = self._postings[field].get(value)
+        if postings is None:
+            postings = self._postings[field][value] = array("q")
+        postings.append(chunk_id)
+
+    def values(self, field: str) -> Dict[str, int]:
+        """Return each indexed value of ``field`` with its chunk count."""
+        return {value: len(rows) for value, rows in self._postings[field].items() if value}
+
+    def select(
+        self,
+        category: FilterValue = None,
+        tags: FilterValue = None,
+        source: FilterValue = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Optional[RowSelection]:
+        """Return the chunk ids matching every given field, or ``None`` when nothing is filtered.
+
+        Chunk ids listed in ``exclude`` (deleted chunks) are never selected.
+        """
+        criteria = {
+            "category": _filter_values(category),
+            "tags": _filter_values(tags),
+            "source": _filter_values(source),
+        }
+        mask = None
+        for field, values in criteria.items():
+            if not values:
+                continue
+            field_mask = np.zeros(self._size, dtype=bool)
+            for value in values:
+                postings = self._postings[field].get(value)
+                if postings:
+                    field_mask[np.frombuffer(postings, dtype=np.int64)] = True
+            mask = field_mask if mask is None else mask & field_mask
+
+        if exclude is not None and len(exclude):
+            if mask is None:
+                mask = np.ones(self._size, dtype=bool)
+            mask[exclude[exclude < self._size]] = False
+
+        return RowSelection(mask) if mask is not None else None
@@ -0,0 +1,655 @@
+"""FAISS index helpers for the knowledge base service."""
+
+import math
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+# Index backends, from exact brute force to compressed approximate search
+INDEX_MODES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+AUTO_INDEX_MODE = "auto"
+
+# How an index stores each vector: raw float32, scalar quantized to float16 or
+# 8 bits per dimension, or product quantized (which always means IVF-PQ, the
+# one PQ backend FAISS can filter)
+VECTOR_CODECS = ("none", "fp16", "sq8", "pq")
+SCALAR_QUANTIZER_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+# Lossy indexes fetch this many times k candidates and re-rank them exactly
+DEFAULT_RERANK_FACTOR = 4
+
+DEFAULT_IVF_THRESHOLD = 20000
+DEFAULT_IVF_PQ_THRESHOLD = 500000
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_HNSW_M = 32
+
+# k-means wants roughly 39-256 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+MAX_TRAINING_POINTS = 100000
+# Trained backends are not worth building below this many vectors
+MIN_TRAINING_VECTORS = 1000
+# Filters matching less than this fraction of an ANN index are searched exhaustively
+FILTER_EXHAUSTIVE_FRACTION = 0.05
+
+
+def read_index(path: Path, mmap: bool = True):
+    """Read a FAISS index, memory-mapping it read-only when possible.
+
+    Memory-mapped indexes live in the shared page cache, so every gunicorn
+    worker reading the same snapshot file shares one copy of the vectors.
+    """
+    if mmap:
+        try:
+            return faiss.read_index(str(path), MMAP_FLAGS)
+        except RuntimeError as e:
+            logger.warning(f"Could not memory-map {Path(path).name}, reading into memory: {e}")
+    return faiss.read_index(str(path))
+
+
+def choose_index_mode(
+    ntotal: int,
+    ivf_threshold: int = DEFAULT_IVF_THRESHOLD,
+    ivf_pq_threshold: int = DEFAULT_IVF_PQ_THRESHOLD,
+) -> str:
+    """Pick an index backend for a corpus of ``ntotal`` chunks.
+
+    Small corpora stay on the exact flat index. IVF-Flat keeps exact
+    distances over a pruned search space, and IVF-PQ compresses vectors once
+    the corpus is too large to hold as raw float32.
+    """
+    if ntotal >= ivf_pq_threshold:
+        return "ivf_pq"
+    if ntotal >= ivf_threshold:
+        return "ivf_flat"
+    return "flat"
+
+
+def resolve_index_mode(
+    configured: str,
+    ntotal: int,
+    ivf_threshold: int = DEFAULT_IVF_THRESHOLD,
+    ivf_pq_threshold: int = DEFAULT_IVF_PQ_THRESHOLD,
+) -> str:
+    """Return the backend to use for ``configured`` mode at the given corpus size."""
+    configured = (configured or AUTO_INDEX_MODE).lower()
+    if configured == AUTO_INDEX_MODE:
+        return choose_index_mode(ntotal, ivf_threshold, ivf_pq_threshold)
+    if configured not in INDEX_MODES:
+        raise ValueError(f"Unknown knowledge index mode: {configured}")
+    if configured in ("ivf_flat", "ivf_pq") and ntotal < MIN_TRAINING_VECTORS:
+        return "flat"
+    return configured
+
+
+def resolve_index_layout(
+    configured_mode: str,
+    configured_codec: str,
+    ntotal: int,
+    ivf_threshold: int = DEFAULT_IVF_THRESHOLD,
+    ivf_pq_threshold: int = DEFAULT_IVF_PQ_THRESHOLD,
+) -> Tuple[str, str]:
+    """Return the ``(mode, codec)`` to build for the configured mode and codec at this corpus size.
+
+    Codecs that need training (SQ8, PQ) wait for enough vectors, like the
+    trained index modes; PQ is built as IVF-PQ and IVF-PQ always uses PQ.
+    """
+    mode = resolve_index_mode(configured_mode, ntotal, ivf_threshold, ivf_pq_threshold)
+    codec = (configured_codec or "none").lower()
+    if codec not in VECTOR_CODECS:
+        raise ValueError(f"Unknown knowledge vector codec: {codec}")
+    if codec in ("sq8", "pq") and ntotal < MIN_TRAINING_VECTORS:
+        codec = "none"
+    if codec == "pq":
+        mode = "ivf_pq"
+    if mode == "ivf_pq":
+        codec = "pq"
+    return mode, codec
+
+
+def index_mode(index) -> str:
+    """Return the backend name of a (possibly layered) FAISS index."""
+    if isinstance(index, LayeredIndex):
+        index = index.base
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer)):
+        return "flat"
+    return type(index).__name__
+
+
+def index_codec(index) -> str:
+    """Return how a (possibly layered) FAISS index stores its vectors."""
+    if isinstance(index, LayeredIndex):
+        index = index.base
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexIVFPQ, faiss.IndexPQ)):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        for codec, qtype in SCALAR_QUANTIZER_TYPES.items():
+            if index.sq.qtype == qtype:
+                return codec
+        return "sq"
+    return "none"
+
+
+def _ivf_nlist(ntotal: int) -> int:
+    """Number of IVF lists: about 4*sqrt(n), with enough training points per list."""
+    nlist = int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // MIN_POINTS_PER_CENTROID, 65536))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest standard sub-quantizer count that divides the dimension with >= 8 dims each."""
+    for m in (96, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 8:
+            return m
+    return 1
+
+
+def build_index(
+    mode: str,
+    dimension: int,
+    training_vectors: Optional[np.ndarray] = None,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    nlist: Optional[int] = None,
+    codec: str = "none",
+):
+    """Create an empty (trained when required) index of the given backend and vector codec."""
+    if mode == "ivf_pq" or codec == "pq":
+        mode, codec = "ivf_pq", "pq"
+    if codec not in VECTOR_CODECS:
+        raise ValueError(f"Unknown knowledge vector codec: {codec}")
+    qtype = SCALAR_QUANTIZER_TYPES.get(codec)
+
+    if mode == "flat":
+        index = faiss.IndexFlatL2(dimension) if qtype is None else faiss.IndexScalarQuantizer(dimension, qtype)
+    elif mode == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m) if qtype is None else faiss.IndexHNSWSQ(dimension, qtype, hnsw_m)
+        index.hnsw.efConstruction = max(40, 2 * hnsw_m)
+    elif mode in ("ivf_flat", "ivf_pq"):
+        if training_vectors is None or len(training_vectors) == 0:
+            raise ValueError(f"Index mode {mode} requires training vectors")
+        nlist = nlist or _ivf_nlist(len(training_vectors))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if mode == "ivf_pq":
+            # 8-bit codes need 256 centroids per sub-quantizer; shrink for small corpora
+            nbits = max(4, min(8, int(math.log2(max(len(training_vectors) // MIN_POINTS_PER_CENTROID, 16)))))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), nbits)
+        elif qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, qtype)
+    else:
+        raise ValueError(f"Unknown knowledge index mode: {mode}")
+
+    if not index.is_trained:
+        if training_vectors is None or len(training_vectors) == 0:
+            raise ValueError(f"Vector codec {codec} requires training vectors")
+        index.train(_training_sample(training_vectors, getattr(index, "nlist", 1)))
+    return index
+
+
+def _training_sample(training_vectors: np.ndarray, nlist: int) -> np.ndarray:
+    """Subsample training vectors to what k-means needs for ``nlist`` lists."""
+    training_vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+    sample_size = min(len(training_vectors), max(nlist * 256, MAX_TRAINING_POINTS))
+    if sample_size < len(training_vectors):
+        rng = np.random.default_rng(0)
+        training_vectors = training_vectors[rng.choice(len(training_vectors), sample_size, replace=False)]
+    return training_vectors
+
+
+def unwrap_index(index):
+    """Return the index that stores the vectors, without an id map around it."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_ids(index) -> np.ndarray:
+    """Return the chunk id of every row of an index (row numbers when it has no id map)."""
+    wrapped = faiss.downcast_index(index)
+    if isinstance(wrapped, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(wrapped.id_map).astype(np.int64, copy=False)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def with_ids(index, ids: np.ndarray):
+    """Wrap a populated index in an ``IndexIDMap2`` labelling row ``i`` with ``ids[i]``.
+
+    FAISS only wraps empty indexes, which would mean re-adding every vector
+    (and rebuilding an HNSW graph), so the id map is attached directly.
+    """
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if len(ids) != index.ntotal:
+        raise ValueError(f"{len(ids)} ids given for an index with {index.ntotal} vectors")
+    wrapper = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    wrapper.index = index
+    wrapper.ntotal = index.ntotal
+    faiss.copy_array_to_vector(ids, wrapper.id_map)
+    wrapper.construct_rev_map()
+    # The wrapper does not own ``index``; keep it alive as long as the wrapper
+    wrapper.referenced_objects = [index]
+    return wrapper
+
+
+def build_id_index(mode: str, vectors: np.ndarray, ids: np.ndarray, hnsw_m: int = DEFAULT_HNSW_M, codec: str = "none"):
+    """Build an ``IndexIDMap2`` of the given backend holding ``vectors`` under stable ``ids``."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.IndexIDMap2(build_index(mode, vectors.shape[1], vectors, hnsw_m=hnsw_m, codec=codec))
+    if len(vectors):
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    return index
+
+
+def extract_vectors(index) -> np.ndarray:
+    """Return all vectors of an index in row order (approximate for PQ indexes)."""
+    if isinstance(index, LayeredIndex):
+        base = np.asarray(index.base_vectors) if index.base_vectors is not None else extract_vectors(index.base)
+        return np.vstack([base, index.delta_vectors()]) if index.delta.ntotal else base
+    index = unwrap_index(index)
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def exact_rerank(
+    queries: np.ndarray, candidate_rows: np.ndarray, vectors: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-rank candidate rows of each query by exact L2 distance and keep the best ``k``.
+
+    ``candidate_rows`` holds row positions into ``vectors`` (-1 for empty
+    slots); only the candidates' vectors are read, so ``vectors`` can be a
+    memory-mapped array much larger than RAM.
+    """
+    nq, width = candidate_rows.shape
+    distances = np.full((nq, width), np.inf, dtype=np.float32)
+    valid = candidate_rows >= 0
+    if valid.any():
+        unique_rows, inverse = np.unique(candidate_rows[valid], return_inverse=True)
+        candidates = np.asarray(vectors[unique_rows], dtype=np.float32)
+        query_index = np.nonzero(valid)[0]
+        diff = candidates[inverse] - queries[query_index]
+        distances[valid] = np.einsum("ij,ij->i", diff, diff)
+
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    rows = np.where(np.isinf(distances), -1, np.take_along_axis(candidate_rows, order, axis=1))
+    if rows.shape[1] < k:
+        pad = k - rows.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+    return distances, rows
+
+
+class RowSelection:
+    """A set of allowed chunk ids, held as a packed bitmap FAISS can filter on."""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = np.asarray(mask, dtype=bool)
+        self.count = int(np.count_nonzero(self.mask))
+        self.bitmap = np.packbits(self.mask, bitorder="little")
+        # The selector reads the bitmap in place; ``self.bitmap`` keeps it alive
+        self.selector = faiss.IDSelectorBitmap(len(self.bitmap), faiss.swig_ptr(self.bitmap))
+
+    def contains(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Mask of the given chunk ids that are selected; ids beyond the bitmap are not."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        inside = (chunk_ids >= 0) & (chunk_ids < len(self.mask))
+        selected = np.zeros(len(chunk_ids), dtype=bool)
+        selected[inside] = self.mask[chunk_ids[inside]]
+        return selected
+
+    def count_below(self, chunk_id: int) -> int:
+        """Number of selected chunks with an id below ``chunk_id``."""
+        return int(np.count_nonzero(self.mask[:chunk_id]))
+
+
+def exhaustive_search(index, queries: np.ndarray, k: int, selector=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Search every vector of an index, so filtered results are never cut short.
+
+    HNSW searches its flat storage and IVF indexes probe every list, which
+    costs the same as a flat scan.
+    """
+    wrapped = faiss.downcast_index(index)
+    if isinstance(wrapped, (faiss.IndexIDMap, faiss.IndexIDMap2)) and index_mode(index) == "hnsw":
+        # The HNSW storage is searched directly, so translate ids here
+        translated = faiss.IDSelectorTranslated(wrapped.id_map, selector) if selector is not None else None
+        distances, rows = exhaustive_search(wrapped.index, queries, k, translated)
+        ids = index_ids(wrapped)
+        return distances, np.where(rows >= 0, ids[np.maximum(rows, 0)], -1)
+
+    mode = index_mode(index)
+    if mode == "hnsw":
+        storage = faiss.downcast_index(unwrap_index(index).storage)
+        params = faiss.SearchParameters(sel=selector) if selector is not None else None
+        return storage.search(queries, k, params=params)
+    if mode in ("ivf_flat", "ivf_pq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        return index.search(queries, k, params=faiss.SearchParametersIVF(sel=selector, nprobe=nlist))
+    return index.search(queries, k, params=search_parameters(index, selector=selector))
+
+
+def search_parameters(index, selector=None, nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH):
+    """Build per-query FAISS search parameters suited to the index backend."""
+    mode = index_mode(index)
+    if mode in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if mode == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+class LayeredIndex:
+    """A read-only snapshot index plus a small in-memory delta index.
+
+    Chunks committed after the snapshot go to the delta layer so the
+    memory-mapped snapshot is never written to (a write would copy it into
+    private memory). Searches query both layers and merge the results by
+    distance.
+
+    Search results are labelled with stable chunk ids rather than row
+    numbers: the snapshot is an ``IndexIDMap2`` (older snapshots without an
+    id map use their row numbers) and delta chunks get consecutive ids from
+    ``next_id``. Ids increase with the row order and are never reused, so
+    they survive compaction; ``rows`` maps them back to row positions.
+
+    When the snapshot stores compressed vectors (``index_codec`` other than
+    ``none``), ``base_vectors`` can hold the exact float32 vectors of its
+    rows, usually memory-mapped from disk. Searches then fetch
+    ``rerank_factor`` times ``k`` candidates from the compressed index and
+    re-rank them by exact distance, so only the candidates' pages are read.
+    """
+
+    def __init__(
+        self,
+        base,
+        delta=None,
+        nprobe: int = DEFAULT_NPROBE,
+        ef_search: int = DEFAULT_EF_SEARCH,
+        next_id: Optional[int] = None,
+        base_vectors: Optional[np.ndarray] = None,
+        rerank_factor: int = DEFAULT_RERANK_FACTOR,
+    ):
+        self.base = base
+        self.d = base.d
+        self.delta = delta if delta is not None else faiss.IndexIDMap2(faiss.IndexFlatL2(self.d))
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.codec = index_codec(base)
+        if base_vectors is not None and base_vectors.shape != (base.ntotal, self.d):
+            raise ValueError(f"Exact vectors of shape {base_vectors.shape} do not match the index")
+        self.base_vectors = base_vectors
+        self.rerank_factor = rerank_factor
+        self._base_ids = index_ids(base)
+        self._delta_ids = array("q", index_ids(self.delta).tolist()) if self.delta.ntotal else array("q")
+        self.base_next_id = int(self._base_ids[-1]) + 1 if len(self._base_ids) else 0
+        self.next_id = max(self.base_next_id, next_id or 0)
+        if self._delta_ids:
+            self.next_id = max(self.next_id, self._delta_ids[-1] + 1)
+
+    @classmethod
+    def empty(cls, dimension: int) -> "LayeredIndex":
+        """Create an empty layered index backed by an exact L2 snapshot layer."""
+        return cls(faiss.IndexFlatL2(dimension))
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + self.delta.ntotal
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """Append vectors to the delta layer and return the chunk ids assigned to them."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.d)
+        ids = np.arange(self.next_id, self.next_id + vectors.shape[0], dtype=np.int64)
+        self.delta.add_with_ids(vectors, ids)
+        self._delta_ids.extend(ids.tolist())
+        self.next_id += vectors.shape[0]
+        return ids
+
+    def ids(self) -> np.ndarray:
+        """Return the chunk id of every row, in row order."""
+        return np.concatenate([self._base_ids, np.frombuffer(self._delta_ids, dtype=np.int64)])
+
+    def rows(self, ids) -> np.ndarray:
+        """Map chunk ids to row positions (-1 for ids that are not in the index)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(ids.shape, -1, dtype=np.int64)
+        delta_ids = np.frombuffer(self._delta_ids, dtype=np.int64)
+        for offset, layer_ids in ((0, self._base_ids), (len(self._base_ids), delta_ids)):
+            if not len(layer_ids):
+                continue
+            positions = np.minimum(np.searchsorted(layer_ids, ids), len(layer_ids) - 1)
+            found = layer_ids[positions] == ids
+            rows[found] = positions[found] + offset
+        return rows
+
+    @property
+    def mode(self) -> str:
+        return index_mode(self.base)
+
+    def search(
+        self, queries: np.ndarray, k: int, selection: Optional[RowSelection] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search both layers and return the merged ``k`` nearest rows per query.
+
+        With a ``selection`` only the selected rows are considered; the filter
+        is applied inside FAISS, so up to ``k`` matching rows are returned.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.d)
+        selector = selection.selector if selection is not None else None
+        results = []
+        if self.base.ntotal:
+            results.append(self._search_base(queries, k, selection))
+        if self.delta.ntotal:
+            params = faiss.SearchParameters(sel=selector) if selector is not None else None
+            results.append(self.delta.search(queries, k, params=params))
+        if not results:
+            return (
+                np.full((queries.shape[0], k), np.inf, dtype=np.float32),
+                np.full((queries.shape[0], k), -1, dtype=np.int64),
+            )
+
+        if len(results) == 1:
+            return results[0]
+
+        distances = np.hstack([d for d, _ in results])
+        labels = np.hstack([i for _, i in results])
+        distances = np.where(labels < 0, np.inf, distances)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+    @property
+    def reranks(self) -> bool:
+        """Whether base searches are re-ranked against exact vectors."""
+        return self.codec != "none" and self.base_vectors is not None and self.rerank_factor > 1
+
+    def _search_base(self, queries: np.ndarray, k: int, selection: Optional[RowSelection]):
+        if not self.reranks:
+            return self._search_base_candidates(queries, k, selection)
+        candidates = min(k * self.rerank_factor, self.base.ntotal)
+        _, labels = self._search_base_candidates(queries, candidates, selection)
+        rows = np.where(labels >= 0, np.searchsorted(self._base_ids, labels), -1)
+        distances, rows = exact_rerank(queries, rows, self.base_vectors, k)
+        return distances, np.where(rows >= 0, self._base_ids[np.maximum(rows, 0)], -1)
+
+    def _search_base_candidates(self, queries: np.ndarray, k: int, selection: Optional[RowSelection]):
+        if selection is None:
+            params = search_parameters(self.base, nprobe=self.nprobe, ef_search=self.ef_search)
+            return self.base.search(queries, k, params=params)
+        if self.mode == "flat":
+            return self.base.search(queries, k, params=search_parameters(self.base, selector=selection.selector))
+
+        # Approximate indexes only visit part of the corpus, so a selective
+        # filter could leave fewer than k hits; fall back to a full scan then
+        selected = selection.count_below(self.base_next_id)
+        if selected < FILTER_EXHAUSTIVE_FRACTION * self.base.ntotal:
+            return exhaustive_search(self.base, queries, k, selection.selector)
+
+        params = search_parameters(self.base, selection.selector, nprobe=self.nprobe, ef_search=self.ef_search)
+        distances, labels = self.base.search(queries, k, params=params)
+        if np.count_nonzero(labels >= 0, axis=1).min() < min(k, selected):
+            return exhaustive_search(self.base, queries, k, selection.selector)
+        return distances, labels
+
+    def delta_vectors(self) -> np.ndarray:
+        """Return the delta layer's vectors in row order."""
+        if not self.delta.ntotal:
+            return np.empty((0, self.d), dtype=np.float32)
+        return self.delta.index.reconstruct_n(0, self.delta.ntotal)
+
+    def exact_vectors(self) -> Optional[np.ndarray]:
+        """Return the exact vectors of every row, or None when compressed snapshot rows have none."""
+        if self.codec != "none" and self.base_vectors is None:
+            return None
+        return extract_vectors(self)
+
+    def merged(self):
+        """Return a standalone ``IndexIDMap2`` containing both layers, for writing a snapshot."""
+        index = faiss.clone_index(unwrap_index(self.base))
+        if self.delta.ntotal:
+            index.add(self.delta_vectors())
+        return with_ids(index, self.ids())
+
+
+def recall_at_k(reference_labels: np.ndarray, candidate_labels: np.ndarray, k: int) -> float:
+    """Fraction of the exact top-k neighbours that the candidate index also returned."""
+    hits = 0
+    total = 0
+    for reference, candidate in zip(reference_labels[:, :k], candidate_labels[:, :k]):
+        expected = set(int(label) for label in reference if label >= 0)
+        hits += len(expected & set(int(label) for label in candidate if label >= 0))
+        total += len(expected)
+    return hits / total if total else 1.0
+
+
+def index_recall(
+    index,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobe: int = DEFAULT_NPROBE,
+    ef_search: int = DEFAULT_EF_SEARCH,
+) -> float:
+    """Measure recall@k of ``index`` against an exact search over ``vectors``."""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, reference = exact.search(queries, k)
+    if isinstance(index, LayeredIndex):
+        # ``vectors`` are in row order, so compare row positions rather than chunk ids
+        _, labels = index.search(queries, k)
+        labels = np.where(labels >= 0, index.rows(labels), -1)
+    else:
+        _, labels = index.search(queries, k, params=search_parameters(index, nprobe=nprobe, ef_search=ef_search))
+    return recall_at_k(reference, labels, k)
+
+
+def index_layouts(modes: Sequence[str], codecs: Sequence[str] = ("none",)) -> List[Tuple[str, str]]:
+    """Distinct ``(mode, codec)`` layouts to build for every mode and codec; PQ always means IVF-PQ."""
+    layouts = []
+    for mode in modes:
+        for codec in codecs:
+            layout = ("ivf_pq", "pq") if mode == "ivf_pq" or codec == "pq" else (mode, codec)
+            if layout not in layouts:
+                layouts.append(layout)
+    return layouts
+
+
+def needs_training(mode: str, codec: str) -> bool:
+    """Whether a layout trains on the vectors, so it needs ``MIN_TRAINING_VECTORS`` of them."""
+    return mode in ("ivf_flat", "ivf_pq") or codec in ("sq8", "pq")
+
+
+def compare_index_modes(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    modes: Sequence[str] = INDEX_MODES,
+    nprobe: int = DEFAULT_NPROBE,
+    ef_search: int = DEFAULT_EF_SEARCH,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    codecs: Sequence[str] = ("none",),
+    rerank_factor: int = DEFAULT_RERANK_FACTOR,
+) -> List[Dict[str, Any]]:
+    """Build each index mode and vector codec over ``vectors`` and report recall@k against the flat index.
+
+    Compressed layouts also report recall and latency after re-ranking
+    ``rerank_factor`` times ``k`` candidates against the exact vectors, and
+    the size of that exact float32 store, which stays on disk.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    dimension = vectors.shape[1]
+
+    exact = faiss.IndexFlatL2(dimension)
+    exact.add(vectors)
+    _, reference = exact.search(queries, k)
+
+    report = []
+    for mode, codec in index_layouts(modes, codecs):
+        if needs_training(mode, codec) and len(vectors) < MIN_TRAINING_VECTORS:
+            report.append(
+                {"mode": mode, "codec": codec, "skipped": f"needs at least {MIN_TRAINING_VECTORS} vectors to train"}
+            )
+            continue
+
+        start = time.perf_counter()
+        index = build_index(mode, dimension, vectors, hnsw_m=hnsw_m, codec=codec)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+
+        params = search_parameters(index, nprobe=nprobe, ef_search=ef_search)
+        start = time.perf_counter()
+        _, labels = index.search(queries, k, params=params)
+        search_seconds = time.perf_counter() - start
+
+        index_bytes = int(faiss.serialize_index(index).nbytes)
+        entry = {
+            "mode": mode,
+            "codec": codec,
+            "recall_at_k": round(recall_at_k(reference, labels, k), 4),
+            "k": k,
+            "build_seconds": round(build_seconds, 4),
+            "search_ms_per_query": round(1000 * search_seconds / max(len(queries), 1), 4),
+            "bytes": index_bytes,
+            "bytes_per_chunk": round(index_bytes / max(len(vectors), 1), 1),
+        }
+        if codec != "none" and rerank_factor > 1:
+            start = time.perf_counter()
+            _, candidates = index.search(queries, min(k * rerank_factor, len(vectors)), params=params)
+            _, labels = exact_rerank(queries, candidates, vectors, k)
+            rerank_seconds = time.perf_counter() - start
+            entry.update(
+                rerank_factor=rerank_factor,
+                recall_at_k_reranked=round(recall_at_k(reference, labels, k), 4),
+                rerank_ms_per_query=round(1000 * rerank_seconds / max(len(queries), 1), 4),
+                exact_vector_bytes=int(vectors.nbytes),
+            )
+        report.append(entry)
+    return report
@@ -0,0 +1,436 @@
+"""File manifest, text extraction, page chunking, progress and locking helpers for knowledge base ingestion."""
+
+import fcntl
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pypdf
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.core.knowledge_store import file_checksum, id_ranges
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".docx")
+# Characters of page text buffered before the complete chunks in it are handed on
+DEFAULT_PAGE_WINDOW = 16000
+# Seconds a single file may spend in text extraction before it is abandoned
+DEFAULT_EXTRACT_TIMEOUT = 300.0
+# Identifies the PDF parser and text normalization in extracted-text cache keys
+PDF_EXTRACTOR = f"pypdf-{pypdf.__version__}/normalize-1"
+
+_INLINE_SPACE = re.compile(r"[^\S\n]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def discover_documents(documents_dir: Path) -> List[Path]:
+    """Return the ingestible files in a documents directory (PDFs, then TXT, then DOCX)."""
+    files: List[Path] = []
+    for extension in SUPPORTED_EXTENSIONS:
+        files.extend(sorted(documents_dir.glob(f"*{extension}")))
+    return files
+
+
+def source_key(path: Path) -> str:
+    """Key identifying a source file in the manifest."""
+    return str(Path(path).resolve())
+
+
+def source_entry(
+    path: Path, chunk_ids: Iterable[int], checksum: Optional[str] = None, stat: Optional[os.stat_result] = None
+) -> Dict[str, Any]:
+    """Build the manifest entry recording an ingested file and the chunks it produced."""
+    stat = stat or os.stat(path)
+    chunk_ids = list(chunk_ids)
+    return {
+        "name": Path(path).name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": checksum or file_checksum(path),
+        "chunks": len(chunk_ids),
+        "chunk_ids": id_ranges(chunk_ids),
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def iter_page_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    chunk_size: int,
+    chunk_overlap: int,
+    window: int = DEFAULT_PAGE_WINDOW,
+    length_function: Callable[[str], int] = len,
+    separators: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    """Split a stream of ``(page_number, text)`` pages into ``(chunk, first_page, last_page)``.
+
+    Pages are joined with blank lines, as if the whole document were split
+    at once, but only about ``window`` characters plus one page are held:
+    once the buffer passes ``window``, every chunk but the last is yielded
+    and the buffer restarts at the last chunk, which may run onto the next
+    page. Page numbers are None for sources without pages.
+
+    ``chunk_size`` and ``chunk_overlap`` are measured with
+    ``length_function`` (characters by default). ``separators`` are regular
+    expressions tried in order, each kept at the start of the piece that
+    follows it; by default the splitter's paragraph, line and word breaks
+    are used.
+    """
+    splitter_options = (
+        {"separators": separators, "is_separator_regex": True, "keep_separator": "start"} if separators else {}
+    )
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=length_function,
+        add_start_index=True,
+        **splitter_options,
+    )
+    buffer = ""
+    # Offset in the buffer at which each buffered page starts
+    page_starts: List[Tuple[int, Optional[int]]] = []
+
+    def page_at(offset: int) -> Optional[int]:
+        page = page_starts[0][1]
+        for start, number in page_starts:
+            if start > offset:
+                break
+            page = number
+        return page
+
+    def split(final: bool) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+        nonlocal buffer, page_starts
+        documents = splitter.create_documents([buffer])
+        carried = None if final or len(documents) < 2 else documents.pop()
+        for document in documents if final or carried is not None else ():
+            start = document.metadata["start_index"]
+            yield document.page_content, page_at(start), page_at(start + len(document.page_content) - 1)
+        if carried is not None:
+            cut = carried.metadata["start_index"]
+            page_starts = [(0, page_at(cut))] + [(start - cut, number) for start, number in page_starts if start > cut]
+            buffer = buffer[cut:]
+
+    for number, text in pages:
+        if buffer:
+            buffer += "\n\n"
+        page_starts.append((len(buffer), number))
+        buffer += text
+        if len(buffer) > window:
+            yield from split(final=False)
+    if buffer:
+        yield from split(final=True)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on: its affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def normalize_page_text(text: str) -> str:
+    """NFKC-normalize extracted text, drop NULs, unify line endings and collapse runs of spaces and blank lines."""
+    text = unicodedata.normalize("NFKC", text).replace("\x00", "").replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(_INLINE_SPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def extract_pdf_pages(path) -> List[Tuple[int, str]]:
+    """Normalized text of every page of a PDF as ``(page_number, text)``, numbered from 1."""
+    return [
+        (doc.metadata.get("page", 0) + 1, normalize_page_text(doc.page_content))
+        for doc in PyPDFLoader(str(path)).lazy_load()
+    ]
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("text extraction timed out")
+
+
+def _extract_with_timeout(extract: Callable[[Any], Any], path, timeout: Optional[float]):
+    """Run ``extract(path)`` in a pool process, interrupted by ``SIGALRM`` after ``timeout`` seconds."""
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract(path)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def iter_parallel_extractions(
+    paths: Iterable[Any],
+    extract: Callable[[Any], Any] = extract_pdf_pages,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_EXTRACT_TIMEOUT,
+) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """Run ``extract`` on each path in a process pool, yielding ``(path, result, error)`` in completion order.
+
+    The pool has ``max_workers`` processes (default: the available CPUs),
+    never more than there are paths, and starts them with ``spawn`` because
+    the service extracts from a threaded process. At most two files per
+    process are in flight, so results waiting for the consumer stay
+    bounded. ``extract`` must be importable by the pool processes. A file
+    still extracting after ``timeout`` seconds is interrupted and reported
+    with a ``TimeoutError``; if a pool process dies, every file it did not
+    finish is reported with the ``BrokenProcessPool`` error.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+    workers = max(1, min(max_workers or available_cpus(), len(paths)))
+    queued = iter(paths)
+    running = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        broken: Optional[BaseException] = None
+        while True:
+            if broken is None:
+                try:
+                    for path in itertools.islice(queued, 2 * workers - len(running)):
+                        running[executor.submit(_extract_with_timeout, extract, path, timeout)] = path
+                except BrokenProcessPool as e:
+                    broken = e
+                    yield path, None, e
+            if broken is not None:
+                for path in queued:
+                    yield path, None, broken
+            if not running:
+                return
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                try:
+                    yield path, future.result(), None
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        broken = e
+                    yield path, None, e
+
+
+def iter_cached_extractions(
+    paths: Iterable[Any],
+    cache=None,
+    extract: Callable[[Any], Any] = extract_pdf_pages,
+    extractor: str = PDF_EXTRACTOR,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_EXTRACT_TIMEOUT,
+) -> Iterator[Tuple[Any, Any, Optional[str], Optional[BaseException]]]:
+    """Yield ``(path, pages, checksum, error)`` for each path, parsing only files missing from ``cache``.
+
+    Files are looked up in the ``ExtractedTextCache`` by content hash and
+    ``extractor`` first and hits are yielded at once; the rest are parsed
+    by ``iter_parallel_extractions`` and stored as they complete.
+    ``checksum`` is the hash of the content the pages came from, or None if
+    the file could not be read.
+    """
+    checksums: Dict[Any, str] = {}
+    misses = []
+    for path in paths:
+        try:
+            checksum = file_checksum(Path(path))
+        except OSError as e:
+            yield path, None, None, e
+            continue
+        pages = cache.get(checksum, extractor) if cache is not None else None
+        if pages is not None:
+            yield path, pages, checksum, None
+        else:
+            checksums[path] = checksum
+            misses.append(path)
+
+    for path, pages, error in iter_parallel_extractions(misses, extract, max_workers, timeout):
+        if error is None and cache is not None:
+            cache.put(checksums[path], extractor, pages)
+        yield path, pages, checksums[path], error
+
+
+def plan_directory_ingestion(
+    documents_dir: Path,
+    files: List[Path],
+    sources: Dict[str, Dict[str, Any]],
+    force: bool = False,
+) -> Tuple[List[Path], Dict[str, Dict[str, Any]], List[str]]:
+    """Compare a directory listing with the manifest.
+
+    Returns ``(changed, touched, removed)``: files that are new or whose
+    content changed, manifest entries to refresh for files that were only
+    touched (same content hash, new mtime), and manifest keys of files that
+    no longer exist in ``documents_dir``. Size and mtime are checked first so
+    unchanged files are never re-read; with ``force`` every file is changed.
+    """
+    changed: List[Path] = []
+    touched: Dict[str, Dict[str, Any]] = {}
+    present = set()
+
+    for path in files:
+        key = source_key(path)
+        present.add(key)
+        entry = sources.get(key)
+        if force or entry is None:
+            changed.append(path)
+            continue
+
+        stat = os.stat(path)
+        if entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            continue
+
+        checksum = file_checksum(path)
+        if checksum == entry.get("sha256"):
+            touched[key] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        else:
+            changed.append(path)
+
+    directory = source_key(documents_dir)
+    removed = [key for key in sources if key not in present and os.path.dirname(key) == directory]
+    return changed, touched, removed
+
+
+class IngestionStatus:
+    """Thread-safe progress of background knowledge ingestion for status endpoints.
+
+    ``state`` moves from idle to running to complete or failed; it is
+    skipped when another worker process holds the ingestion lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {"state": "idle"}
+
+    def start(self):
+        with self._lock:
+            self._status = {
+                "state": "running",
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "files_total": 0,
+                "files_done": 0,
+                "files_failed": 0,
+                "current_file": None,
+                "chunks_embedded": 0,
+                "chunks_total": 0,
+            }
+
+    def update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def increment(self, field: str, amount: int = 1):
+        with self._lock:
+            self._status[field] = self._status.get(field, 0) + amount
+
+    def finish(self, state: str, error: Optional[str] = None):
+        with self._lock:
+            self._status.update(state=state, current_file=None, finished_at=datetime.now(timezone.utc).isoformat())
+            if error:
+                self._status["error"] = error
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._status["state"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._status)
+
+
+class ReadWriteLock:
+    """Lock held either shared by any number of readers or exclusively by one writer.
+
+    A waiting writer goes first: readers that arrive after it wait until it
+    is done, so a steady stream of searches cannot starve ingestion. The
+    writer may re-acquire either side and a reader may read again, but a
+    reader cannot upgrade to a writer.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        depth = getattr(self._local, "depth", 0)
+        with self._condition:
+            if self._writer != me and not depth:
+                while self._writer is not None or self._writers_waiting:
+                    self._condition.wait()
+            self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                if getattr(self._local, "depth", 0):
+                    raise RuntimeError("A read lock cannot be upgraded to a write lock")
+                self._writers_waiting += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._writers_waiting -= 1
+                self._writer, self._writer_depth = me, 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+@contextmanager
+def ingestion_lock(path: Path, blocking: bool = True):
+    """Hold an exclusive inter-process lock so only one worker ingests at a time.
+
+    Yields True when the lock was acquired, or False when ``blocking`` is
+    False and another process already holds it.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock_file:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
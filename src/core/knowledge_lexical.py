@@ -0,0 +1,212 @@
+"""In-process BM25 inverted index for lexical and hybrid knowledge search."""
+
+import json
+import math
+import re
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.knowledge_metadata import Column
+
+# BM25 term frequency saturation and document length normalization
+DEFAULT_BM25_K1 = 1.2
+DEFAULT_BM25_B = 0.75
+# Reciprocal rank fusion constant: larger values flatten the weight of top ranks
+DEFAULT_RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Words too common in clinical prose to tell chunks apart; they only bloat postings
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric terms of ``text`` without stopwords (``NYHA Class IV`` -> nyha, class, iv)."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = DEFAULT_RRF_K) -> np.ndarray:
+    """Fuse ranked row lists (best first, -1 for empty slots) and return rows by fused score.
+
+    Each list contributes ``1 / (k + rank)`` for every row it contains; ties
+    keep the order in which rows first appear in the lists.
+    """
+    rows = np.concatenate([np.asarray(ranking, dtype=np.int64) for ranking in rankings])
+    ranks = np.concatenate([np.arange(1, len(ranking) + 1) for ranking in rankings])
+    valid = rows >= 0
+    rows, ranks = rows[valid], ranks[valid]
+    if not len(rows):
+        return rows
+    unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    scores = np.bincount(inverse, weights=1.0 / (k + ranks))
+    order = np.lexsort((first, -scores))
+    return unique_rows[order]
+
+
+class BM25Index:
+    """BM25 inverted index from terms to chunk rows, kept in compact postings arrays.
+
+    Postings of a snapshot are one CSR layout (``offsets`` into parallel
+    ``int32`` row and ``uint16`` term frequency arrays) that is saved beside
+    the FAISS index, so workers load it instead of re-tokenizing every chunk.
+    Rows added afterwards go to small per-term tail arrays that are merged
+    into the CSR arrays when the index is saved.
+    """
+
+    def __init__(self, k1: float = DEFAULT_BM25_K1, b: float = DEFAULT_BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+
+    def _reset(self, source=None):
+        self._terms: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._frequencies = np.empty(0, dtype=np.uint16)
+        self._tail: Dict[int, Tuple[array, array]] = {}
+        self._lengths = Column(np.uint32)
+        self._total_length = 0
+        self._source = source
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def sync(self, documents: Sequence[str]):
+        """Index any rows of ``documents`` added since the last sync.
+
+        An index loaded from a snapshot adopts the first texts it is synced
+        with; a different text sequence afterwards is re-indexed from scratch.
+        """
+        if (self._source is not None and documents is not self._source) or len(documents) < len(self):
+            self._reset()
+        self._source = documents
+        for row in range(len(self), len(documents)):
+            self.add(documents[row])
+
+    def add(self, text: str):
+        """Index the next row."""
+        row = len(self)
+        tokens = tokenize(text)
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term = self._terms.get(token)
+            if term is None:
+                term = self._terms[token] = len(self._terms)
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            tail = self._tail.get(term)
+            if tail is None:
+                tail = self._tail[term] = (array("i"), array("H"))
+            tail[0].append(row)
+            tail[1].append(min(count, 0xFFFF))
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+
+    def postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows containing ``term`` and the term's frequency in each."""
+        rows, frequencies = [], []
+        if term + 1 < len(self._offsets):
+            start, end = self._offsets[term], self._offsets[term + 1]
+            rows.append(self._rows[start:end])
+            frequencies.append(self._frequencies[start:end])
+        tail = self._tail.get(term)
+        if tail is not None:
+            rows.append(np.frombuffer(tail[0], dtype=np.int32))
+            frequencies.append(np.frombuffer(tail[1], dtype=np.uint16))
+        if not rows:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+        if len(rows) == 1:
+            return rows[0], frequencies[0]
+        return np.concatenate(rows), np.concatenate(frequencies)
+
+    def search(
+        self, text: str, k: int, allowed: Optional[Callable[[np.ndarray], np.ndarray]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the ``k`` best rows for ``text`` and their BM25 scores, best first.
+
+        ``allowed`` receives the matching rows and returns a mask of those
+        that may be returned (metadata filters, deleted chunks).
+        """
+        terms = {self._terms[token] for token in tokenize(text) if token in self._terms}
+        rows_total = len(self)
+        if not terms or not rows_total:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        lengths = self._lengths.view()
+        average_length = max(self._total_length / rows_total, 1e-9)
+        scores = np.zeros(rows_total, dtype=np.float32)
+        for term in terms:
+            rows, frequencies = self.postings(term)
+            idf = math.log(1.0 + (rows_total - len(rows) + 0.5) / (len(rows) + 0.5))
+            frequencies = frequencies.astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / average_length)
+            scores[rows] += idf * frequencies * (self.k1 + 1.0) / (frequencies + norm)
+
+        candidates = np.flatnonzero(scores > 0)
+        if allowed is not None and len(candidates):
+            candidates = candidates[allowed(candidates)]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order].astype(np.int64), scores[candidates[order]]
+
+    @property
+    def nbytes(self) -> int:
+        tail = sum(rows.itemsize * len(rows) + freqs.itemsize * len(freqs) for rows, freqs in self._tail.values())
+        return self._offsets.nbytes + self._rows.nbytes + self._frequencies.nbytes + self._lengths.nbytes + tail
+
+    def _merged_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR arrays holding the snapshot postings followed by the tail of every term."""
+        counts = np.zeros(len(self._terms), dtype=np.int64)
+        base_terms = len(self._offsets) - 1
+        counts[:base_terms] = np.diff(self._offsets)
+        for term, (rows, _) in self._tail.items():
+            counts[term] += len(rows)
+        offsets = np.zeros(len(self._terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        postings_rows = np.empty(offsets[-1], dtype=np.int32)
+        frequencies = np.empty(offsets[-1], dtype=np.uint16)
+        for term in range(len(self._terms)):
+            rows, term_frequencies = self.postings(term)
+            postings_rows[offsets[term] : offsets[term + 1]] = rows
+            frequencies[offsets[term] : offsets[term + 1]] = term_frequencies
+        return offsets, postings_rows, frequencies
+
+    def save(self, f):
+        """Write the postings to an open binary file as an ``.npz`` archive (no pickle)."""
+        offsets, rows, frequencies = self._merged_postings()
+        terms = sorted(self._terms, key=self._terms.get)
+        header = {"k1": self.k1, "b": self.b, "terms": terms}
+        np.savez(
+            f,
+            offsets=offsets,
+            rows=rows,
+            frequencies=frequencies,
+            lengths=self._lengths.view(),
+            header=np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+        )
+
+    @classmethod
+    def load(cls, path) -> "BM25Index":
+        """Read postings written by ``save``."""
+        with np.load(path, allow_pickle=False) as arrays:
+            header = json.loads(arrays["header"].tobytes().decode("utf-8"))
+            index = cls(k1=header["k1"], b=header["b"])
+            index._offsets = arrays["offsets"]
+            index._rows = arrays["rows"]
+            index._frequencies = arrays["frequencies"]
+            index._lengths = Column(np.uint32, arrays["lengths"])
+        index._terms = {term: position for position, term in enumerate(header["terms"])}
+        index._total_length = int(index._lengths.view().sum(dtype=np.int64))
+        return index
+
+    @classmethod
+    def build(cls, documents: Iterable[str], k1: float = DEFAULT_BM25_K1, b: float = DEFAULT_BM25_B) -> "BM25Index":
+        """Index every text of ``documents`` in order."""
+        index = cls(k1=k1, b=b)
+        for text in documents:
+            index.add(text)
+        return index
@@ -0,0 +1,480 @@
+"""Columnar, dictionary-encoded chunk metadata for the knowledge service."""
+
+import hashlib
+import json
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Fields held in columns; any other key is kept in a sparse per-row dict
+STRING_FIELDS = ("title", "category", "source")
+FIELDS = (
+    "id",
+    "document_id",
+    "title",
+    "category",
+    "tags",
+    "source",
+    "chunk_index",
+    "total_chunks",
+    "added_at",
+    "content_hash",
+    "page",
+    "page_end",
+    "token_count",
+)
+# Pages a chunk of a paged source (PDF) starts and ends on; absent for other chunks
+PAGE_FIELDS = ("page", "page_end")
+# Small counts kept in uint16 columns: page numbers and the chunk's token count
+SMALL_FIELDS = PAGE_FIELDS + ("token_count",)
+_MAX_SMALL = np.iinfo(np.uint16).max
+_FIELD_BITS = {field: 1 << bit for bit, field in enumerate(FIELDS)}
+# Set beside the field bits for rows whose ``added_at`` carries a UTC offset
+_UTC_BIT = 1 << len(FIELDS)
+
+_EPOCH = datetime(1970, 1, 1)
+_HASH_BYTES = 16
+
+
+def _encode_time(value: Any) -> Optional[Tuple[int, bool]]:
+    """Microseconds since the epoch of a naive or UTC ISO timestamp and whether it has an offset, or None."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    utc = parsed.tzinfo is not None
+    if utc and parsed.utcoffset() != timedelta(0):
+        return None
+    delta = parsed.replace(tzinfo=None) - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    if _decode_time(micros, utc) != value:
+        return None
+    return micros, utc
+
+
+def _decode_time(micros: int, utc: bool = False) -> str:
+    moment = _EPOCH + timedelta(microseconds=int(micros))
+    return moment.replace(tzinfo=timezone.utc).isoformat() if utc else moment.isoformat()
+
+
+def _encode_hash(value: Any) -> Optional[bytes]:
+    """The 16 raw bytes of an MD5 hex digest, or None if ``value`` is not one."""
+    if not isinstance(value, str) or len(value) != 2 * _HASH_BYTES or value != value.lower():
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return None
+
+
+class Vocabulary:
+    """Interned values of one field; rows store the small integer code of their value."""
+
+    def __init__(self, values: Iterable[Hashable] = ()):
+        self.values: List[Hashable] = []
+        self._codes: Dict[Hashable, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: Hashable) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: Hashable) -> Optional[int]:
+        return self._codes.get(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class Column:
+    """A growable NumPy column; ``view`` returns the filled part without copying."""
+
+    def __init__(self, dtype, values=None):
+        self._data = np.asarray(values if values is not None else [], dtype=dtype)
+        self._size = len(self._data)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, row: int):
+        return self._data[row]
+
+    def __setitem__(self, row, value):
+        self.view()[row] = value
+
+    def append(self, value):
+        if self._size == len(self._data):
+            grown = np.empty(max(16, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[: self._size] = self._data[: self._size]
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._size * self._data.dtype.itemsize
+
+
+class ChunkMetadata(Sequence):
+    """Chunk metadata held column by column instead of as one dict per chunk.
+
+    Titles, categories, sources and tag lists are interned, so each row
+    stores small integer codes; ids, chunk positions, page numbers, token
+    counts and timestamps live in NumPy columns and content hashes as raw
+    16-byte digests. Indexing a row rebuilds its dict, so callers keep using
+    ``metadata[row]["title"]``. Category counts, the latest ``added_at`` and
+    the totals of near-duplicate ``linked_chunks`` are maintained as rows are
+    appended and updated, making stats independent of the number of chunks.
+    """
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()):
+        self._ids = Column(np.int64)
+        self._chunk_index = Column(np.int32)
+        self._total_chunks = Column(np.int32)
+        self._added_at = Column(np.int64)
+        self._present = Column(np.uint16)
+        self._small = {field: Column(np.uint16) for field in SMALL_FIELDS}
+        self._codes = {field: Column(np.int32) for field in STRING_FIELDS + ("tags",)}
+        self._vocabularies = {field: Vocabulary() for field in STRING_FIELDS + ("tags",)}
+        self._hashes = bytearray()
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        self._category_counts: List[int] = []
+        # Microseconds and UTC flag of the latest ``added_at``
+        self._last_added_at: Optional[Tuple[int, bool]] = None
+        # Chunks linked to a near-duplicate instead of being indexed, and their characters
+        self._linked = [0, 0]
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if row < 0 or row >= len(self):
+            raise IndexError("chunk metadata row out of range")
+
+        present = int(self._present[row])
+        meta: Dict[str, Any] = {}
+        for field in FIELDS:
+            if not present & _FIELD_BITS[field]:
+                continue
+            if field == "id":
+                meta["id"] = int(self._ids[row])
+            elif field == "document_id":
+                meta["document_id"] = int(self._ids[row]) - int(self._chunk_index[row])
+            elif field == "tags":
+                meta["tags"] = list(self._vocabularies["tags"].values[self._codes["tags"][row]])
+            elif field in STRING_FIELDS:
+                meta[field] = self._vocabularies[field].values[self._codes[field][row]]
+            elif field == "chunk_index":
+                meta["chunk_index"] = int(self._chunk_index[row])
+            elif field == "total_chunks":
+                meta["total_chunks"] = int(self._total_chunks[row])
+            elif field == "added_at":
+                meta["added_at"] = _decode_time(self._added_at[row], bool(present & _UTC_BIT))
+            elif field == "content_hash":
+                meta["content_hash"] = self._hashes[row * _HASH_BYTES : (row + 1) * _HASH_BYTES].hex()
+            elif field in SMALL_FIELDS:
+                meta[field] = int(self._small[field][row])
+        extras = self._extras.get(row)
+        if extras:
+            meta.update(extras)
+        return meta
+
+    def __eq__(self, other):
+        if isinstance(other, (ChunkMetadata, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def append(self, meta: Dict[str, Any]):
+        """Append one chunk's metadata dict."""
+        row = len(self)
+        present = 0
+        extras = {}
+        for key, value in meta.items():
+            if key not in _FIELD_BITS:
+                extras[key] = value
+            else:
+                present |= _FIELD_BITS[key]
+
+        self._ids.append(int(meta.get("id", -1)))
+        self._chunk_index.append(int(meta.get("chunk_index", 0)))
+        self._total_chunks.append(int(meta.get("total_chunks", 0)))
+
+        for field in STRING_FIELDS:
+            self._codes[field].append(self._vocabularies[field].code(meta.get(field)))
+        self._codes["tags"].append(self._vocabularies["tags"].code(tuple(meta.get("tags") or ())))
+        if "tags" in meta and not isinstance(meta["tags"], list):
+            # Only lists round-trip through the tag vocabulary
+            present &= ~_FIELD_BITS["tags"]
+            extras["tags"] = meta["tags"]
+
+        added_at = _encode_time(meta.get("added_at"))
+        self._added_at.append(added_at[0] if added_at is not None else 0)
+        if "added_at" in meta and added_at is None:
+            present &= ~_FIELD_BITS["added_at"]
+            extras["added_at"] = meta["added_at"]
+        if added_at is not None:
+            if added_at[1]:
+                present |= _UTC_BIT
+            if self._last_added_at is None or added_at[0] > self._last_added_at[0]:
+                self._last_added_at = added_at
+
+        content_hash = _encode_hash(meta.get("content_hash"))
+        self._hashes += content_hash or bytes(_HASH_BYTES)
+        if "content_hash" in meta and content_hash is None:
+            present &= ~_FIELD_BITS["content_hash"]
+            extras["content_hash"] = meta["content_hash"]
+
+        for field in SMALL_FIELDS:
+            value = meta.get(field)
+            fits = isinstance(value, (int, np.integer)) and not isinstance(value, bool) and 0 <= value <= _MAX_SMALL
+            self._small[field].append(int(value) if fits else 0)
+            if field in meta and not fits:
+                present &= ~_FIELD_BITS[field]
+                extras[field] = value
+
+        # ``document_id`` is derived from the id and chunk position; keep it verbatim if it is not
+        if "document_id" in meta and meta["document_id"] != self._ids[row] - self._chunk_index[row]:
+            present &= ~_FIELD_BITS["document_id"]
+            extras["document_id"] = meta["document_id"]
+
+        self._present.append(present)
+        if extras:
+            self._extras[row] = extras
+            self._count_links(extras.get("linked_chunks"), 1)
+
+        category = self._codes["category"][row]
+        if category == len(self._category_counts):
+            self._category_counts.append(0)
+        self._category_counts[category] += 1
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        for meta in records:
+            self.append(meta)
+
+    def update(self, row: int, fields: Dict[str, Any]):
+        """Change ``total_chunks`` or fields kept outside the columns of an existing row."""
+        for key, value in fields.items():
+            if key == "total_chunks":
+                self._total_chunks[row] = int(value)
+                self._present[row] = self._present[row] | _FIELD_BITS["total_chunks"]
+            elif key in _FIELD_BITS:
+                raise ValueError(f"Chunk metadata field '{key}' cannot be changed in place")
+            else:
+                extras = self._extras.setdefault(row, {})
+                if key == "linked_chunks":
+                    self._count_links(extras.get(key), -1)
+                    self._count_links(value, 1)
+                extras[key] = value
+
+    def assign_ids(self, ids: Iterable[int], start: int = 0):
+        """Set the chunk ids of rows from ``start``; each row's ``document_id`` follows."""
+        ids = np.asarray(list(ids) if not isinstance(ids, np.ndarray) else ids, dtype=np.int64)
+        end = min(len(self), start + len(ids))
+        self._ids[start:end] = ids[: end - start]
+        bits = _FIELD_BITS["id"] | _FIELD_BITS["document_id"]
+        self._present[start:end] = self._present.view()[start:end] | bits
+        for row in range(start, end):
+            extras = self._extras.get(row)
+            if extras and "document_id" in extras:
+                del extras["document_id"]
+
+    def take(self, rows: Iterable[int]) -> "ChunkMetadata":
+        """Return a new ``ChunkMetadata`` holding only the given rows, in that order."""
+        rows = np.asarray(list(rows) if not isinstance(rows, np.ndarray) else rows, dtype=np.int64)
+        taken = ChunkMetadata()
+        taken._ids = Column(np.int64, self._ids.view()[rows])
+        taken._chunk_index = Column(np.int32, self._chunk_index.view()[rows])
+        taken._total_chunks = Column(np.int32, self._total_chunks.view()[rows])
+        taken._added_at = Column(np.int64, self._added_at.view()[rows])
+        taken._present = Column(np.uint16, self._present.view()[rows])
+        taken._small = {field: Column(np.uint16, column.view()[rows]) for field, column in self._small.items()}
+        for field, codes in self._codes.items():
+            taken._codes[field] = Column(np.int32, codes.view()[rows])
+            taken._vocabularies[field] = Vocabulary(self._vocabularies[field].values)
+        hashes = np.frombuffer(bytes(self._hashes), dtype=np.uint8).reshape(-1, _HASH_BYTES)
+        taken._hashes = bytearray(hashes[rows].tobytes())
+        taken._extras = {
+            new_row: dict(self._extras[int(row)]) for new_row, row in enumerate(rows) if int(row) in self._extras
+        }
+        taken._recount()
+        return taken
+
+    def _recount(self):
+        counts = np.bincount(self._codes["category"].view(), minlength=len(self._vocabularies["category"]))
+        self._category_counts = counts.tolist()
+        rows = np.flatnonzero(self._present.view() & _FIELD_BITS["added_at"])
+        self._last_added_at = None
+        if len(rows):
+            row = rows[np.argmax(self._added_at.view()[rows])]
+            self._last_added_at = (int(self._added_at[row]), bool(self._present[row] & _UTC_BIT))
+        self._linked = [0, 0]
+        for extras in self._extras.values():
+            self._count_links(extras.get("linked_chunks"), 1)
+
+    def _count_links(self, links: Optional[List[list]], sign: int):
+        if links:
+            self._linked[0] += sign * len(links)
+            self._linked[1] += sign * sum(link[2] for link in links)
+
+    def linked_totals(self, rows: Optional[np.ndarray] = None) -> Tuple[int, int]:
+        """``(linked chunks, characters)`` of near-duplicate links held by all rows, or only by ``rows``.
+
+        The totals of all rows are kept up to date; only the given rows are looked up.
+        """
+        if rows is None:
+            return self._linked[0], self._linked[1]
+        chunks = characters = 0
+        for row in np.asarray(rows, dtype=np.int64).tolist():
+            links = self._extras.get(row, {}).get("linked_chunks")
+            if links:
+                chunks += len(links)
+                characters += sum(link[2] for link in links)
+        return chunks, characters
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Chunk id of every row."""
+        return self._ids.view()
+
+    @property
+    def chunk_indexes(self) -> np.ndarray:
+        """Position of every row's chunk within its document."""
+        return self._chunk_index.view()
+
+    @property
+    def token_counts(self) -> np.ndarray:
+        """Token count of every row's chunk, 0 where it was not recorded at ingestion."""
+        return self._small["token_count"].view()
+
+    @property
+    def added_at(self) -> np.ndarray:
+        """``added_at`` of every row in microseconds since the epoch (0 when unknown)."""
+        return self._added_at.view()
+
+    def values(self, field: str) -> List[Hashable]:
+        """The interned values of ``title``, ``category``, ``source`` or ``tags`` (as tuples)."""
+        return list(self._vocabularies[field].values)
+
+    def codes(self, field: str) -> np.ndarray:
+        """Per-row vocabulary codes of ``field``."""
+        return self._codes[field].view()
+
+    def filter_fields(self, row: int) -> Tuple[int, Optional[str], Optional[str], Tuple[str, ...]]:
+        """``(id, category, source, tags)`` of a row without building its dict."""
+        vocabularies, codes = self._vocabularies, self._codes
+        return (
+            int(self._ids[row]),
+            vocabularies["category"].values[codes["category"][row]],
+            vocabularies["source"].values[codes["source"][row]],
+            vocabularies["tags"].values[codes["tags"][row]],
+        )
+
+    def hash_keys(self, rows: np.ndarray) -> np.ndarray:
+        """Content hash of each row as two ``uint64`` words, for vectorized duplicate checks.
+
+        Rows whose content hash is not an MD5 digest are keyed by the MD5 of
+        the stored value; rows without one all share the zero key.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        keys = np.frombuffer(self._hashes, dtype=np.uint64).reshape(-1, 2)[rows]
+        if self._extras:
+            for position, row in enumerate(rows.tolist()):
+                extras = self._extras.get(row)
+                if extras and "content_hash" in extras:
+                    digest = hashlib.md5(str(extras["content_hash"]).encode("utf-8")).digest()
+                    keys[position] = np.frombuffer(digest, dtype=np.uint64)
+        return keys
+
+    def extra_values(self, field: str) -> Dict[int, Any]:
+        """Rows that hold ``field`` outside the columns, with its value."""
+        return {row: extras[field] for row, extras in self._extras.items() if field in extras}
+
+    def category_counts(self, exclude_rows: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Chunk count per category (chunks without one count as ``uncategorized``).
+
+        Counts are kept up to date on append; only the categories of the
+        ``exclude_rows`` (deleted chunks) are looked up.
+        """
+        counts = list(self._category_counts)
+        if exclude_rows is not None and len(exclude_rows):
+            excluded = np.bincount(self.codes("category")[exclude_rows], minlength=len(counts))
+            counts = [count - int(removed) for count, removed in zip(counts, excluded)]
+
+        result: Dict[str, int] = {}
+        for value, count in zip(self._vocabularies["category"].values, counts):
+            if count > 0:
+                label = "uncategorized" if value is None else value
+                result[label] = result.get(label, 0) + count
+        return result
+
+    @property
+    def last_added_at(self) -> Optional[str]:
+        """The most recent ``added_at`` of any row, or None when no row has one."""
+        return _decode_time(*self._last_added_at) if self._last_added_at is not None else None
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns (vocabularies and extras excluded)."""
+        columns = [self._ids, self._chunk_index, self._total_chunks, self._added_at, self._present]
+        columns += list(self._small.values()) + list(self._codes.values())
+        return sum(column.nbytes for column in columns) + len(self._hashes)
+
+    def save(self, f):
+        """Write the columns to an open binary file as an ``.npz`` archive (no pickle)."""
+        vocabularies = {
+            field: [list(value) if field == "tags" else value for value in vocabulary.values]
+            for field, vocabulary in self._vocabularies.items()
+        }
+        header = {"vocabularies": vocabularies, "extras": [[row, extras] for row, extras in self._extras.items()]}
+        arrays = {
+            "ids": self._ids.view(),
+            "chunk_index": self._chunk_index.view(),
+            "total_chunks": self._total_chunks.view(),
+            "added_at": self._added_at.view(),
+            "present": self._present.view(),
+            "hashes": np.frombuffer(bytes(self._hashes), dtype=np.uint8),
+            "header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+        }
+        arrays.update({f"codes_{field}": codes.view() for field, codes in self._codes.items()})
+        arrays.update({field: column.view() for field, column in self._small.items()})
+        np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "ChunkMetadata":
+        """Read columns written by ``save``."""
+        metadata = cls()
+        with np.load(path, allow_pickle=False) as arrays:
+            header = json.loads(arrays["header"].tobytes().decode("utf-8"))
+            metadata._ids = Column(np.int64, arrays["ids"])
+            metadata._chunk_index = Column(np.int32, arrays["chunk_index"])
+            metadata._total_chunks = Column(np.int32, arrays["total_chunks"])
+            metadata._added_at = Column(np.int64, arrays["added_at"])
+            metadata._present = Column(np.uint16, arrays["present"])
+            metadata._hashes = bytearray(arrays["hashes"].tobytes())
+            for field in metadata._codes:
+                metadata._codes[field] = Column(np.int32, arrays[f"codes_{field}"])
+            for field in SMALL_FIELDS:
+                values = arrays[field] if field in arrays.files else np.zeros(len(metadata._ids), dtype=np.uint16)
+                metadata._small[field] = Column(np.uint16, values)
+        for field, values in header["vocabularies"].items():
+            metadata._vocabularies[field] = Vocabulary(tuple(v) if field == "tags" else v for v in values)
+        metadata._extras = {int(row): extras for row, extras in header["extras"]}
+        metadata._recount()
+        return metadata
@@ -0,0 +1,163 @@
+"""One-time migration of knowledge stores written by older releases.
+
+Older releases pickled the chunk metadata: ``faiss_index.bin`` plus
+``metadata.pkl``, or a ``chunks.<v>.txt`` text file and ``metadata.<v>.pkl``
+per snapshot. Those files are only read here, by
+``scripts/migrate_knowledge_store.py``, and never when a worker loads the
+store. Unpickling is restricted to the builtins, NumPy arrays and chunk
+metadata such files hold.
+"""
+
+import io
+import json
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+from src.core.knowledge_index import LayeredIndex, read_index
+from src.core.knowledge_metadata import ChunkMetadata
+from src.core.knowledge_store import (
+    LEGACY_INDEX_NAME,
+    LEGACY_METADATA_NAME,
+    MANIFEST_NAME,
+    TEXT_FILE_FORMAT_VERSION,
+    KnowledgeStore,
+    KnowledgeStoreError,
+    assign_chunk_ids,
+)
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+# Globals that pickled metadata refers to; anything else is refused
+_NUMPY_GLOBALS = {
+    ("numpy", "ndarray"),
+    ("numpy", "dtype"),
+    ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy.core.multiarray", "scalar"),
+    ("numpy._core.multiarray", "_reconstruct"),
+    ("numpy._core.multiarray", "scalar"),
+}
+_METADATA_GLOBAL = ("src.core.knowledge_metadata", "ChunkMetadata")
+
+
+class _PickledChunkMetadata:
+    """Stands in for ``ChunkMetadata`` while unpickling; keeps the pickled column state."""
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.state = state
+
+
+class _MetadataUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str):
+        if (module, name) == _METADATA_GLOBAL:
+            return _PickledChunkMetadata
+        if (module, name) in _NUMPY_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Refusing to unpickle {module}.{name} from a legacy knowledge store")
+
+
+def _read_pickle(path: Path) -> Any:
+    with open(path, "rb") as f:
+        return _MetadataUnpickler(f).load()
+
+
+def _chunk_metadata(state: Dict[str, Any]) -> ChunkMetadata:
+    """Rebuild pickled column state as ``ChunkMetadata`` by way of its ``.npz`` format."""
+    header = {
+        "vocabularies": {
+            field: [list(value) if field == "tags" else value for value in values]
+            for field, values in state["vocabularies"].items()
+        },
+        "extras": [[int(row), extras] for row, extras in state["extras"].items()],
+    }
+    arrays = {
+        "ids": state["ids"],
+        "chunk_index": state["chunk_index"],
+        "total_chunks": state["total_chunks"],
+        "added_at": state["added_at"],
+        "present": state["present"],
+        "hashes": np.frombuffer(bytes(state["hashes"]), dtype=np.uint8),
+        "header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8),
+    }
+    arrays.update({f"codes_{field}": codes for field, codes in state["codes"].items()})
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    buffer.seek(0)
+    return ChunkMetadata.load(buffer)
+
+
+def pending_migration(directory: Path) -> Optional[str]:
+    """Describe the old layout of the store in ``directory``, or None when it needs no migration."""
+    directory = Path(directory)
+    manifest_path = directory / MANIFEST_NAME
+    if manifest_path.exists():
+        with open(manifest_path, "r") as f:
+            if json.load(f).get("format") == TEXT_FILE_FORMAT_VERSION:
+                return "snapshot with a text file and pickled metadata per version"
+        return None
+    if (directory / LEGACY_INDEX_NAME).exists() and (directory / LEGACY_METADATA_NAME).exists():
+        return f"{LEGACY_INDEX_NAME} plus {LEGACY_METADATA_NAME}"
+    return None
+
+
+def migrate_knowledge_store(directory: Path) -> Optional[int]:
+    """Rewrite an old knowledge store in the current format and return the new version.
+
+    Returns None when the store needs no migration. Legacy files are removed
+    once their snapshot is committed; another process that migrated first
+    leaves the current format on disk either way.
+    """
+    directory = Path(directory)
+    layout = pending_migration(directory)
+    if layout is None:
+        return None
+    logger.info(f"Migrating knowledge store {directory} ({layout}) to the current format")
+    # Files of older releases have no recorded sizes; hash them all before rewriting
+    store = KnowledgeStore(directory, verify_checksums=True)
+    if (directory / MANIFEST_NAME).exists():
+        return _migrate_text_file_snapshot(store)
+    return _migrate_legacy(store)
+
+
+def _migrate_text_file_snapshot(store: KnowledgeStore) -> Optional[int]:
+    manifest = store._read_manifest()
+    snapshot = manifest["snapshot"]
+    base = read_index(store._verify(snapshot["index"], snapshot["index_checksum"]), mmap=False)
+    offsets = np.load(store._verify(snapshot["offsets"], snapshot["offsets_checksum"]), allow_pickle=False)
+    data = store._verify(snapshot["texts"], snapshot["texts_checksum"]).read_bytes()
+    documents = [data[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    pickled = _read_pickle(store._verify(snapshot["metadata"], snapshot["metadata_checksum"]))
+    if isinstance(pickled, _PickledChunkMetadata):
+        metadata = _chunk_metadata(pickled.state)
+    elif isinstance(pickled, list):
+        metadata = ChunkMetadata(pickled)
+    else:
+        raise KnowledgeStoreError(f"Unexpected metadata in snapshot file {snapshot['metadata']}")
+
+    index = LayeredIndex(base, next_id=snapshot.get("next_id"), base_vectors=store._load_base_vectors(snapshot))
+    vectors, delta_documents, delta_metadata = store._read_delta(manifest)
+    if vectors:
+        index.add(np.vstack(vectors))
+        documents.extend(delta_documents)
+        metadata.extend(delta_metadata)
+    assign_chunk_ids(metadata, index.ids())
+    return store.write_snapshot(index, documents, metadata, expected_version=manifest["version"])
+
+
+def _migrate_legacy(store: KnowledgeStore) -> Optional[int]:
+    index_path = store.directory / LEGACY_INDEX_NAME
+    metadata_path = store.directory / LEGACY_METADATA_NAME
+    data = _read_pickle(metadata_path)
+    if not isinstance(data, dict):
+        raise KnowledgeStoreError(f"Unexpected contents in {LEGACY_METADATA_NAME}")
+
+    version = store.write_snapshot(
+        faiss.read_index(str(index_path)), data.get("documents", []), data.get("metadata", [])
+    )
+    for legacy in (index_path, metadata_path):
+        legacy.unlink()
+    return version
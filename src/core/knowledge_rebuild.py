@@ -0,0 +1,255 @@
+"""Building a new index generation beside the live one: throttled embedding, text reconstruction and recall checks."""
+
+import hashlib
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+from src.core.knowledge_context import overlap_length
+from src.core.knowledge_dedup import NearDuplicateIndex, link_near_duplicates
+from src.core.knowledge_embeddings import embedding_model_name
+
+# Embedding tokens per minute a rebuild may spend (0 disables throttling)
+DEFAULT_REBUILD_TOKENS_PER_MINUTE = 1_000_000
+# Held-out queries checked against both generations before the swap
+DEFAULT_REBUILD_RECALL_QUERIES = 100
+# How far the new generation's recall may fall below the live one's
+DEFAULT_REBUILD_RECALL_TOLERANCE = 0.02
+# Chunks retrieved per recall query; a hit is any of them from the expected document
+REBUILD_RECALL_K = 10
+# Words taken from the middle of a sampled chunk to form a recall query
+_QUERY_WORDS = 12
+
+_WORD = re.compile(r"\w+")
+
+
+class ThrottledEmbeddings:
+    """Embedder wrapper that spends at most ``tokens_per_minute`` on document batches.
+
+    Each batch reserves the time its tokens take at that rate and waits for
+    its slot, so concurrent embedding workers share one budget. Query
+    embeddings pass straight through. ``model`` is the wrapped embedder's,
+    so cache keys are unchanged.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        tokens_per_minute: float,
+        count_tokens: Callable[[str], int],
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.embeddings = embeddings
+        self.model = embedding_model_name(embeddings)
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens_embedded = 0
+        self.seconds_throttled = 0.0
+        self._count_tokens = count_tokens
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._available_at = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        """Seconds to wait before a batch of ``tokens`` may be sent."""
+        if self.tokens_per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._available_at)
+            self._available_at = start + 60.0 * tokens / self.tokens_per_minute
+            return start - now
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(self._count_tokens(text) for text in texts)
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        vectors = self.embeddings.embed_documents(texts)
+        with self._lock:
+            self.tokens_embedded += tokens
+            self.seconds_throttled += max(0.0, wait)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+def reconstruct_pages(chunks: Sequence[Tuple[str, Optional[int]]]) -> List[Tuple[Optional[int], str]]:
+    """Rebuild a document's ``(page, text)`` pages from its chunks in document order.
+
+    Consecutive chunks are joined at their shared overlap (or a line break
+    where they share none) and chunks contained in the previous one are
+    skipped. A chunk's new text is credited to the page it starts on, so
+    page boundaries are approximate to within one chunk.
+    """
+    pages: List[Tuple[Optional[int], str]] = []
+    previous = None
+    for text, page in chunks:
+        if previous is not None and text in previous:
+            continue
+        if previous is None:
+            piece = text
+        else:
+            overlap = overlap_length(previous, text)
+            piece = text[overlap:] if overlap else "\n" + text
+        if pages and pages[-1][0] == page:
+            pages[-1] = (page, pages[-1][1] + piece)
+        else:
+            pages.append((page, piece.lstrip()))
+        previous = text
+    return pages
+
+
+def recall_queries(
+    texts: Sequence[str], keys: Sequence[Hashable], count: int, seed: int = 0
+) -> List[Tuple[str, Hashable]]:
+    """Held-out ``(query, expected key)`` pairs: a run of words from the middle of sampled chunks.
+
+    The sample is seeded, so both generations are checked with the same
+    queries, and queries are never embedded into either index.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for position in rng.permutation(len(texts)).tolist():
+        words = _WORD.findall(texts[position])
+        if len(words) < _QUERY_WORDS:
+            continue
+        start = (len(words) - _QUERY_WORDS) // 2
+        queries.append((" ".join(words[start : start + _QUERY_WORDS]), keys[position]))
+        if len(queries) >= count:
+            break
+    return queries
+
+
+def known_item_recall(
+    query_vectors: np.ndarray,
+    vectors: np.ndarray,
+    row_keys: Sequence[Hashable],
+    expected: Sequence[Hashable],
+    k: int = REBUILD_RECALL_K,
+) -> float:
+    """Share of queries whose expected document holds one of their ``k`` nearest chunks (exact search)."""
+    if not len(expected) or not len(vectors):
+        return 0.0
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    _, rows = exact.search(np.ascontiguousarray(query_vectors, dtype=np.float32), min(k, len(vectors)))
+    hits = sum(key in {row_keys[row] for row in found.tolist() if row >= 0} for key, found in zip(expected, rows))
+    return hits / len(expected)
+
+
+class GenerationBuilder:
+    """Chunks, vectors and metadata of an index generation being built beside the live one.
+
+    Documents are added under the id they have in the live generation and
+    can be dropped again when they are deleted before the swap. Chunk ids
+    are only assigned by ``finish``, once the swap is certain, so live
+    ingestion keeps handing out ids meanwhile. Near-duplicate chunks are
+    linked within the generation as they are at ingestion.
+    """
+
+    def __init__(self, dedup_threshold: Optional[float] = None):
+        self.texts: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+        self.keys: List[Hashable] = []
+        self._vectors: List[np.ndarray] = []
+        self._dropped: set = set()
+        self._rows: Dict[Hashable, range] = {}
+        self._dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    @property
+    def document_keys(self) -> List[Hashable]:
+        return list(self._rows)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if not self._vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        if len(self._vectors) > 1:
+            self._vectors = [np.vstack(self._vectors)]
+        return self._vectors[0]
+
+    def add_document(
+        self,
+        key: Hashable,
+        chunks: List[Tuple[str, Optional[int], Optional[int], int]],
+        fields: Dict[str, Any],
+        scope: str,
+        embed: Callable[[List[str], List[str]], np.ndarray],
+    ) -> int:
+        """Link, embed and add a document's ``(chunk, page, page_end, tokens)`` chunks; returns chunks embedded."""
+        texts = [chunk for chunk, _, _, _ in chunks]
+        hashes = [hashlib.md5(text.encode()).hexdigest() for text in texts]
+        kept, links, signatures = list(range(len(texts))), {}, [None] * len(texts)
+        if self._dedup is not None:
+            kept, links, signatures = link_near_duplicates(
+                self._dedup, texts, scope, is_live=lambda row: row not in self._dropped
+            )
+        if not kept:
+            return 0
+
+        matrix = embed([texts[position] for position in kept], [hashes[position] for position in kept])
+        first_row = len(self.texts)
+        linked_chunks = []
+        for position, (kind, target) in sorted(links.items()):
+            canonical = hashes[target] if kind == "position" else self.records[target]["content_hash"]
+            linked_chunks.append([position, canonical, len(texts[position])])
+
+        for chunk_index, position in enumerate(kept):
+            chunk, page, page_end, tokens = chunks[position]
+            record = dict(
+                fields,
+                chunk_index=chunk_index,
+                total_chunks=len(kept),
+                content_hash=hashes[position],
+                token_count=tokens,
+            )
+            if page is not None:
+                record["page"] = page
+                record["page_end"] = page_end
+            if position != chunk_index:
+                record["source_position"] = position
+            if chunk_index == 0 and linked_chunks:
+                record["linked_chunks"] = linked_chunks
+            self.texts.append(chunk)
+            self.records.append(record)
+            self.keys.append(key)
+            if self._dedup is not None and signatures[chunk_index] is not None:
+                self._dedup.add(first_row + chunk_index, signatures[chunk_index], scope)
+        self._vectors.append(np.asarray(matrix, dtype=np.float32))
+        self._rows[key] = range(first_row, len(self.texts))
+        return len(kept)
+
+    def drop_document(self, key: Hashable):
+        """Leave a document out of the generation (it was deleted from the live one)."""
+        rows = self._rows.pop(key, None)
+        if rows is not None:
+            self._dropped.update(rows)
+
+    def finish(
+        self, first_id: int
+    ) -> Tuple[np.ndarray, np.ndarray, List[str], List[Dict[str, Any]], Dict[Hashable, range]]:
+        """``(ids, vectors, texts, metadata, ids by document key)`` with chunk ids from ``first_id``."""
+        rows = [row for row in range(len(self.texts)) if row not in self._dropped]
+        ids = np.arange(first_id, first_id + len(rows), dtype=np.int64)
+        new_ids = dict(zip(rows, ids.tolist()))
+        metadata = []
+        for row, chunk_id in zip(rows, ids.tolist()):
+            record = dict(self.records[row], id=chunk_id)
+            record["document_id"] = chunk_id - record["chunk_index"]
+            metadata.append(record)
+        documents = {
+            key: range(new_ids[document_rows.start], new_ids[document_rows.start] + len(document_rows))
+            for key, document_rows in self._rows.items()
+        }
+        vectors = self.vectors[rows] if rows else np.empty((0, self.vectors.shape[1]), dtype=np.float32)
+        return ids, vectors, [self.texts[row] for row in rows], metadata, documents
@@ -0,0 +1,845 @@
+"""Versioned, crash-safe on-disk storage for the knowledge base index."""
+
+import base64
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import zlib
+from collections.abc import Sequence
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import faiss
+
+from src.core.knowledge_index import LayeredIndex, index_codec, index_ids, read_index, with_ids
+from src.core.knowledge_lexical import BM25Index
+from src.core.knowledge_metadata import ChunkMetadata, Column
+from src.utils.logger import get_logger
+
+logger = get_logger()
+
+FORMAT_VERSION = 3
+# Snapshots with one text file per version and pickled metadata, migrated by knowledge_migration
+TEXT_FILE_FORMAT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+LEGACY_INDEX_NAME = "faiss_index.bin"
+LEGACY_METADATA_NAME = "metadata.pkl"
+
+DEFAULT_COMPACT_RATIO = 0.25
+DEFAULT_COMPACT_MIN_RECORDS = 500
+
+# Where a chunk's text lives in the blob file; negative offsets index uncommitted texts
+TEXT_ROW_DTYPE = np.dtype([("offset", "<i8"), ("length", "<u4"), ("crc", "<u4")])
+
+
+class KnowledgeStoreError(Exception):
+    """Raised when the on-disk knowledge store is missing or inconsistent."""
+
+
+class KnowledgeStoreMigrationRequired(KnowledgeStoreError):
+    """Raised when loading a store an older release wrote; it has to be migrated first."""
+
+    def __init__(self, directory: Path):
+        super().__init__(
+            f"Knowledge store {directory} was written by an older release - "
+            f"run scripts/migrate_knowledge_store.py --knowledge-dir {directory} once before starting"
+        )
+
+
+class KnowledgeStoreGenerationChanged(KnowledgeStoreError):
+    """Raised when committing chunks embedded for a generation that another process has replaced."""
+
+
+def _fsync_directory(directory: Path):
+    """Flush directory entries so a completed rename survives a crash."""
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, write_fn: Callable[[Any], None]) -> str:
+    """Write a file via a temp file plus rename and return its sha256 checksum.
+
+    ``write_fn`` receives a binary file object. Readers either see the old
+    file or the complete new one, never a partially written file.
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        checksum = file_checksum(Path(tmp_name))
+        os.replace(tmp_name, path)
+        _fsync_directory(path.parent)
+        return checksum
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def file_checksum(path: Path) -> str:
+    """Return the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def id_ranges(ids: Iterable[int]) -> List[List[int]]:
+    """Compress chunk ids into sorted ``[start, end)`` ranges for the manifest."""
+    ranges: List[List[int]] = []
+    for i in sorted(set(int(i) for i in ids)):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def expand_id_ranges(ranges: Iterable[List[int]]) -> List[int]:
+    """Expand ``[start, end)`` ranges back into chunk ids."""
+    return [i for start, end in ranges for i in range(start, end)]
+
+
+def assign_chunk_ids(metadata: List[Dict[str, Any]], ids: Iterable[int]):
+    """Record stable chunk ids in chunk metadata.
+
+    A document's chunks are added together and get consecutive ids, so its
+    ``document_id`` is the id of its first chunk.
+    """
+    if isinstance(metadata, ChunkMetadata):
+        metadata.assign_ids(ids)
+        return
+    for meta, chunk_id in zip(metadata, ids):
+        meta["id"] = int(chunk_id)
+        meta["document_id"] = int(chunk_id) - int(meta.get("chunk_index", 0))
+
+
+def _shift_ranges(ranges: List[List[int]], first: int, shift: int) -> List[List[int]]:
+    return [[start + shift, end + shift] if start >= first else [start, end] for start, end in ranges]
+
+
+def _encode_record(vector: np.ndarray, text_row, metadata: Dict[str, Any]) -> bytes:
+    """Encode one chunk as a checksummed delta log line; its text is an offset, length and CRC32 in the blob."""
+    payload = json.dumps(
+        {
+            "vector": base64.b64encode(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).decode("ascii"),
+            "text": [int(value) for value in text_row],
+            "metadata": metadata,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return f"{zlib.crc32(payload):08x} ".encode("ascii") + payload + b"\n"
+
+
+def _decode_record(line: bytes) -> Tuple[np.ndarray, Any, Dict[str, Any]]:
+    """Decode and verify one delta log line.
+
+    The text is returned as its blob row, or as a string for records written
+    before texts moved to the blob.
+    """
+    crc, _, payload = line.rstrip(b"\n").partition(b" ")
+    if int(crc, 16) != zlib.crc32(payload):
+        raise KnowledgeStoreError("Delta log record failed checksum verification")
+    record = json.loads(payload)
+    vector = np.frombuffer(base64.b64decode(record["vector"]), dtype=np.float32)
+    text = record["document"] if "document" in record else tuple(record["text"])
+    return vector, text, record["metadata"]
+
+
+class ChunkTextView(Sequence):
+    """Chunk texts read lazily from the store's shared, memory-mapped text blob.
+
+    Committed texts live back to back in one append-only blob file; each row
+    holds the offset, length and CRC32 of its text, so only rows that are
+    actually read get decoded (and verified). Texts added in this process
+    and not yet committed are kept in a small in-memory tail.
+    """
+
+    def __init__(self, blob_path: Optional[Path] = None, rows: Optional[np.ndarray] = None):
+        self.blob_path = Path(blob_path) if blob_path is not None else None
+        self._mmap = None
+        self._rows = Column(TEXT_ROW_DTYPE, rows)
+        self._tail: List[str] = []
+        self.snapshot_size = len(self._rows)
+        if self.blob_path is not None and self.blob_path.exists() and self.blob_path.stat().st_size:
+            # Map now so rows stay readable after a newer snapshot removes the blob
+            self._remap()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+
+        position = int(position)
+        if position < 0:
+            position += len(self)
+        if position < 0 or position >= len(self):
+            raise IndexError("chunk position out of range")
+        offset, length, crc = self._rows[position]
+        if offset < 0:
+            return self._tail[-1 - offset]
+        data = self._read(int(offset), int(length))
+        if zlib.crc32(data) != crc:
+            raise KnowledgeStoreError(f"Chunk text at row {position} failed checksum verification")
+        return data.decode("utf-8")
+
+    def __eq__(self, other):
+        if isinstance(other, (ChunkTextView, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if length == 0:
+            return b""
+        if self._mmap is None or offset + length > len(self._mmap):
+            # Committed texts were appended since the blob was mapped
+            self._remap()
+        return self._mmap[offset : offset + length]
+
+    def _remap(self):
+        with open(self.blob_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def append(self, text: str):
+        self._rows.append((-1 - len(self._tail), 0, 0))
+        self._tail.append(text)
+
+    def append_row(self, row: Tuple[int, int, int]):
+        """Append a committed text by its blob offset, length and CRC32."""
+        self._rows.append(tuple(row))
+
+    def extend(self, texts):
+        """Append texts, or the rows of another view over the same blob without reading them."""
+        if not isinstance(texts, ChunkTextView):
+            for text in texts:
+                self.append(text)
+            return
+        if texts.blob_path is not None and self.blob_path is None:
+            self.blob_path = texts.blob_path
+        for position, (offset, length, crc) in enumerate(texts._rows.view().tolist()):
+            if offset < 0 or texts.blob_path != self.blob_path:
+                self.append(texts[position])
+            else:
+                self.append_row((offset, length, crc))
+
+    def rows(self) -> np.ndarray:
+        """The offset, length and CRC32 of every row (negative offsets are uncommitted texts)."""
+        return self._rows.view()
+
+    @staticmethod
+    def write(texts: Iterable[str], blob_file, start: int = 0) -> np.ndarray:
+        """Append texts to an open binary blob file positioned at ``start`` and return their rows."""
+        rows = []
+        position = start
+        for text in texts:
+            encoded = text.encode("utf-8")
+            blob_file.write(encoded)
+            rows.append((position, len(encoded), zlib.crc32(encoded)))
+            position += len(encoded)
+        return np.array(rows, dtype=TEXT_ROW_DTYPE)
+
+
+class KnowledgeStore:
+    """Snapshot plus append-only delta log persistence for the knowledge index.
+
+    A snapshot is a FAISS index file, a table locating each chunk's text in
+    the text blob, and a columnar metadata file, all named after the version
+    that wrote them. Snapshot files are never modified after they are
+    written, so they are memory-mapped read-only and shared by every worker
+    process. Chunks added after the snapshot are appended to a delta log.
+    Chunk texts of both are appended to one blob file, which is only
+    rewritten when the index is rebuilt; rows carry a CRC32 checked on read,
+    so loading never reads the texts.
+    ``manifest.json`` is the single commit point: it records the current
+    version, snapshot checksums and how many delta bytes are committed, and is
+    replaced atomically on every commit under an inter-process file lock.
+
+    The manifest also carries the tombstoned (logically deleted) chunk ids
+    and the ingested source files, so both change atomically with the chunks
+    they describe, and the ``generation`` (embedding model and chunker) the
+    vectors were built with; a rebuilt generation is swapped in as a new
+    snapshot. Chunk ids are stable: the snapshot index maps rows to ids
+    and delta chunks continue from the snapshot's ``next_id``. Ids are never
+    reused, and tombstones are dropped once a snapshot no longer holds them.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        compact_ratio: float = DEFAULT_COMPACT_RATIO,
+        compact_min_records: int = DEFAULT_COMPACT_MIN_RECORDS,
+        use_mmap: bool = True,
+        verify_checksums: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / MANIFEST_NAME
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self.use_mmap = use_mmap
+        self.verify_checksums = verify_checksums
+        # Snapshot files this process has hashed, so a store without recorded sizes is hashed once
+        self._verified: Set[Tuple[str, str]] = set()
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.needs_reload = False
+        # How far ids of the chunks in the last commit moved because another process committed first
+        self.id_shift = 0
+        self._manifest_stat = None
+        self._pending: List[Tuple[np.ndarray, str, Dict[str, Any]]] = []
+        self._pending_deletes: Set[int] = set()
+        self._pending_sources: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._pending_generation: Optional[Dict[str, Any]] = None
+
+    @property
+    def version(self) -> int:
+        """Version of the loaded or last committed state (0 when nothing has been committed)."""
+        return self.manifest["version"] if self.manifest else 0
+
+    @property
+    def generation(self) -> Optional[Dict[str, Any]]:
+        """Embedding model and chunker that produced the committed vectors, or None if not recorded."""
+        return self.manifest.get("generation") if self.manifest else None
+
+    @property
+    def has_pending(self) -> bool:
+        """Whether chunks, deletions or source changes have been staged since the last commit."""
+        return bool(self._pending or self._pending_deletes or self._pending_sources)
+
+    @property
+    def tombstones(self) -> List[int]:
+        """Committed chunk ids that have been deleted, in ascending order."""
+        return expand_id_ranges(self.manifest.get("tombstones", [])) if self.manifest else []
+
+    @property
+    def pending_deletes(self) -> Set[int]:
+        """Chunk ids staged for deletion by the next commit."""
+        return set(self._pending_deletes)
+
+    @property
+    def sources(self) -> Dict[str, Dict[str, Any]]:
+        """Ingested source files (committed plus staged), keyed by path."""
+        sources = dict(self.manifest.get("sources", {})) if self.manifest else {}
+        for path, entry in self._pending_sources.items():
+            if entry is None:
+                sources.pop(path, None)
+            else:
+                sources[path] = entry
+        return sources
+
+    @staticmethod
+    def _next_id(manifest: Optional[Dict[str, Any]]) -> int:
+        """Id the next committed chunk will get (snapshots before stable ids used row numbers)."""
+        if not manifest:
+            return 0
+        snapshot = manifest["snapshot"]
+        return snapshot.get("next_id", snapshot["records"]) + manifest["delta"]["records"]
+
+    @contextmanager
+    def _locked(self):
+        """Serialize commits across worker processes."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / LOCK_NAME, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _stat_manifest(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not self.manifest_path.exists():
+            return None
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format") not in (TEXT_FILE_FORMAT_VERSION, FORMAT_VERSION):
+            raise KnowledgeStoreError(f"Unsupported knowledge store format: {manifest.get('format')}")
+        return manifest
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
+        atomic_write(self.manifest_path, lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+        self.manifest = manifest
+        self._manifest_stat = self._stat_manifest()
+
+    def _verify(self, name: str, checksum: str, size: Optional[int] = None) -> Path:
+        """Check a snapshot file against the manifest and return its path.
+
+        Snapshot files are immutable and hashed as they are written, so loads
+        and refreshes only compare the size the manifest records. The sha256
+        checksum is read in full with ``verify_checksums``, or once per
+        process for files of stores written before sizes were recorded.
+        """
+        path = self.directory / name
+        if not path.exists():
+            raise KnowledgeStoreError(f"Snapshot file {name} is missing")
+        if size is not None and path.stat().st_size != size:
+            raise KnowledgeStoreError(f"Snapshot file {name} does not have the {size} bytes the manifest records")
+        if self.verify_checksums or (size is None and (name, checksum) not in self._verified):
+            if file_checksum(path) != checksum:
+                raise KnowledgeStoreError(f"Snapshot file {name} failed checksum verification")
+            self._verified.add((name, checksum))
+        return path
+
+    def _snapshot_file(self, snapshot: Dict[str, Any], key: str) -> Path:
+        return self._verify(snapshot[key], snapshot[f"{key}_checksum"], snapshot.get(f"{key}_bytes"))
+
+    def _blob_path(self, manifest: Dict[str, Any]) -> Optional[Path]:
+        return self.directory / manifest["texts"]["path"] if "texts" in manifest else None
+
+    def _read_delta(self, manifest: Dict[str, Any], start: int = 0):
+        """Read committed delta records between byte ``start`` and the committed length.
+
+        Texts are returned as a ``ChunkTextView`` over the blob, so they are
+        only read when a row is accessed.
+        """
+        delta = manifest["delta"]
+        vectors, documents, metadata = [], ChunkTextView(self._blob_path(manifest)), []
+        if delta["bytes"] > start:
+            with open(self.directory / delta["path"], "rb") as f:
+                f.seek(start)
+                # Anything past the committed length is an interrupted write
+                for line in f.read(delta["bytes"] - start).splitlines(keepends=True):
+                    vector, text, meta = _decode_record(line)
+                    vectors.append(vector)
+                    if isinstance(text, str):
+                        documents.append(text)
+                    else:
+                        documents.append_row(text)
+                    metadata.append(meta)
+        return vectors, documents, metadata
+
+    def has_update(self) -> bool:
+        """Cheaply check whether another process committed a newer version.
+
+        Only the manifest's inode, size and mtime are compared, so this is
+        a single ``stat`` call unless something actually changed.
+        """
+        current = self._stat_manifest()
+        if current == self._manifest_stat:
+            return False
+        try:
+            manifest = self._read_manifest()
+        except (OSError, ValueError, KnowledgeStoreError):
+            return False
+        self._manifest_stat = current
+        return manifest is not None and manifest["version"] != self.version
+
+    def read_update(self) -> Optional[Tuple[np.ndarray, ChunkTextView, List[Dict[str, Any]]]]:
+        """Read chunks committed since the loaded version by another process.
+
+        Returns the new delta records when the snapshot is unchanged, or
+        ``None`` when a new snapshot was written and a full ``load`` is needed.
+        """
+        manifest = self._read_manifest()
+        if manifest is None or self.manifest is None:
+            return None
+        if (
+            manifest["snapshot"] != self.manifest["snapshot"]
+            or manifest["delta"]["path"] != self.manifest["delta"]["path"]
+            or manifest.get("texts", {}).get("path") != self.manifest.get("texts", {}).get("path")
+        ):
+            return None
+
+        vectors, documents, metadata = self._read_delta(manifest, start=self.manifest["delta"]["bytes"])
+        self.manifest = manifest
+        self._manifest_stat = self._stat_manifest()
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        return matrix, documents, metadata
+
+    def load(self) -> Optional[Tuple[LayeredIndex, ChunkTextView, ChunkMetadata]]:
+        """Load the committed state as ``(index, documents, metadata)``.
+
+        Returns ``None`` when no store exists yet. Stores written by older
+        releases, with pickled metadata, raise ``KnowledgeStoreMigrationRequired``
+        until ``scripts/migrate_knowledge_store.py`` has rewritten them. Chunk
+        texts are not read: the returned view maps the blob and decodes rows
+        on access.
+        """
+        self._clear_pending()
+        self.needs_reload = False
+        self._manifest_stat = self._stat_manifest()
+        manifest = self._read_manifest()
+
+        if manifest is None:
+            if (self.directory / LEGACY_INDEX_NAME).exists() and (self.directory / LEGACY_METADATA_NAME).exists():
+                raise KnowledgeStoreMigrationRequired(self.directory)
+            return None
+        if manifest["format"] == TEXT_FILE_FORMAT_VERSION:
+            raise KnowledgeStoreMigrationRequired(self.directory)
+
+        snapshot = manifest["snapshot"]
+        base = read_index(self._snapshot_file(snapshot, "index"), mmap=self.use_mmap)
+        rows = np.load(
+            self._snapshot_file(snapshot, "rows"),
+            mmap_mode="r" if self.use_mmap else None,
+            allow_pickle=False,
+        )
+        documents = ChunkTextView(self._blob_path(manifest), rows)
+        metadata = ChunkMetadata.load(self._snapshot_file(snapshot, "metadata"))
+        index = LayeredIndex(base, next_id=snapshot.get("next_id"), base_vectors=self._load_base_vectors(snapshot))
+        vectors, delta_documents, delta_metadata = self._read_delta(manifest)
+        if len(vectors) != manifest["delta"]["records"]:
+            raise KnowledgeStoreError("Delta log is shorter than the manifest records")
+        if vectors:
+            index.add(np.vstack(vectors))
+            documents.extend(delta_documents)
+            metadata.extend(delta_metadata)
+        assign_chunk_ids(metadata, index.ids())
+
+        if index.ntotal != len(documents) or len(documents) != len(metadata):
+            raise KnowledgeStoreError(f"Index has {index.ntotal} vectors but store has {len(documents)} chunks")
+
+        self.manifest = manifest
+        logger.info(
+            f"Loaded knowledge store version {manifest['version']} "
+            f"({snapshot['records']} snapshot + {manifest['delta']['records']} delta chunks)"
+        )
+        return index, documents, metadata
+
+    def load_lexical(self) -> Optional[BM25Index]:
+        """BM25 postings of the loaded snapshot's chunks, or None when the snapshot has none."""
+        snapshot = self.manifest["snapshot"] if self.manifest else {}
+        if "lexical" not in snapshot:
+            return None
+        return BM25Index.load(self._snapshot_file(snapshot, "lexical"))
+
+    def _load_base_vectors(self, snapshot: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Exact vectors of a compressed index, read only for re-ranking candidates."""
+        if "vectors" not in snapshot:
+            return None
+        return np.load(
+            self._snapshot_file(snapshot, "vectors"),
+            mmap_mode="r" if self.use_mmap else None,
+            allow_pickle=False,
+        )
+
+    def stage(
+        self,
+        vectors: np.ndarray,
+        documents: List[str],
+        metadata: List[Dict[str, Any]],
+        generation: Optional[Dict[str, Any]] = None,
+    ):
+        """Stage newly indexed chunks; nothing is written until ``commit``.
+
+        ``generation`` is the generation the vectors were embedded for; it is
+        checked against the committed generation when the chunks are committed.
+        """
+        if self._pending_generation is None:
+            self._pending_generation = generation
+        for vector, document, meta in zip(vectors, documents, metadata):
+            self._pending.append((np.array(vector, dtype=np.float32), document, dict(meta)))
+
+    def restage_metadata(self, metadata: List[Dict[str, Any]]):
+        """Replace the metadata of the last ``len(metadata)`` staged chunks (fields known only once a document ends)."""
+        start = len(self._pending) - len(metadata)
+        if start < 0:
+            raise KnowledgeStoreError("Cannot restage metadata of chunks that were not staged")
+        for position, meta in enumerate(metadata, start):
+            vector, document, _ = self._pending[position]
+            self._pending[position] = (vector, document, dict(meta))
+
+    def stage_delete(self, ids: Iterable[int]):
+        """Stage tombstones for chunk ids; deleted chunks stay in the index until compaction."""
+        self._pending_deletes.update(int(i) for i in ids)
+
+    def stage_source(self, path: str, entry: Optional[Dict[str, Any]]):
+        """Stage the manifest entry of an ingested source file (``None`` removes it)."""
+        self._pending_sources[path] = entry
+
+    def discard_pending(self):
+        """Drop staged chunks, deletions and source changes that have not been committed."""
+        self._clear_pending()
+
+    def _clear_pending(self):
+        self._pending = []
+        self._pending_deletes = set()
+        self._pending_sources = {}
+        self._pending_generation = None
+
+    def _apply_pending_state(self, manifest: Dict[str, Any], previous: Optional[Dict[str, Any]], shift: int = 0):
+        """Merge staged tombstones and source entries into a manifest being written.
+
+        ``shift`` moves ids of chunks staged by this process when another
+        process committed first and its chunks took the ids we expected.
+        """
+        first_staged = self._next_id(self.manifest)
+        tombstones = expand_id_ranges(previous.get("tombstones", [])) if previous else []
+        tombstones.extend(i + shift if i >= first_staged else i for i in self._pending_deletes)
+        manifest["tombstones"] = id_ranges(tombstones)
+
+        sources = dict(previous.get("sources", {})) if previous else {}
+        for path, entry in self._pending_sources.items():
+            if entry is None:
+                sources.pop(path, None)
+            else:
+                sources[path] = dict(entry, chunk_ids=_shift_ranges(entry.get("chunk_ids", []), first_staged, shift))
+        manifest["sources"] = sources
+
+    def commit(
+        self,
+        index,
+        documents,
+        metadata: List[Dict[str, Any]],
+        lexical: Optional[BM25Index] = None,
+        generation: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Durably commit staged chunks and return the new version.
+
+        Staged chunks are appended to the delta log. When the log grows past
+        ``compact_ratio`` of the snapshot, a full snapshot of ``index``,
+        ``documents``, ``metadata`` and the ``lexical`` postings of
+        ``documents`` is written instead. ``generation`` is recorded if the
+        store has none yet.
+
+        If another process committed since this one loaded, the staged chunks
+        are appended after its records and ``needs_reload`` is set so the
+        caller reloads the canonical row order from disk. If it swapped in
+        another generation, vectors staged for the old one would be mixed into
+        it, so ``KnowledgeStoreGenerationChanged`` is raised and nothing is
+        written; the staged state is kept for the caller to discard.
+        """
+        with self._locked():
+            self.id_shift = 0
+            on_disk = self._read_manifest()
+            if on_disk is None:
+                version = self._write_snapshot_locked(
+                    index, documents, metadata, lexical=lexical, generation=generation
+                )
+                self.needs_reload = True
+                return version
+            staged = self._pending_generation
+            if self._pending and staged and on_disk.get("generation") and staged != on_disk["generation"]:
+                raise KnowledgeStoreGenerationChanged(
+                    f"Chunks staged for index generation {staged} cannot be committed to generation "
+                    f"{on_disk['generation']}"
+                )
+            generation = on_disk.get("generation") or generation
+
+            conflict = on_disk["version"] != self.version
+            if not self.has_pending:
+                return self.version
+
+            delta = on_disk["delta"]
+            delta_records = delta["records"] + len(self._pending)
+            threshold = max(self.compact_min_records, self.compact_ratio * on_disk["snapshot"]["records"])
+            if not conflict and delta_records >= threshold:
+                version = self._write_snapshot_locked(
+                    index, documents, metadata, lexical=lexical, generation=generation
+                )
+                self.needs_reload = True
+                return version
+
+            texts = on_disk["texts"]
+            text_rows, text_bytes = self._append_texts(texts, [text for _, text, _ in self._pending])
+            with open(self.directory / delta["path"], "ab") as f:
+                # Drop any bytes left behind by an interrupted commit
+                f.truncate(delta["bytes"])
+                for (vector, _, meta), text_row in zip(self._pending, text_rows.tolist()):
+                    f.write(_encode_record(vector, text_row, meta))
+                f.flush()
+                os.fsync(f.fileno())
+                delta_bytes = f.tell()
+
+            manifest = dict(on_disk)
+            manifest["version"] = on_disk["version"] + 1
+            manifest["delta"] = dict(delta, records=delta_records, bytes=delta_bytes)
+            manifest["texts"] = dict(texts, bytes=text_bytes)
+            if generation:
+                manifest["generation"] = generation
+            self.id_shift = self._next_id(on_disk) - self._next_id(self.manifest)
+            self._apply_pending_state(manifest, on_disk, self.id_shift)
+            self._write_manifest(manifest)
+            self._clear_pending()
+            self.needs_reload = conflict
+            if conflict:
+                logger.info("Knowledge store changed in another process during ingestion - reload required")
+            return manifest["version"]
+
+    def write_snapshot(
+        self,
+        index,
+        documents,
+        metadata: List[Dict[str, Any]],
+        expected_version: Optional[int] = None,
+        next_id: Optional[int] = None,
+        vectors: Optional[np.ndarray] = None,
+        lexical: Optional[BM25Index] = None,
+        generation: Optional[Dict[str, Any]] = None,
+    ) -> Optional[int]:
+        """Write a full snapshot, start an empty delta log and return the new version.
+
+        With ``expected_version`` the snapshot is only written if the store is
+        still at that version; ``None`` is returned when another process
+        committed in the meantime. ``next_id`` keeps ids of chunks dropped
+        from the end of the index (by compaction) from being handed out again.
+        ``vectors`` are the exact vectors of a compressed ``index``, stored
+        beside it for re-ranking. ``lexical`` holds the BM25 postings of
+        ``documents``; without it, workers build them when they load.
+        ``generation`` replaces the recorded generation (a rebuild with
+        another embedding model or chunker); by default it is kept.
+        """
+        with self._locked():
+            if expected_version is not None:
+                on_disk = self._read_manifest()
+                if (on_disk["version"] if on_disk else 0) != expected_version:
+                    return None
+            return self._write_snapshot_locked(index, documents, metadata, next_id, vectors, lexical, generation)
+
+    def _append_texts(self, texts: Dict[str, Any], documents: Iterable[str]) -> Tuple[np.ndarray, int]:
+        """Append texts to the committed blob and return their rows and the new blob length."""
+        with open(self.directory / texts["path"], "ab") as f:
+            # Drop any bytes left behind by an interrupted commit
+            f.truncate(texts["bytes"])
+            rows = ChunkTextView.write(documents, f, texts["bytes"])
+            f.flush()
+            os.fsync(f.fileno())
+            return rows, f.tell()
+
+    def _write_texts(
+        self, documents, previous: Optional[Dict[str, Any]], version: int
+    ) -> Tuple[Dict[str, Any], np.ndarray]:
+        """Store the snapshot's chunk texts and return the blob entry for the manifest plus each row.
+
+        A view over the current blob only appends its uncommitted texts;
+        anything else (such as a rebuild without deleted chunks) writes a
+        fresh blob, which drops texts no row refers to any more.
+        """
+        texts = previous.get("texts") if previous else None
+        if texts and isinstance(documents, ChunkTextView) and documents.blob_path == self._blob_path(previous):
+            rows = np.array(documents.rows(), dtype=TEXT_ROW_DTYPE)
+            uncommitted = np.flatnonzero(rows["offset"] < 0)
+            appended, text_bytes = self._append_texts(texts, (documents[int(i)] for i in uncommitted))
+            rows[uncommitted] = appended
+            return dict(texts, bytes=text_bytes), rows
+
+        name = f"chunks.{version}.blob"
+        written = []
+        atomic_write(self.directory / name, lambda f: written.append(ChunkTextView.write(documents, f)))
+        return {"path": name, "bytes": (self.directory / name).stat().st_size}, written[0]
+
+    def _write_snapshot_locked(
+        self,
+        index,
+        documents,
+        metadata: List[Dict[str, Any]],
+        next_id: Optional[int] = None,
+        vectors: Optional[np.ndarray] = None,
+        lexical: Optional[BM25Index] = None,
+        generation: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        previous = self._read_manifest()
+        version = max(self.version, previous["version"] if previous else 0) + 1
+        names = {
+            "index": f"faiss_index.{version}.bin",
+            "rows": f"chunks.{version}.npy",
+            "metadata": f"metadata.{version}.npz",
+        }
+        if not isinstance(metadata, ChunkMetadata):
+            metadata = ChunkMetadata(metadata)
+        if isinstance(index, LayeredIndex):
+            next_id = max(next_id or 0, index.next_id)
+            if vectors is None and index.codec != "none":
+                vectors = index.exact_vectors()
+            index = index.merged()
+        if vectors is not None and index_codec(index) != "none":
+            names["vectors"] = f"vectors.{version}.npy"
+        else:
+            vectors = None
+        ids = index_ids(index)
+        if not isinstance(faiss.downcast_index(index), faiss.IndexIDMap2):
+            index = with_ids(index, ids)
+        next_id = max(next_id or 0, int(ids[-1]) + 1 if len(ids) else 0, self._next_id(previous))
+
+        checksums = {}
+        checksums["index"] = atomic_write(
+            self.directory / names["index"], lambda f: faiss.write_index(index, faiss.PyCallbackIOWriter(f.write))
+        )
+        texts, rows = self._write_texts(documents, previous, version)
+        checksums["rows"] = atomic_write(self.directory / names["rows"], lambda f: np.save(f, rows, allow_pickle=False))
+        checksums["metadata"] = atomic_write(self.directory / names["metadata"], metadata.save)
+        if lexical is not None and len(lexical) == len(documents):
+            names["lexical"] = f"lexical.{version}.npz"
+            checksums["lexical"] = atomic_write(self.directory / names["lexical"], lexical.save)
+        if vectors is not None:
+            checksums["vectors"] = atomic_write(
+                self.directory / names["vectors"],
+                lambda f: np.save(f, np.ascontiguousarray(vectors, dtype=np.float32), allow_pickle=False),
+            )
+        delta_name = f"delta.{version}.log"
+        atomic_write(self.directory / delta_name, lambda f: None)
+
+        snapshot = {"records": len(documents), "next_id": next_id}
+        for key, name in names.items():
+            snapshot[key] = name
+            snapshot[f"{key}_checksum"] = checksums[key]
+            snapshot[f"{key}_bytes"] = (self.directory / name).stat().st_size
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "snapshot": snapshot,
+            "delta": {"path": delta_name, "records": 0, "bytes": 0},
+            "texts": texts,
+        }
+        generation = generation or (previous.get("generation") if previous else None)
+        if generation:
+            manifest["generation"] = generation
+        self._apply_pending_state(manifest, previous)
+        # Tombstones of chunks that are no longer in the snapshot have been compacted away
+        tombstones = np.asarray(expand_id_ranges(manifest["tombstones"]), dtype=np.int64)
+        manifest["tombstones"] = id_ranges(tombstones[np.isin(tombstones, ids)])
+        self._write_manifest(manifest)
+        self._clear_pending()
+
+        if previous:
+            self._remove_files(previous, manifest)
+        logger.info(f"Wrote knowledge store snapshot version {version} with {len(documents)} chunks")
+        return version
+
+    def _remove_files(self, manifest: Dict[str, Any], current: Dict[str, Any]):
+        """Delete the files referenced by a superseded manifest and not by the current one.
+
+        Processes that still have the old snapshot memory-mapped keep reading
+        it safely; the data is released once they swap to the new version.
+        """
+        snapshot = manifest["snapshot"]
+        keys = ("index", "texts", "offsets", "rows", "metadata", "vectors", "lexical")
+        names = [snapshot[key] for key in keys if key in snapshot]
+        names.append(manifest["delta"]["path"])
+        if "texts" in manifest and manifest["texts"]["path"] != current["texts"]["path"]:
+            names.append(manifest["texts"]["path"])
+        for name in names:
+            try:
+                (self.directory / name).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove old knowledge store file {name}: {e}")
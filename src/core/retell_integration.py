@@ -12,10 +12,21 @@ from src.utils.logger import get_logger
 
 logger = get_logger()
 
+# Knowledge chunks retrieved for an agent prompt
+CALL_SEARCH_RESULTS = 2
+
 
 class RetellKnowledgeIntegration:
     """Service for integrating knowledge base with Retell AI calls."""
-    
+
+    @staticmethod
+    def _format_reference(number: int, reference: Dict[str, Any]) -> str:
+        """Render one packed knowledge reference for an agent prompt."""
+        return f"""
+Reference {number} ({reference['title'] or 'Clinical Knowledge'}):
+{reference['content']}
+"""
+
     @staticmethod
     def generate_knowledge_enhanced_prompt(
         patient: Patient,
@@ -34,24 +45,21 @@ class RetellKnowledgeIntegration:
                 return RetellKnowledgeIntegration._generate_basic_prompt(patient, protocol)
             
             # Search for relevant knowledge
-            relevant_docs = knowledge_service.search(search_query, k=2, 
-                                                   category_filter=patient.protocol_type.value.lower())
-            
+            relevant_docs = knowledge_service.search(
+                search_query, k=CALL_SEARCH_RESULTS, category_filter=patient.protocol_type.value.lower()
+            )
+
             if not relevant_docs:
                 logger.info("No relevant knowledge found, using basic prompt")
                 return RetellKnowledgeIntegration._generate_basic_prompt(patient, protocol)
-            
-            # Build knowledge-enhanced prompt
-            knowledge_context = ""
-            for doc in relevant_docs:
-                metadata = doc["metadata"]
-                content = doc["content"]
-                knowledge_context += f"""
-Reference ({metadata.get('title', 'Clinical Knowledge')}):
-{content[:500]}...
 
-"""
-            
+            # Build knowledge-enhanced prompt from whole, de-duplicated chunks within the call budget
+            knowledge_context = knowledge_service.pack_context(
+                relevant_docs,
+                budget_tokens=knowledge_service.call_context_budget(CALL_SEARCH_RESULTS),
+                format_reference=RetellKnowledgeIntegration._format_reference,
+            )["context"]
+
             # Create comprehensive prompt with knowledge integration
             enhanced_prompt = f"""
 You are a compassionate palliative care specialist conducting a telephone assessment. You have access to evidence-based clinical knowledge to guide your conversation.
@@ -303,6 +311,8 @@ Provide concise, actionable analysis.
                 insight = {
                     "title": doc["metadata"].get("title", "Clinical Guidance"),
                     "relevance": doc["relevance"],
+                    "score": doc["score"],
+                    "score_type": doc["score_type"],
                     "content": doc["content"][:300] + "..." if len(doc["content"]) > 300 else doc["content"],
                     "source": doc["metadata"].get("source", "Knowledge Base")
                 }
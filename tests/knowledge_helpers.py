@@ -0,0 +1,99 @@
+"""Shared helpers for knowledge base tests (stub embedder, service factory and test files)."""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+from flask import Flask
+
+from src.core.knowledge_chunking import APPROXIMATE_ENCODING
+from src.core.knowledge_service import KnowledgeBaseService
+
+
+class StubEmbeddings:
+    """Deterministic bag-of-words embedder that never touches the network."""
+
+    def __init__(self, dimension: int = 1536):
+        self.dimension = dimension
+        self.document_calls = []
+        self.query_calls = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.document_calls.append(len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        with self._lock:
+            self.query_calls += 1
+        return self._embed(text)
+
+
+def make_service(knowledge_dir, embeddings=None, **config) -> KnowledgeBaseService:
+    """Create a service rooted at ``knowledge_dir`` without default knowledge or directory loading."""
+    app = Flask(__name__)
+    config.setdefault("KNOWLEDGE_BACKGROUND_INGESTION", False)
+    config.setdefault("KNOWLEDGE_BACKGROUND_COMPACTION", False)
+    # tiktoken would download its encoding; tests count tokens offline
+    config.setdefault("KNOWLEDGE_TOKEN_ENCODING", APPROXIMATE_ENCODING)
+    app.config.update(KNOWLEDGE_BASE_DIR=str(knowledge_dir), **config)
+
+    service = KnowledgeBaseService()
+    with patch.dict(os.environ, {"LOAD_DOCUMENTS": "false", "FORCE_RELOAD_DOCUMENTS": "false"}):
+        with patch.object(KnowledgeBaseService, "_initialize_default_knowledge"):
+            service.init_app(app)
+
+    # A configured local embedding model keeps its provider; anything else gets the stub
+    service.embeddings = embeddings or service.embeddings or StubEmbeddings()
+    return service
+
+
+def write_text_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(count)), count),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode("latin-1")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(data))
+
+
+def slow_extract(path):
+    """Process-pool extractor for tests: paths containing ``hang`` take far longer than any test timeout."""
+    if "hang" in str(path):
+        time.sleep(60)
+    return str(path).upper()
@@ -0,0 +1,114 @@
+import copy
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_benchmark import (
+    HashedTokenEmbeddings,
+    SyntheticCorpus,
+    compare_reports,
+    prepare_corpus,
+    run_benchmark,
+)
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+    """Test cases for the synthetic corpus and its local embeddings"""
+
+    def test_corpus_is_deterministic_and_embedded_like_queries(self):
+        """Blocks are reproducible and their vectors are what the embedder returns for their texts"""
+        first = SyntheticCorpus(5000, HashedTokenEmbeddings(dimension=32)).block(1)
+        again = SyntheticCorpus(5000, HashedTokenEmbeddings(dimension=32)).block(1)
+
+        self.assertEqual(first["texts"], again["texts"])
+        np.testing.assert_array_equal(first["vectors"], again["vectors"])
+        self.assertEqual(len(first["texts"]), 5000 - 4096)
+        np.testing.assert_allclose(
+            HashedTokenEmbeddings(dimension=32).embed_matrix(first["texts"][:20]), first["vectors"][:20], atol=1e-5
+        )
+
+    def test_prepared_corpus_is_reused(self):
+        """A corpus of the same size, dimension and seed is loaded instead of generated again"""
+        with tempfile.TemporaryDirectory() as tmp:
+            _, description = prepare_corpus(Path(tmp), 1200, dimension=16)
+            self.assertFalse(description["cached"])
+            _, description = prepare_corpus(Path(tmp), 1200, dimension=16)
+            self.assertTrue(description["cached"])
+            _, description = prepare_corpus(Path(tmp), 1300, dimension=16)
+            self.assertFalse(description["cached"])
+
+
+class TestSearchBenchmark(unittest.TestCase):
+    """Test cases for the search benchmark report"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.report = run_benchmark(
+            Path(cls.tmp.name),
+            sizes=[2000],
+            modes=["flat", "hnsw", "ivf_flat"],
+            dimension=32,
+            search_modes=("vector", "hybrid"),
+            selectivities=(1.0, 0.1),
+            num_queries=20,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_report_measures_every_layout_and_filter(self):
+        """Each layout reports build time, memory and latency percentiles per search mode and filter"""
+        layouts = self.report["corpora"][0]["layouts"]
+        self.assertEqual(
+            [(l["index_mode"], l["codec"]) for l in layouts], [("flat", "none"), ("hnsw", "none"), ("ivf_flat", "none")]
+        )
+        for layout in layouts:
+            self.assertGreater(layout["memory"]["bytes_per_chunk"], 0)
+            self.assertEqual(
+                [(s["search_mode"], s["filter"]) for s in layout["searches"]],
+                [
+                    ("vector", "none"),
+                    ("vector", "end_of_life"),
+                    ("hybrid", "none"),
+                    ("hybrid", "end_of_life"),
+                ],
+            )
+            for search in layout["searches"]:
+                latency = search["latency_ms"]
+                self.assertLessEqual(latency["p50"], latency["p95"])
+                self.assertLessEqual(latency["p95"], latency["p99"])
+        selectivity = layouts[0]["searches"][1]["selectivity"]
+        self.assertAlmostEqual(selectivity, 0.1, delta=0.03)
+
+    def test_flat_vector_search_has_exact_recall(self):
+        """The flat index through the service finds exactly the filtered exact neighbours"""
+        flat = self.report["corpora"][0]["layouts"][0]
+        for search in flat["searches"]:
+            if search["search_mode"] == "vector":
+                self.assertEqual(search["recall_at_k"], 1.0)
+
+    def test_compare_reports_flags_regressions(self):
+        """Recall drops beyond the tolerance are regressions; latency only when a tolerance is given"""
+        self.assertEqual(compare_reports(self.report, self.report), [])
+        worse = copy.deepcopy(self.report)
+        search = worse["corpora"][0]["layouts"][1]["searches"][0]
+        search["recall_at_k"] -= 0.05
+        search["latency_ms"]["p95"] *= 3
+
+        regressions = compare_reports(self.report, worse)
+        self.assertEqual(
+            [(r["search"], r["metric"]) for r in regressions], [("2000/hnsw/none/vector/none", "recall_at_k")]
+        )
+        self.assertEqual(len(compare_reports(self.report, worse, latency_tolerance=0.5)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
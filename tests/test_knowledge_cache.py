@@ -0,0 +1,230 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_cache import (
+    ChunkEmbeddingCache,
+    ExtractedTextCache,
+    QueryEmbeddingCache,
+    VectorStore,
+    normalize_query,
+    open_text_cache,
+)
+from src.core.knowledge_ingestion import PDF_EXTRACTOR, iter_cached_extractions, normalize_page_text
+from src.core.knowledge_store import file_checksum
+from tests.knowledge_helpers import StubEmbeddings, make_service, slow_extract, write_text_pdf
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    """Test cases for the persistent query embedding cache"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "query_cache.sqlite3"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_normalized_hits_and_misses(self):
+        """Queries differing only in case and whitespace share an entry"""
+        cache = QueryEmbeddingCache(self.path)
+        self.assertIsNone(cache.get("COPD  dyspnea", "ada"))
+        cache.put("COPD  dyspnea", "ada", np.ones(4))
+
+        np.testing.assert_array_equal(cache.get(" copd dyspnea ", "ada"), np.ones(4, dtype=np.float32))
+        self.assertIsNone(cache.get("copd dyspnea", "other-model"))
+        self.assertEqual(normalize_query("  Pain\n management "), "pain management")
+
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_persists_across_instances(self):
+        """A new cache instance reads entries written by another one from disk"""
+        QueryEmbeddingCache(self.path).put("edema", "ada", np.arange(4))
+        cache = QueryEmbeddingCache(self.path)
+
+        np.testing.assert_array_equal(cache.get("edema", "ada"), np.arange(4, dtype=np.float32))
+        self.assertEqual(cache.get_stats()["disk_hits"], 1)
+
+    def test_memory_lru_is_bounded(self):
+        """The in-memory LRU keeps only the most recently used entries"""
+        cache = QueryEmbeddingCache(self.path, memory_size=2)
+        for query in ("a", "b", "c"):
+            cache.put(query, "ada", np.zeros(2))
+        cache.get("b", "ada")
+
+        self.assertEqual(list(cache._memory), [QueryEmbeddingCache.key(q, "ada") for q in ("c", "b")])
+        self.assertEqual(cache.get_stats()["disk_entries"], 3)
+
+    def test_disk_eviction(self):
+        """The on-disk store evicts least recently used entries past its limit"""
+        store = VectorStore(self.path, max_entries=3)
+        for i in range(5):
+            store.put(f"key{i}", np.full(2, i))
+        store.get("key0")
+        store.evict()
+
+        self.assertEqual(len(store), 3)
+        self.assertIsNotNone(store.get("key0"))
+        self.assertIsNone(store.get("key1"))
+
+    def test_entry_count_is_kept_without_scanning(self):
+        """Inserts, replacements and evictions by any instance keep the entry count exact without COUNT(*)"""
+        store, other = VectorStore(self.path, max_entries=4), VectorStore(self.path, max_entries=4)
+        for i in range(3):
+            store.put(f"key{i}", np.zeros(2))
+        other.put_many([("key1", np.ones(2)), ("key5", np.ones(2)), ("key6", np.ones(2))])
+        self.assertEqual((len(store), len(other)), (5, 5))
+        other.evict()
+
+        statements = []
+        store._conn.set_trace_callback(statements.append)
+        self.assertEqual(len(store), 4)
+        self.assertFalse([sql for sql in statements if "COUNT(*)" in sql.upper()])
+        store._conn.set_trace_callback(None)
+        self.assertEqual(store._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0], 4)
+
+
+class TestChunkEmbeddingCache(unittest.TestCase):
+    """Test cases for the content-addressed chunk embedding cache"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ChunkEmbeddingCache(Path(self.tmp.name) / "chunk_embeddings.sqlite3")
+        self.embeddings = StubEmbeddings(dimension=8)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _embed(self, texts, chunk_params="recursive:1000:200"):
+        hashes = [f"hash-{text}" for text in texts]
+        progress = []
+        runs = list(
+            self.cache.iter_embeddings(
+                self.embeddings,
+                texts,
+                hashes,
+                "stub",
+                chunk_params,
+                batch_size=2,
+                max_workers=2,
+                progress_callback=lambda done, total: progress.append(done),
+            )
+        )
+        return runs, progress
+
+    def test_only_misses_are_embedded(self):
+        """Cached chunks are served from disk and runs cover every row in order"""
+        self._embed(["a", "b", "c"])
+        self.embeddings.document_calls.clear()
+
+        runs, progress = self._embed(["x", "a", "b", "y", "c"])
+
+        self.assertEqual(sum(self.embeddings.document_calls), 2)
+        self.assertEqual([offset for offset, _ in runs], [0, 4])
+        matrix = np.vstack([m for _, m in runs])
+        expected = np.asarray(self.embeddings.embed_documents(["x", "a", "b", "y", "c"]), dtype=np.float32)
+        np.testing.assert_allclose(matrix, expected)
+        self.assertEqual(progress[-1], 5)
+        self.assertEqual(self.cache.get_stats()["hits"], 3)
+
+    def test_chunk_params_are_part_of_the_key(self):
+        """Changing the chunker parameters does not reuse old embeddings"""
+        self._embed(["a"])
+        self.embeddings.document_calls.clear()
+        self._embed(["a"], chunk_params="tokens:512:64")
+        self.assertEqual(self.embeddings.document_calls, [1])
+
+
+class TestExtractedTextCache(unittest.TestCase):
+    """Test cases for the hash-keyed extracted text cache"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ExtractedTextCache(Path(self.tmp.name) / "extracted_text.sqlite3", max_entries=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_pages_round_trip_per_extractor(self):
+        """Page numbers and boundaries survive compression, and other extractors miss"""
+        pages = [(1, "Dyspnée at rest"), (2, ""), (None, "Appendix: opioid conversion")]
+        self.cache.put("abc", PDF_EXTRACTOR, pages)
+
+        self.assertEqual(open_text_cache(self.tmp.name).get("abc", PDF_EXTRACTOR), pages)
+        self.assertIsNone(self.cache.get("abc", "pymupdf-1.24"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Only max_entries files are kept"""
+        for content_hash in ("a", "b", "c"):
+            self.cache.put(content_hash, PDF_EXTRACTOR, [(1, content_hash)])
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("a", PDF_EXTRACTOR))
+
+    def test_cached_files_are_not_parsed_again(self):
+        """A cache hit is served without handing the file to an extractor"""
+        path = Path(self.tmp.name) / "hang_protocol.pdf"
+        write_text_pdf(path, ["Breakthrough pain"])
+        self.cache.put(file_checksum(path), PDF_EXTRACTOR, [(1, "Breakthrough pain")])
+
+        results = list(iter_cached_extractions([path], self.cache, extract=slow_extract, timeout=1))
+        self.assertEqual(results, [(path, [(1, "Breakthrough pain")], file_checksum(path), None)])
+        self.assertEqual(normalize_page_text("Ａ\u00a0 dose\r\n\n\n\nnext  line \x00"), "A dose\n\nnext line")
+
+
+class TestServiceEmbeddingCaches(unittest.TestCase):
+    """Test cases for embedding caches in the knowledge service"""
+
+    def test_repeat_search_skips_embedding(self):
+        """Repeated searches embed the query once, including in a new worker"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir)
+            service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD", category="copd")
+
+            first = service.search("COPD breathing", k=1)
+            second = service.search("copd   breathing", k=1)
+            self.assertEqual(first, second)
+            self.assertEqual(service.embeddings.query_calls, 1)
+
+            stats = service.get_stats()["query_cache"]
+            self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+            worker = make_service(knowledge_dir, embeddings=StubEmbeddings())
+            worker.search("COPD breathing", k=1)
+            self.assertEqual(worker.embeddings.query_calls, 0)
+
+    def test_reingestion_reuses_chunk_embeddings(self):
+        """Re-adding a document only embeds chunks whose text changed"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            document = "\n\n".join(f"Section {i}: " + "opioid titration guidance " * 30 for i in range(6))
+            service = make_service(knowledge_dir)
+            service.add_document(document, title="Opioids", category="pain_management")
+            chunks = len(service.documents)
+
+            worker = make_service(knowledge_dir, embeddings=StubEmbeddings())
+            worker.add_document(document + "\n\nNew section: naloxone rescue", title="Opioids")
+            self.assertLess(sum(worker.embeddings.document_calls), chunks)
+            self.assertEqual(worker.get_stats()["chunk_cache"]["hits"], chunks - 1)
+
+    def test_cache_can_be_disabled(self):
+        """KNOWLEDGE_QUERY_CACHE_SIZE=0 embeds every query"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir, KNOWLEDGE_QUERY_CACHE_SIZE=0)
+            service.add_document("Daily weights for edema", title="Edema", category="heart_failure")
+            service.search("edema", k=1)
+            service.search("edema", k=1)
+
+            self.assertEqual(service.embeddings.query_calls, 2)
+            self.assertIsNone(service.get_stats()["query_cache"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_chunking import (
+    APPROXIMATE_ENCODING,
+    TokenCounter,
+    _counters,
+    chunk_params,
+    get_token_counter,
+    iter_token_chunks,
+)
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+PROTOCOL = "\n".join(
+    [
+        "PAIN MANAGEMENT",
+        "Assess pain on a 0-10 scale at every call. " + "Give morphine as ordered and reassess in one hour. " * 12,
+        "",
+        "1.2 Breakthrough Pain",
+        "Use an immediate release opioid at 10 to 15 percent of the daily dose. " * 8,
+        "## Dyspnea",
+        "Pursed-lip breathing and fan therapy.",
+        "Section 4 Nausea",
+        "Ondansetron 4 mg every eight hours as needed.",
+    ]
+)
+
+
+class TestTokenChunker(unittest.TestCase):
+    """Test cases for token-sized, heading-aware chunking"""
+
+    def setUp(self):
+        self.counter = TokenCounter(APPROXIMATE_ENCODING)
+
+    def test_chunks_fit_the_budget_and_start_at_headings(self):
+        """Chunks stay within max_tokens, carry their token counts and headings open their sections"""
+        chunks = list(iter_token_chunks([(3, PROTOCOL)], self.counter, max_tokens=100, overlap_tokens=16))
+
+        for chunk, page, page_end, tokens in chunks:
+            self.assertEqual(tokens, self.counter.count(chunk))
+            self.assertLessEqual(tokens, 100)
+            self.assertEqual((page, page_end), (3, 3))
+        starts = [chunk.split("\n")[0] for chunk, _, _, _ in chunks]
+        self.assertIn("PAIN MANAGEMENT", starts)
+        self.assertIn("1.2 Breakthrough Pain", starts)
+        self.assertIn("## Dyspnea", starts)
+        # No heading is left as a chunk of its own
+        self.assertFalse({"PAIN MANAGEMENT", "1.2 Breakthrough Pain"} & {chunk for chunk, _, _, _ in chunks})
+
+    def test_counter_identity(self):
+        """Counters are shared per encoding and named in the cache key"""
+        self.assertIs(get_token_counter(APPROXIMATE_ENCODING), get_token_counter(APPROXIMATE_ENCODING))
+        self.assertEqual(self.counter.count("Morphine 5 mg, q4h."), 7)
+        self.assertEqual(chunk_params(self.counter.name, 256, 48), "tokens:approx:256:48")
+
+    def test_unavailable_encoding_falls_back_without_changing_chunk_params(self):
+        """An encoding that cannot load is approximated with one warning, and the chunker identity stays"""
+        _counters.pop("p50k_base", None)
+        self.addCleanup(_counters.pop, "p50k_base", None)
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir, KNOWLEDGE_TOKEN_ENCODING="p50k_base")
+            params = service._chunk_params()
+            with patch("tiktoken.get_encoding", side_effect=OSError("no network")) as get_encoding:
+                with self.assertLogs("palliative_care", level="WARNING") as logs:
+                    self.assertTrue(service.add_document(PROTOCOL, title="Symptom Protocol", category="protocols"))
+                    context = service.pack_context(service.search("pain", k=2), 500)["context"]
+                    self.assertTrue(get_token_counter("p50k_base").approximate)
+                self.assertEqual(get_encoding.call_count, 1)
+                self.assertEqual(len(logs.records), 1)
+                self.assertIn("p50k_base", logs.output[0])
+                self.assertTrue(context)
+                self.assertEqual(service._chunk_params(), params)
+            self.assertEqual(params, "tokens:p50k_base:256:48")
+
+
+class TestServiceTokenCounts(unittest.TestCase):
+    """Test cases for token counts stored with ingested chunks"""
+
+    def test_token_counts_are_stored_per_chunk(self):
+        """Each chunk's token count is in its metadata, the column and a new worker's snapshot"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(
+                knowledge_dir,
+                KNOWLEDGE_TOKEN_ENCODING=APPROXIMATE_ENCODING,
+                KNOWLEDGE_CHUNK_TOKENS=100,
+                KNOWLEDGE_CHUNK_OVERLAP_TOKENS=16,
+            )
+            self.assertTrue(service.add_document(PROTOCOL, title="Symptom Protocol", category="protocols"))
+
+            counter = TokenCounter(APPROXIMATE_ENCODING)
+            expected = [counter.count(service.documents[row]) for row in range(len(service.documents))]
+            self.assertGreater(len(expected), 2)
+            self.assertTrue(all(0 < tokens <= 100 for tokens in expected))
+
+            worker = make_service(knowledge_dir)
+            np.testing.assert_array_equal(worker.metadata.token_counts, expected)
+            result = worker.search("breakthrough opioid daily dose", k=1, mode="lexical")[0]
+            self.assertEqual(result["metadata"]["token_count"], counter.count(result["content"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import hashlib
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+
+import pytest
+
+from src.core.knowledge_ingestion import ReadWriteLock
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+_DOCUMENT_WORD = re.compile(r"\bd(\d+)w\d+")
+
+
+def _document(number: int, paragraphs: int = 4) -> str:
+    """Paragraphs whose every word names the document, so any chunk of it can be traced back."""
+    rng = random.Random(number)
+    return "\n\n".join(" ".join(f"d{number}w{rng.randrange(300)}" for _ in range(30)) + "." for _ in range(paragraphs))
+
+
+class TestReadWriteLock(unittest.TestCase):
+    """Test cases for the shared/exclusive index lock"""
+
+    def test_readers_share_and_waiting_writer_goes_first(self):
+        """Readers hold the lock together; a waiting writer excludes them and overtakes later readers"""
+        lock = ReadWriteLock()
+        both_reading = threading.Barrier(2, timeout=5)
+        events = []
+
+        def _reader(name):
+            with lock.read():
+                both_reading.wait()
+                events.append(name)
+
+        readers = [threading.Thread(target=_reader, args=(name,)) for name in ("r1", "r2")]
+        for thread in readers:
+            thread.start()
+        for thread in readers:
+            thread.join(5)
+        self.assertEqual(sorted(events), ["r1", "r2"])
+
+        release_reader, writer_waiting = threading.Event(), threading.Event()
+
+        def _writer():
+            writer_waiting.set()
+            with lock.write():
+                events.append("writer")
+
+        def _late_reader():
+            with lock.read():
+                events.append("late reader")
+
+        with lock.read():
+            writer = threading.Thread(target=_writer)
+            writer.start()
+            writer_waiting.wait(5)
+            time.sleep(0.05)
+            late_reader = threading.Thread(target=_late_reader)
+            late_reader.start()
+            time.sleep(0.05)
+            self.assertEqual(events[2:], [])
+        writer.join(5)
+        late_reader.join(5)
+        self.assertEqual(events[2:], ["writer", "late reader"])
+
+    def test_writer_reenters_but_reader_cannot_upgrade(self):
+        """The writing thread may write and read again; a reading thread may not start writing"""
+        lock = ReadWriteLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                pass
+            with self.assertRaises(RuntimeError):
+                with lock.write():
+                    pass
+        with lock.write():
+            pass
+
+
+class TestConcurrentSearch(unittest.TestCase):
+    """Test cases for searches running while documents are ingested"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = make_service(
+            self.tmp.name,
+            KNOWLEDGE_CHUNK_CACHE=False,
+            KNOWLEDGE_CHUNK_TOKENS=64,
+            KNOWLEDGE_CHUNK_OVERLAP_TOKENS=8,
+            KNOWLEDGE_EMBED_BATCH_SIZE=4,
+            KNOWLEDGE_COMPACT_MIN_DELETED=1000,
+        )
+        for number in range(4):
+            self.assertTrue(
+                self.service.add_document(
+                    _document(number), title=f"Protocol {number}", category="even" if number % 2 == 0 else "odd"
+                )
+            )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_searches_see_consistent_state_during_ingestion(self):
+        """Search results always pair a chunk's text with its own metadata while documents are added, deleted and compacted"""
+        service = self.service
+        done = threading.Event()
+        failures, searches = [], [0]
+
+        def _check(results, category=None):
+            for result in results:
+                metadata = result["metadata"]
+                if hashlib.md5(result["content"].encode()).hexdigest() != metadata["content_hash"]:
+                    failures.append(f"chunk {metadata['id']} text does not match its content hash")
+                numbers = set(_DOCUMENT_WORD.findall(result["content"]))
+                if numbers != {metadata["title"].split()[-1]}:
+                    failures.append(f"chunk {metadata['id']} of '{metadata['title']}' holds words of {numbers}")
+                if category and metadata["category"] != category:
+                    failures.append(f"chunk {metadata['id']} escaped the {category} filter")
+
+        def _reader(seed):
+            rng = random.Random(seed)
+            while not done.is_set():
+                number = rng.randrange(4)
+                query = _document(number)[:120]
+                try:
+                    for mode in ("vector", "hybrid", "lexical"):
+                        results = service.search(query, k=3, mode=mode)
+                        if not results or f"Protocol {number}" not in {r["metadata"]["title"] for r in results}:
+                            failures.append(f"{mode} search lost document {number}")
+                        _check(results)
+                    category = "even" if number % 2 == 0 else "odd"
+                    _check(service.search(query, k=3, category_filter=category, mode="hybrid"), category)
+                    for batch in service.search_many([query, _document(rng.randrange(4, 40))[:120]], k=3):
+                        _check(batch)
+                    stats = service.get_stats()
+                    if stats["index_size"] != stats["total_chunks"] + stats["deleted_chunks"]:
+                        failures.append(f"index rows {stats['index_size']} out of step with chunk metadata")
+                except Exception as e:
+                    failures.append(repr(e))
+                searches[0] += 1
+
+        def _writer():
+            try:
+                for number in range(4, 28):
+                    service.add_document(
+                        _document(number),
+                        title=f"Protocol {number}",
+                        category="even" if number % 2 == 0 else "odd",
+                        commit=number % 3 == 0,
+                    )
+                    if number % 5 == 0:
+                        document = service.search(_document(number)[:120], k=1, mode="lexical")[0]
+                        service.delete_document(document["metadata"]["document_id"])
+                service.commit()
+                service.compact()
+            except Exception as e:
+                failures.append(repr(e))
+            finally:
+                done.set()
+
+        with self.assertNoLogs("palliative_care", level="ERROR"):
+            threads = [threading.Thread(target=_reader, args=(seed,)) for seed in range(3)]
+            threads.append(threading.Thread(target=_writer))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(120)
+
+        self.assertEqual(failures, [])
+        self.assertGreater(searches[0], 0)
+        stats = service.get_stats()
+        self.assertEqual(stats["deleted_chunks"], 0)
+        self.assertEqual(stats["index_size"], stats["total_chunks"])
+        self.assertEqual(len(service.search(_document(27)[:120], k=1, mode="vector")), 1)
+
+    def test_search_does_not_wait_for_ingestion(self):
+        """A search answers while an upload is blocked inside its embedding call"""
+        embedding, release = threading.Event(), threading.Event()
+
+        class BlockingEmbeddings(StubEmbeddings):
+            """Blocks document embedding until released."""
+
+            def embed_documents(self, texts):
+                embedding.set()
+                release.wait(10)
+                return super().embed_documents(texts)
+
+        self.service.embeddings = BlockingEmbeddings()
+        self.service.refresh_interval = 0
+        upload = threading.Thread(
+            target=self.service.add_document, args=(_document(9),), kwargs={"title": "Protocol 9"}
+        )
+        upload.start()
+        try:
+            self.assertTrue(embedding.wait(5))
+            start = time.monotonic()
+            results = self.service.search(_document(1)[:120], k=1)
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(results[0]["metadata"]["title"], "Protocol 1")
+        finally:
+            release.set()
+            upload.join(10)
+        self.assertEqual(self.service.search(_document(9)[:120], k=1)[0]["metadata"]["title"], "Protocol 9")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import tempfile
+import unittest
+
+import pytest
+
+from src.core.knowledge_chunking import APPROXIMATE_ENCODING, TokenCounter
+from src.core.knowledge_context import SPAN_SEPARATOR, overlap_length, pack_context
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+COUNT = TokenCounter(APPROXIMATE_ENCODING).count
+
+
+def _format(number, reference):
+    return f"Reference {number}: {reference['title']}\n{reference['content']}\n"
+
+
+def _result(content, document_id, chunk_index, title="Pain Protocol", relevance="high"):
+    metadata = {
+        "document_id": document_id,
+        "chunk_index": chunk_index,
+        "title": title,
+        "source": f"Document: {title}",
+        "category": "protocols",
+        "token_count": COUNT(content),
+    }
+    return {"content": content, "metadata": metadata, "relevance": relevance}
+
+
+class TestPackContext(unittest.TestCase):
+    """Test cases for merging and budgeting retrieved chunks"""
+
+    def test_overlapping_chunks_merge_and_duplicates_drop(self):
+        """Adjacent chunks are joined at their overlap and text seen in a better reference is dropped"""
+        first = "Assess pain on a 0-10 scale. Give morphine 5 mg by mouth for breakthrough pain."
+        second = "Give morphine 5 mg by mouth for breakthrough pain. Reassess in one hour."
+        distant = "Constipation: start senna with every opioid prescription."
+        notice = "Escalate to the on-call physician for new or severe symptoms."
+        results = [
+            _result(second, 10, 1),
+            _result(notice, 10, 7),
+            _result(first, 10, 0),
+            _result(notice, 20, 3, title="Dyspnea Protocol"),
+            _result(distant, 10, 5),
+        ]
+        packed = pack_context(results, 1000, COUNT, _format)
+
+        self.assertEqual(overlap_length(first, second), len("Give morphine 5 mg by mouth for breakthrough pain."))
+        self.assertEqual(len(packed["references"]), 1)
+        self.assertEqual(
+            packed["references"][0]["content"],
+            SPAN_SEPARATOR.join([first + " Reassess in one hour.", distant, notice]),
+        )
+        # Merged spans are costed from stored counts, without re-tokenizing
+        self.assertAlmostEqual(packed["tokens_used"], COUNT(packed["context"]), delta=2)
+        self.assertGreater(packed["tokens_saved"], COUNT(notice))
+        self.assertEqual(packed["tokens_omitted"], 0)
+
+    def test_references_are_packed_by_relevance_within_budget(self):
+        """Whole spans of the best references fill the budget; the rest is reported as omitted"""
+        paragraphs = [
+            f"Step {i}: " + "keep the patient comfortable and reassess symptoms often. " * 4 for i in range(3)
+        ]
+        results = [_result(text, 100 + i, 0, title=f"Protocol {i}") for i, text in enumerate(paragraphs)]
+        budget = 2 * COUNT(_format(1, {"title": "Protocol 0", "content": paragraphs[0]})) + 1
+
+        packed = pack_context(results, budget, COUNT, _format)
+        self.assertEqual([reference["title"] for reference in packed["references"]], ["Protocol 0", "Protocol 1"])
+        self.assertLessEqual(packed["tokens_used"], budget)
+        self.assertEqual(packed["tokens_omitted"], COUNT(paragraphs[2]))
+        self.assertIn(paragraphs[1].strip(), packed["context"])
+
+    def test_chunks_around_a_linked_duplicate_stay_separate(self):
+        """Chunks that had a near duplicate linked away between them are not joined as neighbours"""
+        first = "Assess breakthrough pain every hour."
+        following = "Start senna with every opioid prescription."
+        results = [_result(first, 10, 0), _result(following, 10, 1)]
+        results[1]["metadata"]["source_position"] = 2
+
+        packed = pack_context(results, 1000, COUNT, _format)
+        self.assertEqual(packed["references"][0]["content"], SPAN_SEPARATOR.join([first, following]))
+
+
+class TestServiceContextPacking(unittest.TestCase):
+    """Test cases for packed prompt context in the knowledge service"""
+
+    def test_guidance_context_merges_neighbouring_chunks(self):
+        """Retrieved neighbours of one document become one reference and savings reach the stats"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(
+                knowledge_dir,
+                KNOWLEDGE_TOKEN_ENCODING=APPROXIMATE_ENCODING,
+                KNOWLEDGE_CHUNK_TOKENS=64,
+                KNOWLEDGE_CHUNK_OVERLAP_TOKENS=16,
+                KNOWLEDGE_DEDUP=False,
+            )
+            document = " ".join(
+                f"Dyspnea step {i}: use pursed-lip breathing, a fan and upright positioning." for i in range(12)
+            )
+            service.add_document(document, title="Dyspnea Protocol", category="copd")
+            results = service.search("dyspnea pursed-lip breathing fan", k=len(service.documents), mode="lexical")
+            self.assertGreater(len(results), 2)
+
+            context = service._prepare_knowledge_context(results)
+            self.assertEqual(context.count("Title: Dyspnea Protocol"), 1)
+            self.assertIn(document, " ".join(context.split()))
+
+            stats = service.get_stats()["context_packing"]
+            self.assertEqual(stats["prompts"], 1)
+            self.assertGreater(stats["tokens_saved"], 0)
+            self.assertLessEqual(stats["tokens_used"], service.context_tokens)
+
+    def test_linked_duplicates_keep_source_positions(self):
+        """Chunks after a linked near duplicate record their source position and pack as separate spans"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir, KNOWLEDGE_CHUNK_TOKENS=32, KNOWLEDGE_CHUNK_OVERLAP_TOKENS=0)
+            assess = "Assess breakthrough pain on a zero to ten scale every hour and record the score in the chart."
+            offer = "Offer oral morphine five milligrams for breakthrough pain and reassess the patient after one hour."
+            senna = "Start senna with every opioid prescription to prevent constipation during treatment today."
+            service.add_document("\n\n".join([assess, offer, assess, senna]), title="Pain Protocol")
+
+            self.assertEqual(len(service.documents), 3)
+            self.assertEqual([service.metadata[row].get("source_position") for row in range(3)], [None, None, 3])
+            results = service.search("breakthrough pain senna", k=3, mode="lexical")
+            context = service.pack_context(results)["references"][0]["content"]
+            self.assertEqual(context, SPAN_SEPARATOR.join([assess + "\n" + offer, senna]))
+
+    def test_call_budget_fits_whole_chunks(self):
+        """The Retell budget is never smaller than the chunks it has to carry"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir, KNOWLEDGE_CHUNK_TOKENS=256, KNOWLEDGE_CALL_CONTEXT_TOKENS=400)
+            self.assertGreaterEqual(service.call_context_budget(2), 2 * 256)
+            service.call_context_tokens = 4000
+            self.assertEqual(service.call_context_budget(2), 4000)
+
+
+if __name__ == "__main__":
+    unittest.main()
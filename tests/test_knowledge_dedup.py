@@ -0,0 +1,149 @@
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pytest
+
+from src.core.knowledge_dedup import NearDuplicateIndex, dedup_scope, link_near_duplicates
+from src.core.knowledge_metadata import ChunkMetadata
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+NOTICE = (
+    "This telephone triage protocol is intended for use by registered hospice nurses only. "
+    "Always confirm the patient's identity, current medication list, allergies and advance directives "
+    "before giving advice. Escalate to the on-call physician whenever symptoms are new, severe or not "
+    "relieved by the measures in this protocol, and document every call in the electronic record within "
+    "one hour, including the advice given and the caregiver's understanding of it. Page {page} of 40."
+)
+
+
+def _paragraph(topic: str, seed: int) -> str:
+    """A distinct 60 word paragraph about ``topic``."""
+    rng = random.Random(f"{topic}-{seed}")
+    return " ".join(f"{topic}{rng.randrange(1000)}" for _ in range(60))
+
+
+def _document(topic: str, pages: int) -> str:
+    return "\n\n".join(f"{_paragraph(topic, page)}\n\n{NOTICE.format(page=page)}" for page in range(pages))
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    """Test cases for MinHash signatures and LSH buckets"""
+
+    def test_finds_near_duplicates_within_scope(self):
+        """Near duplicates match above the threshold, distinct text and other scopes do not"""
+        index = NearDuplicateIndex()
+        scope = dedup_scope("protocols", "Document: triage.pdf", ["triage", "protocols"])
+        index.add(7, index.signature(NOTICE.format(page=1)), scope)
+
+        match = index.find(index.signature(NOTICE.format(page=2)), scope)
+        self.assertEqual(match[0], 7)
+        self.assertGreaterEqual(match[1], index.threshold)
+        self.assertIsNone(index.find(index.signature(_paragraph("edema", 1)), scope))
+        self.assertIsNone(index.find(index.signature(NOTICE.format(page=2)), dedup_scope("copd", "", [])))
+        self.assertIsNone(index.find(index.signature(NOTICE.format(page=2)), scope, is_live=lambda chunk_id: False))
+        # The deleted canonical chunk is dropped for good
+        self.assertIsNone(index.find(index.signature(NOTICE.format(page=2)), scope))
+
+    def test_merged_buckets_keep_first_chunk(self):
+        """Buckets merged into the sorted arrays still resolve to the earliest chunk"""
+        index = NearDuplicateIndex()
+        for chunk_id in range(300):
+            index.add(chunk_id, index.signature(_paragraph("dyspnea", chunk_id)), "")
+        index.add(300, index.signature(NOTICE.format(page=1)), "")
+        index.add(301, index.signature(NOTICE.format(page=1)), "")
+
+        self.assertEqual(index.find(index.signature(_paragraph("dyspnea", 42)), "")[0], 42)
+        self.assertEqual(index.find(index.signature(NOTICE.format(page=9)), "")[0], 300)
+
+    def test_first_chunk_is_always_kept(self):
+        """Repeated chunks of one document link to its earlier chunks, never the first"""
+        index = NearDuplicateIndex()
+        chunks = [NOTICE.format(page=1), _paragraph("pain", 1), NOTICE.format(page=2), _paragraph("pain", 1)]
+        kept, links, signatures = link_near_duplicates(index, chunks, "")
+
+        self.assertEqual(kept, [0, 1])
+        self.assertEqual(links, {2: ("position", 0), 3: ("position", 1)})
+        self.assertEqual(len(signatures), 2)
+
+
+class TestIngestionDeduplication(unittest.TestCase):
+    """Test cases for linking near-duplicate chunks during add_document"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = make_service(self.tmp.name, KNOWLEDGE_CHUNK_CACHE=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _add(self, content, title, category="protocols", source="Document: triage.pdf"):
+        self.assertTrue(self.service.add_document(content, title=title, category=category, source=source))
+        return self.service.search(title, k=1, mode="lexical")[0]["metadata"]["document_id"]
+
+    def test_repeated_boilerplate_is_embedded_once(self):
+        """Per-page notices are linked to the first one and the savings are reported"""
+        document_id = self._add(_document("dyspnea", 4), "Dyspnea Protocol")
+        embedded = sum(self.service.embeddings.document_calls)
+
+        self.assertEqual(embedded, 5)
+        document = self.service.get_document(document_id)
+        self.assertEqual(len(document["chunk_ids"]), 5)
+        notice_id = document["chunk_ids"][1]
+        self.assertEqual(
+            [(link["chunk_index"], link["canonical_id"]) for link in document["linked_chunks"]],
+            [(3, notice_id), (5, notice_id), (7, notice_id)],
+        )
+
+        savings = self.service.get_stats()["deduplication"]
+        self.assertEqual(savings["linked_chunks"], 3)
+        self.assertEqual(savings["index_bytes_saved"], 3 * 1536 * 4)
+        self.assertGreater(savings["embedding_characters_saved"], 3 * 400)
+        self.assertEqual(self.service.index.ntotal, 5)
+
+    def test_savings_are_counted_not_scanned(self):
+        """Stats read the savings from counters kept as documents are linked, deleted and reloaded"""
+        document_id = self._add(_document("dyspnea", 4), "Dyspnea Protocol")
+        self._add(_document("nausea", 2), "Nausea Protocol")
+        with patch.object(ChunkMetadata, "extra_values", side_effect=AssertionError("scanned every row")):
+            self.assertEqual(self.service.get_stats()["deduplication"]["linked_chunks"], 5)
+            self.service.delete_document(document_id)
+            self.assertEqual(self.service.get_stats()["deduplication"]["linked_chunks"], 2)
+            worker = make_service(self.tmp.name)
+            self.assertEqual(worker.get_stats()["deduplication"]["linked_chunks"], 2)
+
+    def test_links_across_documents_of_the_same_scope(self):
+        """Later documents link to earlier chunks only when category, source and tags match"""
+        self._add(_document("dyspnea", 1), "Dyspnea Protocol")
+        self._add(_document("nausea", 1), "Nausea Protocol")
+        self._add(_document("edema", 1), "Edema Protocol", category="heart_failure")
+
+        self.assertEqual(self.service.index.ntotal, 5)
+        self.assertEqual(self.service.get_stats()["deduplication"]["linked_chunks"], 1)
+        self.assertEqual(
+            len(self.service.search("telephone triage protocol nurses", k=5, category_filter="heart_failure")), 2
+        )
+
+    def test_replaced_and_deleted_chunks_are_not_canonical(self):
+        """A replacement does not link to the chunks it replaces, and a restarted writer rebuilds the index"""
+        document_id = self._add(_document("dyspnea", 1), "Dyspnea Protocol")
+        new_id = self.service.replace_document(document_id, _document("dyspnea", 1))
+        self.assertEqual(len(self.service.get_document(new_id)["chunk_ids"]), 2)
+
+        self.service.delete_document(new_id)
+        writer = make_service(self.tmp.name, KNOWLEDGE_CHUNK_CACHE=False)
+        self.assertTrue(writer.add_document(_document("dyspnea", 1), title="Dyspnea", source="Document: triage.pdf"))
+        self.assertEqual(writer.get_stats()["deduplication"]["linked_chunks"], 0)
+
+        writer.add_document(_document("dyspnea", 2), title="Dyspnea v2", source="Document: triage.pdf")
+        self.assertEqual(writer.get_stats()["deduplication"]["linked_chunks"], 2)
+        # Deleted chunks were never offered to the rebuilt index
+        self.assertEqual(len(writer.dedup), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
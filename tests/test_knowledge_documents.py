@@ -0,0 +1,138 @@
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+import pytest
+
+from src.core.knowledge_index import LayeredIndex, build_id_index, exhaustive_search, with_ids
+from src.core.knowledge_filters import MetadataFilterIndex
+from src.core.knowledge_store import KnowledgeStore
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+class TestStableChunkIds(unittest.TestCase):
+    """Test cases for id-mapped indexes"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(60, 16)).astype(np.float32)
+        self.ids = np.arange(100, 220, 2, dtype=np.int64)
+
+    def test_layered_index_labels_are_chunk_ids(self):
+        """Searches return chunk ids, new chunks continue from next_id and rows maps ids back"""
+        index = LayeredIndex(build_id_index("flat", self.vectors, self.ids), next_id=300)
+        new_ids = index.add(self.vectors[:2] + 0.01)
+
+        np.testing.assert_array_equal(new_ids, [300, 301])
+        _, labels = index.search(self.vectors[5:6], 1)
+        self.assertEqual(labels[0, 0], 110)
+        np.testing.assert_array_equal(index.rows([110, 301, 111]), [5, 61, -1])
+
+        merged = faiss.downcast_index(index.merged())
+        np.testing.assert_array_equal(faiss.vector_to_array(merged.id_map)[-3:], [218, 300, 301])
+
+    def test_filters_apply_to_chunk_ids(self):
+        """Exhaustive HNSW searches and selections work in chunk id space"""
+        filters = MetadataFilterIndex()
+        filters.sync([{"id": int(i), "category": "rare" if i % 10 == 0 else "common"} for i in self.ids])
+        selection = filters.select(category="rare", exclude=np.array([100]))
+
+        hnsw = faiss.IndexHNSWFlat(16, 8)
+        hnsw.add(self.vectors)
+        _, labels = exhaustive_search(with_ids(hnsw, self.ids), self.vectors[:1], 3, selection.selector)
+        self.assertTrue(set(labels[0]) <= {110, 120, 130, 140, 150, 160, 170, 180, 190, 200, 210})
+        self.assertEqual(len(set(labels[0])), 3)
+
+
+class TestDocumentLifecycle(unittest.TestCase):
+    """Test cases for deleting, replacing and compacting knowledge documents"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = make_service(self.tmp.name, KNOWLEDGE_COMPACT_MIN_DELETED=1000)
+        self.service.add_document("Morphine titration for breakthrough pain", title="Pain", category="pain_management")
+        self.service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD", category="copd")
+        self.service.add_document("Daily weights for heart failure edema", title="Edema", category="heart_failure")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _document_id(self, query):
+        return self.service.search(query, k=1)[0]["metadata"]["document_id"]
+
+    def test_delete_document(self):
+        """Deleted documents disappear from search, stats and lookups"""
+        document_id = self._document_id("pursed-lip breathing COPD")
+        self.assertEqual(self.service.get_document(document_id)["title"], "COPD")
+
+        self.assertTrue(self.service.delete_document(document_id))
+        self.assertIsNone(self.service.get_document(document_id))
+        self.assertFalse(self.service.delete_document(document_id))
+        self.assertNotIn(
+            "COPD", [r["metadata"]["title"] for r in self.service.search("pursed-lip breathing COPD", k=3)]
+        )
+        self.assertEqual(self.service.get_stats()["categories"], {"pain_management": 1, "heart_failure": 1})
+
+        worker = make_service(self.tmp.name, embeddings=StubEmbeddings())
+        self.assertIsNone(worker.get_document(document_id))
+
+    def test_replace_document(self):
+        """Replacing a document swaps its chunks and keeps fields that were not given"""
+        document_id = self._document_id("daily weights edema")
+        new_id = self.service.replace_document(document_id, "Daily weights and fluid restriction for edema")
+
+        self.assertIsNone(self.service.get_document(document_id))
+        document = self.service.get_document(new_id)
+        self.assertEqual((document["title"], document["category"]), ("Edema", "heart_failure"))
+        results = self.service.search("daily weights edema", k=3)
+        self.assertEqual(
+            [r["content"] for r in results if r["metadata"]["title"] == "Edema"],
+            ["Daily weights and fluid restriction for edema"],
+        )
+        self.assertIsNone(self.service.replace_document(12345, "missing"))
+
+    def test_compaction_removes_deleted_chunks_and_keeps_ids(self):
+        """Compaction rewrites the index without dead rows and every live chunk keeps its id"""
+        pain_id = self._document_id("morphine titration")
+        edema_id = self._document_id("daily weights edema")
+        self.service.delete_document(self._document_id("pursed-lip breathing COPD"))
+        worker = make_service(self.tmp.name, embeddings=StubEmbeddings())
+        next_id = self.service.index.next_id
+
+        self.assertTrue(self.service.compact())
+        self.assertEqual(self.service.index.ntotal, 2)
+        self.assertEqual(self.service.store.tombstones, [])
+        self.assertEqual(self.service.get_stats()["deleted_chunks"], 0)
+        self.assertEqual(self.service.get_document(edema_id)["title"], "Edema")
+        self.assertEqual(self._document_id("morphine titration"), pain_id)
+
+        # Ids are never reused after compaction
+        self.service.add_document("Grief support for caregivers", title="Grief")
+        self.assertEqual(self._document_id("grief support caregivers"), next_id)
+
+        self.assertTrue(worker.refresh(force=True))
+        self.assertEqual(worker.get_document(edema_id)["title"], "Edema")
+        self.assertEqual(KnowledgeStore(self.tmp.name).load()[0].ntotal, 3)
+
+    def test_compaction_triggers_past_threshold(self):
+        """Commits compact automatically once deleted chunks pass the configured share"""
+        service = make_service(
+            self.tmp.name,
+            embeddings=StubEmbeddings(),
+            KNOWLEDGE_COMPACT_MIN_DELETED=2,
+            KNOWLEDGE_COMPACT_DELETED_RATIO=0.5,
+        )
+        service.delete_document(service.search("morphine titration", k=1)[0]["metadata"]["document_id"])
+        self.assertEqual(service.index.ntotal, 3)
+
+        service.delete_document(service.search("daily weights edema", k=1)[0]["metadata"]["document_id"])
+        self.assertEqual(service.index.ntotal, 1)
+        self.assertEqual(service.search("breathing", k=3)[0]["metadata"]["title"], "COPD")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,276 @@
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+import openai
+import pytest
+
+from src.core.knowledge_embeddings import (
+    EmbeddingProvider,
+    EmbeddingTimeout,
+    HashedNgramEmbeddings,
+    OpenAIEmbeddingProvider,
+    create_embedding_provider,
+    embed_texts,
+    iter_embedding_batches,
+)
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+class SlowEmbeddings(StubEmbeddings):
+    """Stub embedder that simulates network latency and tracks concurrency."""
+
+    def __init__(self, latency: float = 0.02, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._flight_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            return super().embed_documents(texts)
+        finally:
+            with self._flight_lock:
+                self.in_flight -= 1
+
+
+class TestIterEmbeddingBatches(unittest.TestCase):
+    """Test cases for batched, concurrent chunk embedding"""
+
+    def test_batches_preserve_input_order(self):
+        """Batches are yielded in input order with correct offsets"""
+        embeddings = SlowEmbeddings(dimension=16)
+        texts = [f"chunk number {i}" for i in range(23)]
+
+        batches = list(iter_embedding_batches(embeddings, texts, batch_size=5, max_workers=3))
+
+        self.assertEqual([offset for offset, _ in batches], [0, 5, 10, 15, 20])
+        stacked = np.vstack([matrix for _, matrix in batches])
+        expected = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        np.testing.assert_allclose(stacked, expected)
+
+    def test_uses_one_request_per_batch(self):
+        """Each batch is embedded with a single embed_documents call"""
+        embeddings = StubEmbeddings(dimension=8)
+        embed_texts(embeddings, [f"text {i}" for i in range(10)], batch_size=4, max_workers=2)
+
+        self.assertEqual(sorted(embeddings.document_calls), [2, 4, 4])
+        self.assertEqual(embeddings.query_calls, 0)
+
+    def test_concurrency_is_bounded(self):
+        """No more than max_workers batches are in flight at once"""
+        embeddings = SlowEmbeddings(latency=0.01, dimension=8)
+        embed_texts(embeddings, [f"text {i}" for i in range(40)], batch_size=2, max_workers=3)
+
+        self.assertLessEqual(embeddings.max_in_flight, 3)
+        self.assertGreater(embeddings.max_in_flight, 1)
+
+    def test_progress_callback(self):
+        """Progress callback reports cumulative chunk counts"""
+        progress = []
+        embed_texts(
+            StubEmbeddings(dimension=8),
+            [f"text {i}" for i in range(7)],
+            batch_size=3,
+            progress_callback=lambda done, total: progress.append((done, total)),
+        )
+
+        self.assertEqual(progress, [(3, 7), (6, 7), (7, 7)])
+
+    def test_provider_error_propagates(self):
+        """Errors from the embedding provider are raised to the caller"""
+        embeddings = StubEmbeddings(dimension=8)
+        embeddings.embed_documents = lambda texts: (_ for _ in ()).throw(RuntimeError("provider down"))
+
+        with self.assertRaises(RuntimeError):
+            embed_texts(embeddings, ["a", "b", "c"], batch_size=1)
+
+    def test_empty_input(self):
+        """Embedding no texts yields nothing"""
+        self.assertEqual(list(iter_embedding_batches(StubEmbeddings(), [])), [])
+
+
+class FlakyProvider(EmbeddingProvider):
+    """Provider whose first requests fail, hang or raise as scripted."""
+
+    model = "flaky"
+
+    def __init__(self, script=(), **options):
+        options.setdefault("sleep", self._record_sleep)
+        super().__init__(**options)
+        self.script = list(script)
+        self.batches = []
+        self.delays = []
+
+    def _record_sleep(self, delay):
+        self.delays.append(delay)
+
+    def _embed(self, texts):
+        self.batches.append(len(texts))
+        outcome = self.script.pop(0) if self.script else None
+        if outcome == "hang":
+            # Like an HTTP client, give up on the request once the timeout has passed
+            time.sleep(self.timeout or 0.5)
+            if self.timeout is not None:
+                raise EmbeddingTimeout(f"no answer within {self.timeout:g}s")
+        elif isinstance(outcome, Exception):
+            raise outcome
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class StatusError(Exception):
+    """Provider error carrying an HTTP status like the OpenAI client's."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class TestEmbeddingProvider(unittest.TestCase):
+    """Test cases for provider batching, timeouts and retries"""
+
+    def test_splits_requests_into_batches(self):
+        """Inputs larger than the batch size are sent as several requests and reassembled in order"""
+        provider = FlakyProvider(batch_size=3)
+        matrix = provider.embed_matrix(["a" * i for i in range(7)])
+
+        self.assertEqual(provider.batches, [3, 3, 1])
+        self.assertEqual(matrix[:, 0].tolist(), list(range(7)))
+        self.assertEqual(provider.embed_query("abc"), [3.0, 1.0])
+
+    def test_caller_batches_are_sent_whole(self):
+        """Batches sized by the caller go out as one request whatever the provider's batch size"""
+        provider = FlakyProvider(batch_size=3)
+        matrix = embed_texts(provider, ["a" * i for i in range(10)], batch_size=10, max_workers=1)
+        self.assertEqual(provider.batches, [10])
+        self.assertEqual(matrix[:, 0].tolist(), list(range(10)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            service = make_service(tmp, KNOWLEDGE_EMBEDDING_MODEL="hashed-ngram-128")
+            service.add_document("Subcutaneous morphine relieves breakthrough pain.", title="Pain")
+            service.embeddings.batch_size = 2
+            requests = service.embeddings.get_stats()["requests"]
+            queries = [f"pain question {number}" for number in range(5)]
+            self.assertEqual(len(service.search_many(queries, k=1, mode="vector")), 5)
+            self.assertEqual(service.embeddings.get_stats()["requests"], requests + 1)
+
+    def test_retries_failures_with_backoff(self):
+        """Failed requests are retried with growing delays and counted"""
+        provider = FlakyProvider([ConnectionError("reset"), StatusError(429)], backoff=1.0, timeout=None)
+        with self.assertLogs("palliative_care", level="WARNING"):
+            self.assertEqual(provider.embed_documents(["ab"]), [[2.0, 1.0]])
+
+        self.assertEqual(len(provider.delays), 2)
+        self.assertTrue(0.5 <= provider.delays[0] <= 1.0)
+        self.assertTrue(1.0 <= provider.delays[1] <= 2.0)
+        stats = provider.get_stats()
+        self.assertEqual((stats["requests"], stats["retries"], stats["failures"], stats["texts"]), (3, 2, 0, 1))
+
+    def test_gives_up_after_max_retries(self):
+        """The last error is raised once the retries are used up"""
+        provider = FlakyProvider([ConnectionError("down")] * 3, max_retries=2, timeout=None)
+        with self.assertLogs("palliative_care", level="WARNING"):
+            with self.assertRaises(ConnectionError):
+                provider.embed_query("text")
+        self.assertEqual(provider.get_stats()["failures"], 1)
+
+    def test_permanent_errors_are_not_retried(self):
+        """Bad requests and authentication errors fail at once"""
+        provider = OpenAIEmbeddingProvider("sk-test", "text-embedding-ada-002")
+        self.assertFalse(provider._retryable(StatusError(401)))
+        self.assertTrue(provider._retryable(StatusError(503)))
+        self.assertEqual((provider.dimension, provider.client.max_retries), (1536, 0))
+
+        flaky = FlakyProvider([ValueError("bad input")])
+        with self.assertRaises(ValueError):
+            flaky.embed_query("text")
+        self.assertEqual(flaky.get_stats()["retries"], 0)
+
+    def test_hung_request_times_out_and_is_retried(self):
+        """A request the client timed out is counted and sent again without a helper thread"""
+        provider = FlakyProvider(["hang"], timeout=0.05)
+        start = time.monotonic()
+        with self.assertLogs("palliative_care", level="WARNING"):
+            self.assertEqual(provider.embed_query("abcd"), [4.0, 1.0])
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(provider.get_stats()["timeouts"], 1)
+
+        self.assertFalse(any(thread.name.startswith("kb-embed-request") for thread in threading.enumerate()))
+
+        provider = FlakyProvider(["hang"], timeout=0.05, max_retries=0)
+        with self.assertRaises(EmbeddingTimeout):
+            provider.embed_query("abcd")
+
+        provider = OpenAIEmbeddingProvider("sk-test", "text-embedding-ada-002", timeout=12)
+        self.assertEqual((provider.client.request_timeout, provider.client.max_retries), (12, 0))
+        self.assertTrue(provider._timed_out(openai.APITimeoutError(request=None)))
+
+
+class TestHashedNgramEmbeddings(unittest.TestCase):
+    """Test cases for the local hashed n-gram embedder"""
+
+    def test_vectors_are_deterministic_and_normalised(self):
+        """Texts embed to the same unit vectors every time and in any batch"""
+        embeddings = HashedNgramEmbeddings(dimension=64)
+        texts = ["Morphine for breakthrough pain", "Oxygen for breathlessness in COPD", ""]
+        matrix = embeddings.embed_matrix(texts)
+
+        self.assertEqual(matrix.shape, (3, 64))
+        np.testing.assert_allclose(np.linalg.norm(matrix[:2], axis=1), [1.0, 1.0], rtol=1e-5)
+        self.assertFalse(matrix[2].any())
+        np.testing.assert_allclose(HashedNgramEmbeddings(dimension=64).embed_query(texts[1]), matrix[1], rtol=1e-6)
+        self.assertEqual(embeddings.model, "hashed-ngram-64")
+
+    def test_related_texts_are_nearest(self):
+        """Texts sharing words and word fragments are more similar than unrelated ones"""
+        embeddings = HashedNgramEmbeddings()
+        query, misspelt, unrelated = embeddings.embed_matrix(
+            [
+                "opioid dosing for breakthrough pain",
+                "opiod doses in breakthrough pains",
+                "nebulised saline for COPD",
+            ]
+        )
+        self.assertGreater(query @ misspelt, 0.3)
+        self.assertLess(query @ unrelated, 0.1)
+
+    def test_create_provider_by_model_name(self):
+        """Local model names need no API key; OpenAI models do"""
+        provider = create_embedding_provider("hashed-ngram-128", batch_size=8)
+        self.assertIsInstance(provider, HashedNgramEmbeddings)
+        self.assertEqual((provider.dimension, provider.batch_size), (128, 8))
+        self.assertIsNone(create_embedding_provider("text-embedding-ada-002"))
+        self.assertIsInstance(create_embedding_provider("text-embedding-3-small", "sk-test"), OpenAIEmbeddingProvider)
+        with self.assertRaises(ValueError):
+            create_embedding_provider("hashed-ngram-large")
+
+    def test_service_searches_offline(self):
+        """A service configured with the local model indexes and searches without an API key"""
+        with tempfile.TemporaryDirectory() as tmp:
+            service = make_service(tmp, KNOWLEDGE_EMBEDDING_MODEL="hashed-ngram-128")
+            self.assertIsInstance(service.embeddings, HashedNgramEmbeddings)
+            self.assertEqual(service.index.d, 128)
+
+            service.add_document("Subcutaneous morphine relieves breakthrough pain.", title="Pain")
+            service.add_document("Fans and oxygen ease breathlessness in COPD.", title="COPD")
+            results = service.search("morphine for breakthrough pain", k=1, mode="vector")
+            self.assertEqual(results[0]["metadata"]["title"], "Pain")
+            stats = service.get_stats()["embedding"]
+            self.assertEqual((stats["model"], stats["failures"]), ("hashed-ngram-128", 0))
+            self.assertGreater(stats["requests"], 0)
+
+            # Queries of another dimension than the index are answered lexically
+            service.embeddings = HashedNgramEmbeddings(dimension=32)
+            with self.assertLogs("palliative_care", level="WARNING"):
+                results = service.search("breathlessness", k=1, mode="vector")
+            self.assertEqual(results[0]["metadata"]["title"], "COPD")
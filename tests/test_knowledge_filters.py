@@ -0,0 +1,122 @@
+import tempfile
+import unittest
+
+import faiss
+import numpy as np
+import pytest
+
+from src.core.knowledge_filters import MetadataFilterIndex
+from src.core.knowledge_index import LayeredIndex, build_index
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+def _metadata(category, tags=(), source=""):
+    return {"category": category, "tags": list(tags), "source": source}
+
+
+class TestMetadataFilterIndex(unittest.TestCase):
+    """Test cases for the metadata inverted index"""
+
+    def setUp(self):
+        self.metadata = [
+            _metadata("copd", ["dyspnea", "emergency"], "GOLD"),
+            _metadata("heart_failure", ["dyspnea", "edema"], "HFSA"),
+            _metadata("copd", ["infection"], "GOLD"),
+            _metadata("pain_management", ["opioids"], "WHO"),
+        ]
+        self.filters = MetadataFilterIndex()
+        self.filters.sync(self.metadata)
+
+    def _rows(self, **criteria):
+        return list(np.flatnonzero(self.filters.select(**criteria).mask))
+
+    def test_no_filter_selects_nothing(self):
+        """Without criteria select returns None so search stays unfiltered"""
+        self.assertIsNone(self.filters.select())
+        self.assertIsNone(self.filters.select(category="", tags=[]))
+
+    def test_fields_and_values(self):
+        """Values in one field are OR-ed and fields are AND-ed"""
+        self.assertEqual(self._rows(category="copd"), [0, 2])
+        self.assertEqual(self._rows(tags=["dyspnea"]), [0, 1])
+        self.assertEqual(self._rows(tags=["edema", "opioids"]), [1, 3])
+        self.assertEqual(self._rows(category="copd", tags=["dyspnea"]), [0])
+        self.assertEqual(self._rows(category=["copd", "pain_management"], source="WHO"), [3])
+        self.assertEqual(self.filters.select(category="unknown").count, 0)
+
+    def test_incremental_sync_and_reload(self):
+        """Appended rows are indexed incrementally; a new metadata list is re-indexed"""
+        self.metadata.append(_metadata("copd"))
+        self.filters.sync(self.metadata)
+        self.assertEqual(self._rows(category="copd"), [0, 2, 4])
+
+        self.filters.sync([_metadata("copd")])
+        self.assertEqual(self._rows(category="copd"), [0])
+        self.assertEqual(self.filters.values("category"), {"copd": 1})
+
+
+class TestFilteredSearch(unittest.TestCase):
+    """Test cases for filters pushed into FAISS searches"""
+
+    def test_selective_filter_is_exact_on_ann_indexes(self):
+        """Filtered HNSW and IVF searches return the exact nearest matching rows"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+        metadata = [_metadata("rare" if i % 97 == 0 else "common") for i in range(len(vectors))]
+        filters = MetadataFilterIndex()
+        filters.sync(metadata)
+        selection = filters.select(category="rare")
+
+        exact = faiss.IndexFlatL2(32)
+        exact.add(vectors[selection.mask])
+        rare_rows = np.flatnonzero(selection.mask)
+        _, expected = exact.search(vectors[:5], 10)
+
+        for mode in ("flat", "hnsw", "ivf_flat", "ivf_pq"):
+            base = build_index(mode, 32, vectors[:2500])
+            base.add(vectors[:2500])
+            index = LayeredIndex(base, nprobe=1, ef_search=16)
+            index.add(vectors[2500:])
+
+            _, labels = index.search(vectors[:5], 10, selection=selection)
+            self.assertTrue(np.all(selection.mask[labels]), mode)
+            self.assertTrue(np.all(labels >= 0), mode)
+            if mode != "ivf_pq":
+                np.testing.assert_array_equal(labels, rare_rows[expected], err_msg=mode)
+
+    def test_service_returns_k_filtered_results(self):
+        """A selective category filter still returns k results when k chunks match"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir)
+            for i in range(40):
+                service.add_document(
+                    f"Breathing techniques and dyspnea positioning advice number {i}",
+                    title=f"General {i}",
+                    category="general",
+                    commit=False,
+                )
+            for i in range(3):
+                service.add_document(
+                    f"Sputum colour assessment step {i} for exacerbation",
+                    title=f"COPD {i}",
+                    category="copd",
+                    tags=["sputum"],
+                    source="GOLD COPD Guidelines",
+                    commit=False,
+                )
+            service.commit()
+
+            results = service.search("breathing techniques dyspnea positioning", k=3, category_filter="copd")
+            self.assertEqual(len(results), 3)
+            self.assertTrue(all(r["metadata"]["category"] == "copd" for r in results))
+
+            results = service.search("dyspnea", k=5, tags=["sputum"], source="GOLD COPD Guidelines")
+            self.assertEqual(len(results), 3)
+            self.assertEqual(service.search("dyspnea", k=3, category_filter="missing"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,226 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_filters import MetadataFilterIndex
+from src.core.knowledge_index import (
+    LayeredIndex,
+    build_id_index,
+    build_index,
+    choose_index_mode,
+    compare_index_modes,
+    extract_vectors,
+    index_codec,
+    index_mode,
+    index_recall,
+    resolve_index_layout,
+    resolve_index_mode,
+)
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+def clustered_vectors(count, dimension=32, clusters=20, seed=0):
+    """Vectors drawn around a few centres, like embeddings of related documents."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centres[labels] + 0.1 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+class TestIndexModes(unittest.TestCase):
+    """Test cases for index backend selection and construction"""
+
+    def test_choose_index_mode_by_corpus_size(self):
+        """Auto selection moves from flat to IVF-Flat to IVF-PQ as the corpus grows"""
+        self.assertEqual(choose_index_mode(100, 1000, 5000), "flat")
+        self.assertEqual(choose_index_mode(1000, 1000, 5000), "ivf_flat")
+        self.assertEqual(choose_index_mode(5000, 1000, 5000), "ivf_pq")
+
+    def test_resolve_explicit_mode(self):
+        """Explicit trained modes wait for enough vectors; unknown modes are rejected"""
+        self.assertEqual(resolve_index_mode("hnsw", 10), "hnsw")
+        self.assertEqual(resolve_index_mode("ivf_pq", 10), "flat")
+        self.assertEqual(resolve_index_mode("ivf_flat", 5000), "ivf_flat")
+        with self.assertRaises(ValueError):
+            resolve_index_mode("annoy", 10)
+
+    def test_build_each_mode(self):
+        """Every backend trains, searches and is detected by index_mode"""
+        vectors = clustered_vectors(2000)
+        for mode in ("flat", "ivf_flat", "hnsw", "ivf_pq"):
+            index = build_index(mode, vectors.shape[1], vectors)
+            index.add(vectors)
+            self.assertEqual(index_mode(index), mode)
+            self.assertEqual(index.ntotal, len(vectors))
+            self.assertEqual(extract_vectors(index).shape, vectors.shape)
+
+    def test_layered_index_uses_search_parameters(self):
+        """A layered IVF index applies nprobe to the base and still searches the delta"""
+        vectors = clustered_vectors(3000)
+        base = build_index("ivf_flat", vectors.shape[1], vectors)
+        base.add(vectors[:2500])
+        layered = LayeredIndex(base, nprobe=base.nlist)
+        layered.add(vectors[2500:])
+
+        self.assertEqual(layered.mode, "ivf_flat")
+        self.assertEqual(index_recall(layered, vectors, vectors[::50], k=10), 1.0)
+        _, labels = layered.search(vectors[2999], 1)
+        self.assertEqual(labels[0][0], 2999)
+
+    def test_compare_index_modes_reports_recall(self):
+        """The recall report measures every mode against the flat index"""
+        vectors = clustered_vectors(2000)
+        report = {row["mode"]: row for row in compare_index_modes(vectors, vectors[:50], k=5)}
+
+        self.assertEqual(set(report), {"flat", "ivf_flat", "hnsw", "ivf_pq"})
+        self.assertEqual(report["flat"]["recall_at_k"], 1.0)
+        self.assertGreater(report["hnsw"]["recall_at_k"], 0.9)
+        self.assertGreater(report["ivf_flat"]["recall_at_k"], 0.8)
+        self.assertLess(report["ivf_pq"]["bytes"], report["flat"]["bytes"])
+
+    def test_compare_skips_untrainable_modes(self):
+        """Trained modes are skipped for corpora too small to train them"""
+        vectors = clustered_vectors(100)
+        report = {row["mode"]: row for row in compare_index_modes(vectors, vectors[:5], k=5)}
+        self.assertIn("skipped", report["ivf_pq"])
+        self.assertEqual(report["flat"]["recall_at_k"], 1.0)
+
+
+class TestVectorCodecs(unittest.TestCase):
+    """Test cases for compressed vector storage and exact re-ranking"""
+
+    def test_resolve_index_layout(self):
+        """PQ always means IVF-PQ and trained codecs wait for enough vectors"""
+        self.assertEqual(resolve_index_layout("flat", "sq8", 5000), ("flat", "sq8"))
+        self.assertEqual(resolve_index_layout("hnsw", "sq8", 10), ("hnsw", "none"))
+        self.assertEqual(resolve_index_layout("hnsw", "fp16", 10), ("hnsw", "fp16"))
+        self.assertEqual(resolve_index_layout("flat", "pq", 5000), ("ivf_pq", "pq"))
+        self.assertEqual(resolve_index_layout("ivf_pq", "none", 5000), ("ivf_pq", "pq"))
+        with self.assertRaises(ValueError):
+            resolve_index_layout("flat", "int4", 10)
+
+    def test_build_each_codec(self):
+        """Scalar quantized backends keep their mode and report their codec"""
+        vectors = clustered_vectors(2000)
+        for mode in ("flat", "ivf_flat", "hnsw"):
+            for codec in ("fp16", "sq8"):
+                index = build_index(mode, vectors.shape[1], vectors, codec=codec)
+                index.add(vectors)
+                self.assertEqual((index_mode(index), index_codec(index)), (mode, codec))
+        self.assertEqual(index_codec(build_index("flat", 32, vectors, codec="pq")), "pq")
+
+    def test_rerank_restores_recall_of_compressed_index(self):
+        """Re-ranking candidates against exact vectors beats the compressed distances, with filters too"""
+        vectors = clustered_vectors(3000, dimension=64)
+        ids = np.arange(len(vectors), dtype=np.int64)
+        base = build_id_index("ivf_pq", vectors, ids)
+        compressed = LayeredIndex(base, nprobe=64)
+        reranked = LayeredIndex(base, nprobe=64, base_vectors=vectors, rerank_factor=8)
+
+        self.assertFalse(compressed.reranks)
+        self.assertTrue(reranked.reranks)
+        queries = vectors[::60]
+        self.assertGreater(index_recall(reranked, vectors, queries), index_recall(compressed, vectors, queries))
+        self.assertGreater(index_recall(reranked, vectors, queries), 0.9)
+
+        filters = MetadataFilterIndex()
+        filters.sync([{"id": int(i), "category": "even" if i % 2 == 0 else "odd"} for i in ids])
+        _, labels = reranked.search(vectors[:3], 5, filters.select(category="odd"))
+        self.assertTrue((labels % 2 == 1).all())
+        self.assertEqual(labels[1, 0], 1)
+
+    def test_compare_reports_codecs(self):
+        """The report lists bytes per chunk and re-ranked recall for compressed layouts"""
+        vectors = clustered_vectors(2000)
+        report = {
+            (row["mode"], row["codec"]): row
+            for row in compare_index_modes(vectors, vectors[:50], k=5, modes=["flat"], codecs=["none", "sq8", "pq"])
+        }
+
+        self.assertEqual(set(report), {("flat", "none"), ("flat", "sq8"), ("ivf_pq", "pq")})
+        self.assertNotIn("recall_at_k_reranked", report[("flat", "none")])
+        self.assertLess(report[("flat", "sq8")]["bytes_per_chunk"], report[("flat", "none")]["bytes_per_chunk"] / 3)
+        self.assertGreaterEqual(
+            report[("ivf_pq", "pq")]["recall_at_k_reranked"], report[("ivf_pq", "pq")]["recall_at_k"]
+        )
+        self.assertEqual(report[("flat", "sq8")]["exact_vector_bytes"], vectors.nbytes)
+
+
+class TestIndexMigration(unittest.TestCase):
+    """Test cases for automatic index migration in the service"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _add_documents(self, service, count):
+        for i in range(count):
+            service.add_document(
+                f"Protocol note {i} about symptom {i % 7} and medication {i % 11}",
+                title=f"Note {i}",
+                category="protocols",
+                commit=False,
+            )
+        service.commit()
+
+    def test_auto_migrates_past_threshold(self):
+        """Crossing the IVF threshold rebuilds the index as IVF-Flat and persists it"""
+        config = dict(KNOWLEDGE_IVF_THRESHOLD=80, KNOWLEDGE_NPROBE=64)
+        service = make_service(self.tmp.name, **config)
+        self._add_documents(service, 60)
+        self.assertEqual(service.get_stats()["index_mode"], "flat")
+
+        self._add_documents(service, 40)
+        self.assertEqual(service.get_stats()["index_mode"], "ivf_flat")
+        self.assertEqual(service.index.ntotal, 100)
+        results = service.search("Protocol note 42 about symptom 0 and medication 9", k=1)
+        self.assertEqual(results[0]["metadata"]["title"], "Note 42")
+
+        reloaded = make_service(self.tmp.name, **config)
+        self.assertEqual(reloaded.index.mode, "ivf_flat")
+        self.assertEqual(reloaded.index.nprobe, 64)
+
+    def test_explicit_hnsw_mode(self):
+        """An explicit HNSW mode is applied at startup and used for search"""
+        service = make_service(self.tmp.name)
+        self._add_documents(service, 20)
+
+        hnsw = make_service(self.tmp.name, KNOWLEDGE_INDEX_MODE="hnsw")
+        self.assertEqual(hnsw.index.mode, "hnsw")
+        results = hnsw.search("Protocol note 7 about symptom 0 and medication 7", k=1)
+        self.assertEqual(results[0]["metadata"]["title"], "Note 7")
+
+        report = {row["mode"]: row for row in hnsw.index_report(k=5, modes=["flat", "hnsw"])}
+        self.assertEqual(report["flat"]["recall_at_k"], 1.0)
+        self.assertIn("recall_at_k", report["hnsw"])
+
+    def test_compressed_codec_stores_exact_vectors(self):
+        """A compressed snapshot keeps memory-mapped exact vectors that survive commits and reloads"""
+        service = make_service(self.tmp.name)
+        self._add_documents(service, 20)
+
+        fp16 = make_service(self.tmp.name, KNOWLEDGE_VECTOR_CODEC="fp16")
+        self.assertEqual((fp16.index.mode, fp16.index.codec), ("flat", "fp16"))
+        self.assertTrue(fp16.get_stats()["index_reranks"])
+        self.assertIsInstance(fp16.index.base_vectors, np.memmap)
+        np.testing.assert_array_equal(fp16.index.base_vectors, extract_vectors(service.index))
+        results = fp16.search("Protocol note 7 about symptom 0 and medication 7", k=1)
+        self.assertEqual(results[0]["metadata"]["title"], "Note 7")
+
+        self._add_documents(fp16, 5)
+        fp16.store.write_snapshot(fp16.index, fp16.documents, fp16.metadata)
+        reloaded = make_service(self.tmp.name, KNOWLEDGE_VECTOR_CODEC="fp16")
+        self.assertEqual(reloaded.index.base_vectors.shape, (25, reloaded.index.d))
+        self.assertEqual(len(list(Path(self.tmp.name).glob("vectors.*.npy"))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
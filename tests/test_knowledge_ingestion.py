@@ -0,0 +1,433 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from src import db
+from src.api.health import health_bp
+from src.api.knowledge import knowledge_bp
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.core.knowledge_ingestion import (
+    IngestionStatus,
+    available_cpus,
+    extract_pdf_pages,
+    ingestion_lock,
+    iter_page_chunks,
+    iter_parallel_extractions,
+    plan_directory_ingestion,
+    source_entry,
+    source_key,
+)
+from src.core.knowledge_store import KnowledgeStore, expand_id_ranges, id_ranges
+from tests.knowledge_helpers import StubEmbeddings, make_service, slow_extract, write_text_pdf
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+class FailingEmbeddings(StubEmbeddings):
+    """Stub embedder that fails for texts containing a marker word."""
+
+    def embed_documents(self, texts):
+        if any("explode" in text for text in texts):
+            raise RuntimeError("embedding provider unavailable")
+        return super().embed_documents(texts)
+
+
+class TestIngestionPlan(unittest.TestCase):
+    """Test cases for comparing a directory with the file manifest"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, text):
+        path = self.directory / name
+        path.write_text(text)
+        return path
+
+    def test_plan_detects_new_changed_touched_and_removed(self):
+        """Only new and content-changed files are ingested"""
+        same = self._write("same.txt", "unchanged")
+        touched = self._write("touched.txt", "touched")
+        changed = self._write("changed.txt", "old text")
+        sources = {source_key(path): source_entry(path, [i]) for i, path in enumerate((same, touched, changed))}
+        sources[source_key(self.directory / "gone.txt")] = {"name": "gone.txt", "chunk_ids": [[3, 4]]}
+        sources["/elsewhere/other.txt"] = {"name": "other.txt", "chunk_ids": []}
+
+        os.utime(touched, ns=(1, 1))
+        changed.write_text("new text, longer")
+        new = self._write("new.txt", "brand new")
+
+        plan_changed, plan_touched, removed = plan_directory_ingestion(
+            self.directory, [same, touched, changed, new], sources
+        )
+        self.assertEqual(plan_changed, [changed, new])
+        self.assertEqual(list(plan_touched), [source_key(touched)])
+        self.assertEqual(plan_touched[source_key(touched)]["mtime_ns"], 1)
+        self.assertEqual(removed, [source_key(self.directory / "gone.txt")])
+
+        plan_changed, _, _ = plan_directory_ingestion(self.directory, [same, touched], sources, force=True)
+        self.assertEqual(plan_changed, [same, touched])
+
+    def test_id_ranges_round_trip(self):
+        """Chunk ids are stored as compact ranges"""
+        self.assertEqual(id_ranges([5, 1, 2, 3, 7, 6]), [[1, 4], [5, 8]])
+        self.assertEqual(expand_id_ranges([[1, 4], [5, 8]]), [1, 2, 3, 5, 6, 7])
+
+
+class TestStoreTombstones(unittest.TestCase):
+    """Test cases for tombstones and source entries in the store manifest"""
+
+    def test_tombstones_and_sources_commit_atomically(self):
+        """Staged deletions and source entries become visible only on commit"""
+        with tempfile.TemporaryDirectory() as directory:
+            service = make_service(directory)
+            service.add_document("Edema management with daily weights", title="Edema")
+            store = service.store
+
+            store.stage_delete([0])
+            store.stage_source("/docs/a.txt", {"name": "a.txt", "chunk_ids": [[0, 1]]})
+            self.assertEqual(KnowledgeStore(directory).tombstones, [])
+            service.commit()
+
+            reader = KnowledgeStore(directory)
+            reader.load()
+            self.assertEqual(reader.tombstones, [0])
+            self.assertEqual(reader.sources["/docs/a.txt"]["chunk_ids"], [[0, 1]])
+            self.assertEqual(service.search("edema daily weights", k=1), [])
+            self.assertEqual(service.get_stats()["total_chunks"], 0)
+
+    def test_staged_chunk_ids_shift_after_concurrent_commit(self):
+        """Source chunk ids follow staged chunks appended after another process's commit"""
+        with tempfile.TemporaryDirectory() as directory:
+            first = make_service(directory)
+            first.add_document("Opioid rotation guidance", title="Opioids")
+            second = make_service(directory)
+
+            first.add_document("Constipation prevention with opioids", title="Bowel")
+            second.add_document("Oxygen therapy for COPD", title="COPD", commit=False)
+            second.store.stage_source("/docs/copd.txt", {"name": "copd.txt", "chunk_ids": id_ranges([1])})
+            second.commit()
+
+            self.assertEqual(second.store.sources["/docs/copd.txt"]["chunk_ids"], [[2, 3]])
+            self.assertEqual(second.documents[2], "Oxygen therapy for COPD")
+
+
+class TestDirectoryIngestion(unittest.TestCase):
+    """Test cases for incremental directory ingestion in the service"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.knowledge_dir = Path(self.tmp.name) / "knowledge"
+        self.documents_dir = Path(self.tmp.name) / "documents"
+        self.documents_dir.mkdir()
+        self.embeddings = StubEmbeddings()
+        self.service = make_service(self.knowledge_dir, embeddings=self.embeddings)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, text):
+        (self.documents_dir / name).write_text(text)
+
+    def _ingest(self, service=None, force=False):
+        env = {
+            "LOAD_DOCUMENTS": "true",
+            "FORCE_RELOAD_DOCUMENTS": "true" if force else "false",
+            "DOCUMENTS_DIR": str(self.documents_dir),
+        }
+        with patch.dict(os.environ, env):
+            (service or self.service)._load_documents_from_directory()
+
+    def test_only_new_files_are_ingested(self):
+        """Re-running ingestion skips unchanged files and picks up new ones"""
+        self._write("pain_protocol.txt", "Breakthrough pain dosing with morphine")
+        self._write("copd_handbook.txt", "Pursed-lip breathing for COPD")
+        self._ingest()
+        self.assertEqual(len(self.service.documents), 2)
+        calls = len(self.embeddings.document_calls)
+
+        self._ingest()
+        self.assertEqual(len(self.embeddings.document_calls), calls)
+
+        self._write("edema.txt", "Daily weights for edema")
+        self._ingest()
+        self.assertEqual(len(self.service.documents), 3)
+        self.assertEqual(len(self.service.store.sources), 3)
+        self.assertEqual(self.service.get_stats()["deleted_chunks"], 0)
+
+    def test_replaced_and_deleted_files_are_tombstoned(self):
+        """Chunks from changed or deleted files no longer appear in search"""
+        self._write("pain_protocol.txt", "Breakthrough pain dosing with morphine")
+        self._write("copd_handbook.txt", "Pursed-lip breathing for COPD")
+        self._ingest()
+
+        self._write("pain_protocol.txt", "Breakthrough pain dosing with hydromorphone instead")
+        (self.documents_dir / "copd_handbook.txt").unlink()
+        self._ingest()
+
+        results = self.service.search("breakthrough pain morphine pursed-lip breathing COPD", k=5)
+        self.assertEqual([r["content"] for r in results], ["Breakthrough pain dosing with hydromorphone instead"])
+        self.assertEqual(self.service.get_stats()["deleted_chunks"], 2)
+        self.assertEqual(len(self.service.store.sources), 1)
+
+        self._ingest(force=True)
+        self.assertEqual(self.service.get_stats()["total_chunks"], 1)
+
+    def test_resume_after_failed_file(self):
+        """Committed files survive a failure and the next run ingests only the rest"""
+        self._write("a_first.txt", "Hospice eligibility criteria")
+        self._write("b_broken.txt", "This file will explode the embedder")
+        self._write("c_last.txt", "Grief support for caregivers")
+        self.service.embeddings = FailingEmbeddings()
+        self._ingest()
+        self.assertEqual(len(self.service.store.sources), 2)
+        self.assertEqual(self.service.index.ntotal, 2)
+
+        worker = make_service(self.knowledge_dir, embeddings=StubEmbeddings())
+        self._ingest(worker)
+        self.assertEqual(worker.embeddings.document_calls, [1])
+        self.assertEqual(len(worker.store.sources), 3)
+        self.assertEqual(worker.get_stats()["total_chunks"], 3)
+
+    def test_unreadable_pdf_does_not_stop_ingestion(self):
+        """PDFs are extracted in worker processes; a corrupt one fails alone"""
+        write_text_pdf(self.documents_dir / "copd_protocol.pdf", ["Pursed-lip breathing", "Green sputum and fever"])
+        (self.documents_dir / "broken_protocol.pdf").write_bytes(b"%PDF-1.4\nnot really a pdf")
+        self._write("pain_protocol.txt", "Breakthrough pain dosing with morphine")
+        self._ingest()
+
+        status = self.service.get_ingestion_status()
+        self.assertEqual((status["files_done"], status["files_failed"]), (2, 1))
+        self.assertEqual(len(self.service.store.sources), 2)
+        result = self.service.search("green sputum fever", k=1, mode="lexical")[0]
+        self.assertEqual((result["metadata"]["page"], result["metadata"]["page_end"]), (1, 2))
+
+        # A forced reload takes the PDF text from the shared cache instead of parsing it again
+        self._ingest(force=True)
+        self.assertEqual(self.service.get_stats()["text_cache"]["hits"], 1)
+
+    def test_adopts_documents_ingested_without_manifest(self):
+        """Documents loaded before the manifest existed are not ingested twice"""
+        self._write("pain_protocol.txt", "Breakthrough pain dosing with morphine")
+        self.service.add_document(
+            "Breakthrough pain dosing with morphine", title="Pain", source="Document: pain_protocol.txt"
+        )
+        self._ingest()
+
+        self.assertEqual(len(self.service.documents), 1)
+        entry = self.service.store.sources[source_key(self.documents_dir / "pain_protocol.txt")]
+        self.assertEqual(entry["chunk_ids"], [[0, 1]])
+
+
+def _pages(count, start=1):
+    """Generate numbered pages of distinct text without holding them all."""
+    for number in range(start, start + count):
+        words = " ".join(f"term{(number * 37 + i * 11) % 5003}x{number}" for i in range(number % 7 * 40 + 60))
+        yield number, f"Page {number} guidance.\n\n{words}"
+
+
+class TestPagedIngestion(unittest.TestCase):
+    """Test cases for streaming page-at-a-time ingestion"""
+
+    def test_page_chunks_cover_the_document_with_page_spans(self):
+        """Streamed chunks cover the joined pages in order and carry the pages they span"""
+        pages = list(_pages(40))
+        text = "\n\n".join(page for _, page in pages)
+        chunks = list(iter_page_chunks(pages, 1000, 200, window=3000))
+
+        position = 0
+        for chunk, page, page_end in chunks:
+            self.assertLessEqual(len(chunk), 1000)
+            position = text.index(chunk, position)
+            self.assertEqual(text.count("Page ", 0, position + len("Page ")), page)
+            self.assertEqual(text.count("Page ", 0, position + len(chunk)), page_end)
+        self.assertEqual(set(" ".join(chunk for chunk, _, _ in chunks).split()), set(text.split()))
+        self.assertEqual((chunks[0][1], chunks[-1][2]), (1, 40))
+
+    def test_memory_stays_flat_with_document_size(self):
+        """Peak memory of chunking a page stream does not grow with the number of pages"""
+        peaks = []
+        for count in (100, 1000):
+            tracemalloc.start()
+            chunks = sum(1 for _ in iter_page_chunks(_pages(count), 1000, 200))
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            self.assertGreater(chunks, count)
+
+        self.assertLess(peaks[1], 1.5 * peaks[0])
+
+    def test_streamed_document_records_pages(self):
+        """Pages are indexed one window at a time; counts and links are final after the last page"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir, KNOWLEDGE_EMBED_BATCH_SIZE=2, KNOWLEDGE_EMBED_CONCURRENCY=1)
+            notice = (
+                "Call the on-call hospice nurse at any hour if symptoms are new, severe or not relieved by the "
+                "measures in this handbook. Keep the medication list, allergies and advance directives by the "
+                "telephone, and have the patient's chart number ready so the nurse can review recent visits "
+                "and the current plan of care before advising you on what to do next."
+            )
+            pages = ((number, f"{text}\n\n{notice}") for number, text in _pages(6))
+            self.assertTrue(service.add_pages(pages, title="Handbook", category="caregiving"))
+            self.assertTrue(all(size <= 2 for size in service.embeddings.document_calls))
+
+            worker = make_service(knowledge_dir)
+            document = worker.get_document(int(worker.metadata[0]["document_id"]))
+            rows = [worker.metadata[row] for row in range(len(worker.metadata))]
+            self.assertEqual(len(document["chunks"]), len(rows))
+            self.assertEqual({meta["total_chunks"] for meta in rows}, {len(rows)})
+            self.assertEqual(rows[0]["page"], 1)
+            self.assertEqual(rows[-1]["page_end"], 6)
+            self.assertEqual(len(document["linked_chunks"]), 5)
+            canonical_ids = {link["canonical_id"] for link in document["linked_chunks"]}
+            self.assertEqual(len(canonical_ids), 1)
+            self.assertIn("on-call hospice nurse", worker.documents[int(worker.index.rows(list(canonical_ids))[0])])
+
+
+class TestParallelExtraction(unittest.TestCase):
+    """Test cases for process-pool text extraction"""
+
+    def test_slow_file_times_out_without_stalling_others(self):
+        """A file past its timeout is reported as TimeoutError after the others complete"""
+        results = list(
+            iter_parallel_extractions(
+                ["a.pdf", "hang.pdf", "b.pdf", "c.pdf"], extract=slow_extract, max_workers=2, timeout=1
+            )
+        )
+
+        self.assertEqual(results[-1][0], "hang.pdf")
+        self.assertIsInstance(results[-1][2], TimeoutError)
+        self.assertEqual(
+            sorted((path, text) for path, text, error in results[:-1] if error is None),
+            [("a.pdf", "A.PDF"), ("b.pdf", "B.PDF"), ("c.pdf", "C.PDF")],
+        )
+        self.assertEqual(list(iter_parallel_extractions([], extract=slow_extract)), [])
+
+    def test_extracts_numbered_pages(self):
+        """PDF pages are returned with 1-based numbers, and the pool fits the available CPUs"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "handbook.pdf"
+            write_text_pdf(path, ["Hospice eligibility", "Grief support"])
+            self.assertEqual(extract_pdf_pages(path), [(1, "Hospice eligibility"), (2, "Grief support")])
+        self.assertGreaterEqual(available_cpus(), 1)
+
+
+class TestBackgroundIngestion(unittest.TestCase):
+    """Test cases for non-blocking startup and readiness"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.knowledge_dir = Path(self.tmp.name) / "knowledge"
+        self.documents_dir = Path(self.tmp.name) / "documents"
+        self.documents_dir.mkdir()
+        (self.documents_dir / "pain_protocol.txt").write_text("Breakthrough pain dosing with morphine")
+        self.env = patch.dict(
+            os.environ,
+            {
+                "LOAD_DOCUMENTS": "true",
+                "FORCE_RELOAD_DOCUMENTS": "false",
+                "DOCUMENTS_DIR": str(self.documents_dir),
+            },
+        )
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def _service(self):
+        service = make_service(self.knowledge_dir)
+        # make_service ran its (empty) ingestion inline; start over as a freshly booted worker
+        service.ingestion = IngestionStatus()
+        self.assertFalse(service.is_ready())
+        return service
+
+    def test_ingestion_runs_in_background(self):
+        """Ingestion progress is reported and the service becomes ready when it completes"""
+        service = self._service()
+        service.start_background_ingestion()
+        self.assertTrue(service.wait_for_ingestion(timeout=30))
+
+        status = service.get_ingestion_status()
+        self.assertEqual(status["state"], "complete")
+        self.assertEqual((status["files_total"], status["files_done"]), (1, 1))
+        self.assertEqual(status["chunks_embedded"], 1)
+        self.assertTrue(service.is_ready())
+        self.assertEqual(len(service.search("breakthrough pain", k=1)), 1)
+        self.assertEqual(service.get_stats()["ingestion"]["state"], "complete")
+
+    def test_second_worker_skips_while_another_ingests(self):
+        """A worker that cannot take the ingestion lock serves the other worker's commits"""
+        service = self._service()
+        with ingestion_lock(self.knowledge_dir / ".ingest.lock"):
+            service.run_ingestion(blocking=False)
+        self.assertEqual(service.get_ingestion_status()["state"], "skipped")
+        self.assertFalse(service.is_ready())
+
+        make_service(self.knowledge_dir).run_ingestion()
+        self.assertTrue(service.refresh(force=True))
+        self.assertTrue(service.is_ready())
+
+    def test_health_and_readiness_endpoints(self):
+        """/healthz is always up and /readyz waits for the first knowledge snapshot"""
+        service = self._service()
+        app = Flask(__name__)
+        app.config.update(SQLALCHEMY_DATABASE_URI="sqlite://")
+        db.init_app(app)
+        app.register_blueprint(health_bp)
+        client = app.test_client()
+
+        with patch("src.api.health.get_knowledge_service", return_value=service):
+            self.assertEqual(client.get("/healthz").status_code, 200)
+            response = client.get("/readyz")
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(response.get_json()["checks"]["database"]["ready"])
+            self.assertEqual(response.get_json()["checks"]["knowledge_base"]["ingestion"]["state"], "idle")
+
+            service.run_ingestion()
+            response = client.get("/readyz")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["status"], "ready")
+
+    def test_search_answers_while_not_ready(self):
+        """Searches serve what is loaded and flag readiness instead of failing"""
+        service = self._service()
+        app = Flask(__name__)
+        app.config.update(JWT_SECRET_KEY="knowledge-readiness-test-secret-key")
+        JWTManager(app)
+        app.register_blueprint(knowledge_bp, url_prefix="/api/v1/knowledge")
+        client = app.test_client()
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+        with patch("src.api.knowledge.get_knowledge_service", return_value=service):
+            response = client.post("/api/v1/knowledge/search", json={"query": "breakthrough pain"}, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.get_json()["results"], response.get_json()["ready"]), ([], False))
+            response = client.post(
+                "/api/v1/knowledge/search/batch", json={"queries": ["breakthrough pain"]}, headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.get_json()["ready"])
+
+            service.run_ingestion()
+            response = client.post(
+                "/api/v1/knowledge/search", json={"query": "breakthrough pain", "k": 1}, headers=headers
+            )
+            self.assertTrue(response.get_json()["ready"])
+            self.assertEqual(response.get_json()["total_results"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import io
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_index import RowSelection
+from src.core.knowledge_lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+CHUNKS = [
+    "Furosemide 40 mg daily for edema in NYHA Class IV heart failure",
+    "Green sputum and fever suggest a COPD exacerbation with infection",
+    "Breakthrough pain: morphine immediate release every hour as needed",
+    "Daily weights help detect fluid retention in heart failure",
+]
+
+
+class UnavailableEmbeddings(StubEmbeddings):
+    """Stub embedder whose query endpoint is down."""
+
+    def embed_query(self, text):
+        raise TimeoutError("embedding provider timed out")
+
+
+class TestBM25Index(unittest.TestCase):
+    """Test cases for the BM25 inverted index"""
+
+    def test_exact_terms_rank_first(self):
+        """Rare exact terms outrank chunks that only share common words"""
+        index = BM25Index.build(CHUNKS)
+        self.assertEqual(tokenize("NYHA Class IV"), ["nyha", "class", "iv"])
+
+        rows, scores = index.search("furosemide heart failure", 3)
+        self.assertEqual(rows.tolist(), [0, 3])
+        self.assertGreater(scores[0], scores[1])
+        self.assertEqual(index.search("green sputum", 3)[0].tolist(), [1])
+        self.assertEqual(index.search("unrelated words", 3)[0].tolist(), [])
+
+        rows, _ = index.search("heart failure", 3, allowed=lambda rows: rows != 0)
+        self.assertEqual(rows.tolist(), [3])
+
+    def test_save_load_merges_tail_postings(self):
+        """Saved postings include rows added after loading and score the same"""
+        index = BM25Index.build(CHUNKS[:2])
+        buffer = io.BytesIO()
+        index.save(buffer)
+        buffer.seek(0)
+        loaded = BM25Index.load(buffer)
+        loaded.sync(CHUNKS)
+
+        buffer = io.BytesIO()
+        loaded.save(buffer)
+        buffer.seek(0)
+        restored = BM25Index.load(buffer)
+        expected = BM25Index.build(CHUNKS)
+        for query in ("heart failure edema", "morphine pain", "sputum"):
+            np.testing.assert_array_equal(restored.search(query, 4)[0], expected.search(query, 4)[0])
+            np.testing.assert_allclose(restored.search(query, 4)[1], expected.search(query, 4)[1])
+
+    def test_reciprocal_rank_fusion(self):
+        """Rows found by both rankings move ahead of rows found by one"""
+        fused = reciprocal_rank_fusion([np.array([5, 7, 9, -1]), np.array([9, 3])])
+        self.assertEqual(fused.tolist(), [9, 5, 7, 3])
+
+
+class TestHybridSearch(unittest.TestCase):
+    """Test cases for hybrid and lexical knowledge search"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = make_service(self.tmp.name, KNOWLEDGE_DELTA_COMPACT_MIN_RECORDS=2)
+        for i, chunk in enumerate(CHUNKS):
+            self.service.add_document(chunk, title=f"Chunk {i}", category="copd" if "COPD" in chunk else "general")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lexical_mode_skips_embedding(self):
+        """Lexical searches answer from BM25 without calling the embedding provider"""
+        query_calls = self.service.embeddings.query_calls
+        results = self.service.search("furosemide NYHA", k=2, mode="lexical")
+
+        self.assertEqual(self.service.embeddings.query_calls, query_calls)
+        self.assertEqual(results[0]["metadata"]["title"], "Chunk 0")
+        self.assertEqual(results[0]["relevance"], "high")
+        self.assertEqual({result["score_type"] for result in results}, {"bm25"})
+        self.assertEqual(self.service.search("furosemide", k=2, category_filter="copd", mode="lexical"), [])
+
+    def test_hybrid_results_carry_vector_distances(self):
+        """Hybrid results are fused from both searches and scored by L2 distance"""
+        results = self.service.search("green sputum fever", k=3, mode="hybrid")
+        vector = {
+            r["metadata"]["id"]: r["score"] for r in self.service.search("green sputum fever", k=4, mode="vector")
+        }
+
+        self.assertEqual(results[0]["metadata"]["title"], "Chunk 1")
+        for result in results:
+            self.assertAlmostEqual(result["score"], vector[result["metadata"]["id"]], places=4)
+
+    def test_hybrid_search_reuses_vector_distances(self):
+        """Hybrid searches run FAISS once; rows only BM25 found are scored by BM25"""
+        index_search = self.service.index.search
+
+        def nearest_only(queries, k, selection=None):
+            # A vector leg that found only its nearest chunk, so BM25 contributes the rest
+            distances, labels = index_search(queries, k, selection=selection)
+            labels[:, 1:] = -1
+            return distances, labels
+
+        query = "daily weights heart failure furosemide"
+        vector = self.service.search(query, k=1, mode="vector")[0]
+        lexical = {r["metadata"]["id"]: r["score"] for r in self.service.search(query, k=4, mode="lexical")}
+        with patch.object(self.service.index, "search", side_effect=nearest_only) as search:
+            results = self.service.search(query, k=2, mode="hybrid")
+        self.assertEqual(search.call_count, 1)
+
+        self.assertEqual(len(results), 2)
+        for result in results:
+            chunk_id = result["metadata"]["id"]
+            if chunk_id == vector["metadata"]["id"]:
+                self.assertEqual(result["score_type"], "distance")
+                self.assertAlmostEqual(result["score"], vector["score"], places=4)
+            else:
+                # Found only by the lexical search: a BM25 score, where higher is better
+                self.assertEqual(result["score_type"], "bm25")
+                self.assertAlmostEqual(result["score"], lexical[chunk_id], places=4)
+
+    def test_filtered_lexical_search_skips_ids_beyond_the_selection(self):
+        """Chunk ids past the end of a filter bitmap are not allowed"""
+        selection = RowSelection(np.array([True, False, True]))
+        self.assertEqual(selection.contains(np.array([0, 1, 2, 3, 9])).tolist(), [True, False, True, False, False])
+
+    def test_falls_back_to_lexical_when_embedding_fails(self):
+        """A failing query embedder still gets answers, from the lexical index"""
+        self.service.embeddings = UnavailableEmbeddings()
+        self.service.query_cache = None
+
+        results = self.service.search("morphine breakthrough pain", k=1)
+        self.assertEqual(results[0]["metadata"]["title"], "Chunk 2")
+
+    def test_snapshot_persists_postings(self):
+        """Workers load the BM25 postings written with the snapshot"""
+        self.assertIn("lexical", self.service.store.manifest["snapshot"])
+        worker = make_service(self.tmp.name)
+        self.assertEqual(len(worker.store.load_lexical()), worker.store.manifest["snapshot"]["records"])
+        self.assertEqual(
+            [r["metadata"]["id"] for r in worker.search("daily weights", k=2, mode="lexical")],
+            [r["metadata"]["id"] for r in self.service.search("daily weights", k=2, mode="lexical")],
+        )
+        # Delta chunks committed after the snapshot are indexed before the loaded state is swapped in
+        self.assertEqual(len(worker.lexical), len(worker.documents))
+
+
+if __name__ == "__main__":
+    unittest.main()
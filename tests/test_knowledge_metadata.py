@@ -0,0 +1,130 @@
+import io
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+
+from src.core.knowledge_metadata import ChunkMetadata
+from tests.knowledge_helpers import make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+def _chunk(chunk_id, chunk_index, category="copd", **fields):
+    meta = {
+        "id": chunk_id,
+        "document_id": chunk_id - chunk_index,
+        "title": "COPD Exacerbation Management",
+        "category": category,
+        "tags": ["COPD", "dyspnea"],
+        "source": "GOLD COPD Guidelines",
+        "chunk_index": chunk_index,
+        "total_chunks": 3,
+        "added_at": "2024-05-01T12:30:45.123456",
+        "content_hash": "9e107d9d372bb6826bd81d3542a419d6",
+    }
+    meta.update(fields)
+    return meta
+
+
+class TestChunkMetadata(unittest.TestCase):
+    """Test cases for columnar chunk metadata"""
+
+    def test_rows_round_trip(self):
+        """Rows come back as the dicts that were appended, including unusual fields"""
+        records = [
+            _chunk(0, 0),
+            _chunk(1, 1, category="pain_management", tags=[], added_at="2024-05-02T08:00:00"),
+            {"id": 2, "title": "Legacy", "page": 4, "content_hash": "not-a-digest"},
+        ]
+        metadata = ChunkMetadata(records)
+
+        self.assertEqual(metadata, records)
+        self.assertEqual(metadata[-1], records[2])
+        self.assertEqual(metadata[0:2], records[:2])
+        self.assertEqual(len(metadata.values("title")), 2)
+        np.testing.assert_array_equal(metadata.chunk_indexes, [0, 1, 0])
+
+        buffer = io.BytesIO()
+        metadata.save(buffer)
+        buffer.seek(0)
+        restored = ChunkMetadata.load(buffer)
+        self.assertEqual(restored, records)
+        self.assertEqual(restored.category_counts(), {"copd": 1, "pain_management": 1, "uncategorized": 1})
+
+    def test_utc_timestamps_are_kept_in_the_column(self):
+        """Timestamps with a UTC offset round-trip through the column; other offsets stay verbatim"""
+        records = [
+            _chunk(0, 0, added_at="2025-01-02T03:04:05.000006+00:00"),
+            _chunk(1, 1),
+            _chunk(2, 2, added_at="2025-01-02T03:04:05+02:00"),
+        ]
+        metadata = ChunkMetadata(records)
+        self.assertEqual(metadata, records)
+        self.assertEqual(metadata._extras, {2: {"added_at": "2025-01-02T03:04:05+02:00"}})
+        self.assertEqual(metadata.last_added_at, "2025-01-02T03:04:05.000006+00:00")
+
+        buffer = io.BytesIO()
+        metadata.save(buffer)
+        buffer.seek(0)
+        restored = ChunkMetadata.load(buffer)
+        self.assertEqual(restored, records)
+        self.assertEqual(restored.last_added_at, "2025-01-02T03:04:05.000006+00:00")
+
+    def test_assign_ids_derives_document_ids(self):
+        """Assigning chunk ids moves every row's document id with it"""
+        metadata = ChunkMetadata([_chunk(0, 0), _chunk(1, 1), _chunk(2, 2)])
+        metadata.assign_ids([10, 11, 12])
+        self.assertEqual([(m["id"], m["document_id"]) for m in metadata], [(10, 10), (11, 10), (12, 10)])
+
+    def test_counts_and_take(self):
+        """Category counts exclude deleted rows and survive taking a subset of rows"""
+        metadata = ChunkMetadata([_chunk(i, i % 3, category="copd" if i % 4 else "heart_failure") for i in range(12)])
+        self.assertEqual(metadata.category_counts(), {"heart_failure": 3, "copd": 9})
+        self.assertEqual(metadata.category_counts(exclude_rows=np.array([0, 4])), {"heart_failure": 1, "copd": 9})
+
+        taken = metadata.take([4, 5, 6])
+        self.assertEqual(taken, [metadata[4], metadata[5], metadata[6]])
+        self.assertEqual(taken.category_counts(), {"heart_failure": 1, "copd": 2})
+        self.assertEqual(taken.last_added_at, "2024-05-01T12:30:45.123456")
+
+    def test_memory_per_chunk(self):
+        """Columns cost a fraction of a dict per chunk"""
+        records = [_chunk(1000 + i, i % 50) for i in range(2000)]
+        metadata = ChunkMetadata(records)
+        dict_bytes = sum(
+            sys.getsizeof(meta) + sum(sys.getsizeof(meta[key]) for key in ("id", "document_id", "content_hash"))
+            for meta in records
+        )
+        # 64 bytes per chunk, including the page and token count columns
+        self.assertLessEqual(metadata.nbytes / len(records), 64)
+        self.assertLess(metadata.nbytes * 5, dict_bytes)
+
+
+class TestServiceMetadata(unittest.TestCase):
+    """Test cases for stats and categories served from columnar metadata"""
+
+    def test_stats_and_categories_skip_deleted_documents(self):
+        """Deleted documents no longer count towards stats or the category list"""
+        with tempfile.TemporaryDirectory() as knowledge_dir:
+            service = make_service(knowledge_dir)
+            service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD", category="copd")
+            service.add_document("Daily weights for heart failure edema", title="Edema", category="heart_failure")
+            self.assertEqual(service.get_categories(), ["copd", "heart_failure"])
+
+            document_id = service.search("pursed-lip breathing", k=1)[0]["metadata"]["document_id"]
+            service.delete_document(document_id)
+            self.assertEqual(service.get_categories(), ["heart_failure"])
+
+            worker = make_service(knowledge_dir)
+            self.assertIsInstance(worker.metadata, ChunkMetadata)
+            stats = worker.get_stats()
+            self.assertEqual(stats["categories"], {"heart_failure": 1})
+            self.assertEqual(stats["last_updated"], service.metadata[-1]["added_at"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import base64
+import json
+import pickle
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+import pytest
+
+from src.core.knowledge_metadata import ChunkMetadata
+from src.core.knowledge_migration import migrate_knowledge_store, pending_migration
+from src.core.knowledge_store import KnowledgeStore, KnowledgeStoreMigrationRequired, file_checksum
+from tests.knowledge_helpers import make_service
+from tests.test_knowledge_store import DIMENSION, make_chunks
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+
+def _pickled_columns(metadata):
+    """Column state as releases before the ``.npz`` metadata format pickled it."""
+    return {
+        "rows": len(metadata),
+        "ids": metadata._ids.view(),
+        "chunk_index": metadata._chunk_index.view(),
+        "total_chunks": metadata._total_chunks.view(),
+        "added_at": metadata._added_at.view(),
+        "present": metadata._present.view(),
+        "codes": {field: codes.view() for field, codes in metadata._codes.items()},
+        "vocabularies": {field: vocabulary.values for field, vocabulary in metadata._vocabularies.items()},
+        "hashes": bytes(metadata._hashes),
+        "extras": metadata._extras,
+    }
+
+
+class TestKnowledgeMigration(unittest.TestCase):
+    """Test cases for migrating knowledge stores written by older releases"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.store = KnowledgeStore(self.directory)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_text_file_snapshot(self, vectors, documents, metadata, pickled_metadata: bytes):
+        """Write a format 2 store: two snapshot chunks with pickled metadata and one delta chunk."""
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(vectors[:2])
+        faiss.write_index(index, str(self.directory / "faiss_index.1.bin"))
+        (self.directory / "chunks.1.txt").write_bytes("".join(documents[:2]).encode("utf-8"))
+        np.save(self.directory / "chunks.1.npy", np.array([0, 7, 14], dtype=np.int64))
+        (self.directory / "metadata.1.pkl").write_bytes(pickled_metadata)
+        payload = json.dumps(
+            {
+                "vector": base64.b64encode(vectors[2].tobytes()).decode("ascii"),
+                "document": documents[2],
+                "metadata": metadata[2],
+            }
+        ).encode("utf-8")
+        record = f"{zlib.crc32(payload):08x} ".encode("ascii") + payload + b"\n"
+        (self.directory / "delta.1.log").write_bytes(record)
+        snapshot = {"records": 2, "next_id": 2}
+        for key, name in (
+            ("index", "faiss_index.1.bin"),
+            ("texts", "chunks.1.txt"),
+            ("offsets", "chunks.1.npy"),
+            ("metadata", "metadata.1.pkl"),
+        ):
+            snapshot[key] = name
+            snapshot[f"{key}_checksum"] = file_checksum(self.directory / name)
+        (self.directory / "manifest.json").write_text(
+            json.dumps(
+                {
+                    "format": 2,
+                    "version": 1,
+                    "snapshot": snapshot,
+                    "delta": {"path": "delta.1.log", "records": 1, "bytes": len(record)},
+                }
+            )
+        )
+
+    def test_text_file_snapshot_is_migrated(self):
+        """Snapshots with a text file per version and pickled metadata are rewritten by the migration"""
+        vectors, documents, metadata = make_chunks(0, 3)
+        self.write_text_file_snapshot(vectors, documents, metadata, pickle.dumps(metadata[:2]))
+
+        with self.assertRaises(KnowledgeStoreMigrationRequired):
+            self.store.load()
+        self.assertIn("text file", pending_migration(self.directory))
+        self.assertEqual(migrate_knowledge_store(self.directory), 2)
+        self.assertIsNone(pending_migration(self.directory))
+
+        index, loaded_documents, loaded_metadata = self.store.load()
+        self.assertEqual(list(loaded_documents), documents)
+        self.assertEqual([meta["title"] for meta in loaded_metadata], ["Doc"] * 3)
+        self.assertEqual(index.ntotal, 3)
+        self.assertEqual(self.store.manifest["format"], 3)
+        self.assertEqual(sorted(p.name for p in self.directory.glob("*.pkl")), [])
+
+    def test_pickled_chunk_metadata_columns_are_migrated(self):
+        """Snapshot metadata pickled as column state is rebuilt without unpickling the live class"""
+        vectors, documents, metadata = make_chunks(0, 3)
+        metadata[0]["linked_chunks"] = [[4, "0" * 32, 20]]
+        metadata[1]["tags"] = ["pain", "opioids"]
+        with patch.object(ChunkMetadata, "__getstate__", _pickled_columns, create=True):
+            pickled = pickle.dumps(ChunkMetadata(metadata[:2]))
+        self.write_text_file_snapshot(vectors, documents, metadata, pickled)
+
+        migrate_knowledge_store(self.directory)
+        _, _, loaded_metadata = self.store.load()
+        self.assertEqual([dict(meta, document_id=meta["id"]) for meta in metadata], list(loaded_metadata))
+        self.assertEqual(loaded_metadata.linked_totals(), (1, 20))
+
+    def test_legacy_store_is_migrated(self):
+        """Legacy faiss_index.bin + metadata.pkl files are migrated by the migration, never by a worker"""
+        vectors, documents, metadata = make_chunks(0, 3)
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(vectors)
+        faiss.write_index(index, str(self.directory / "faiss_index.bin"))
+        with open(self.directory / "metadata.pkl", "wb") as f:
+            pickle.dump({"documents": documents, "metadata": metadata}, f)
+
+        # A worker refuses to start rather than commit an empty store over the old one
+        with self.assertRaises(KnowledgeStoreMigrationRequired):
+            make_service(self.directory)
+        self.assertFalse((self.directory / "manifest.json").exists())
+
+        migrate_knowledge_store(self.directory)
+        _, loaded_documents, _ = self.store.load()
+        self.assertEqual(list(loaded_documents), documents)
+        self.assertTrue((self.directory / "manifest.json").exists())
+        self.assertFalse((self.directory / "faiss_index.bin").exists())
+        self.assertIsNone(migrate_knowledge_store(self.directory))
+
+    def test_unexpected_pickled_objects_are_refused(self):
+        """A metadata.pkl referring to anything but data and chunk metadata is not unpickled"""
+        vectors, documents, _ = make_chunks(0, 1)
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(vectors)
+        faiss.write_index(index, str(self.directory / "faiss_index.bin"))
+        with open(self.directory / "metadata.pkl", "wb") as f:
+            pickle.dump({"documents": documents, "metadata": [{"hook": print}]}, f)
+
+        with self.assertRaises(pickle.UnpicklingError):
+            migrate_knowledge_store(self.directory)
+        self.assertTrue((self.directory / "metadata.pkl").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from src.api.knowledge import knowledge_bp
+from src.core.knowledge_rebuild import ThrottledEmbeddings, reconstruct_pages
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+TOPICS = ["dyspnea", "nausea", "edema", "delirium", "constipation", "insomnia"]
+
+
+def _document(topic: str, paragraphs: int = 6) -> str:
+    """Distinct paragraphs of words about ``topic``."""
+    rng = random.Random(topic)
+    return "\n\n".join(" ".join(f"{topic}{rng.randrange(500)}" for _ in range(40)) + "." for _ in range(paragraphs))
+
+
+class StubEmbeddingsV2(StubEmbeddings):
+    """Stub embedder standing in for a newer embedding model."""
+
+    model = "stub-v2"
+
+
+class NoiseEmbeddings(StubEmbeddings):
+    """Embedder whose vectors carry no meaning, so recall collapses."""
+
+    model = "noise"
+
+    def _embed(self, text):
+        rng = np.random.default_rng(abs(hash(text)) % 2**32)
+        return rng.normal(size=self.dimension).astype(np.float32).tolist()
+
+
+class TestRebuildHelpers(unittest.TestCase):
+    """Test cases for text reconstruction and embedding throttling"""
+
+    def test_reconstruct_pages_joins_overlaps(self):
+        """Chunks rejoin at their overlap, contained chunks are skipped and pages are kept"""
+        chunks = [
+            ("Assess breathing. Check oxygen saturation", 1),
+            ("Check oxygen saturation and positioning.", 1),
+            ("oxygen saturation", 1),
+            ("Section 2 Pain", 2),
+        ]
+        self.assertEqual(
+            reconstruct_pages(chunks),
+            [
+                (1, "Assess breathing. Check oxygen saturation and positioning."),
+                (2, "Section 2 Pain"),
+            ],
+        )
+
+    def test_throttle_spaces_batches_by_token_budget(self):
+        """Each batch waits for the time the previous batches' tokens take at the configured rate"""
+        now, waits = [100.0], []
+        throttled = ThrottledEmbeddings(
+            StubEmbeddings(dimension=8),
+            tokens_per_minute=600,
+            count_tokens=lambda text: len(text.split()),
+            clock=lambda: now[0],
+            sleep=waits.append,
+        )
+        throttled.embed_documents(["one two three four five"] * 2)
+        throttled.embed_documents(["six seven"])
+        now[0] += 0.5
+        throttled.embed_documents(["eight"])
+
+        self.assertEqual(len(waits), 2)
+        self.assertAlmostEqual(waits[0], 1.0)
+        self.assertAlmostEqual(waits[1], 0.7)
+        self.assertEqual(throttled.tokens_embedded, 13)
+        self.assertEqual(throttled.model, "StubEmbeddings")
+
+
+class TestGenerationRebuild(unittest.TestCase):
+    """Test cases for building and swapping index generations"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.service = make_service(self.tmp.name, KNOWLEDGE_CHUNK_CACHE=False, KNOWLEDGE_REBUILD_TOKENS_PER_MINUTE=0)
+        self.document_ids = {}
+        for topic in TOPICS:
+            self.assertTrue(self.service.add_document(_document(topic), title=f"{topic.title()} Protocol"))
+            self.document_ids[topic] = self.service.search(_document(topic)[:200], k=1)[0]["metadata"]["document_id"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rebuild_swaps_generation_and_workers_follow(self):
+        """A new model and chunk size are swapped in and a running worker follows without a restart"""
+        v2 = StubEmbeddingsV2()
+        worker = make_service(self.tmp.name)
+        worker.embeddings_factory = lambda model: v2 if model == "stub-v2" else None
+        chunks_before = self.service.get_stats()["total_chunks"]
+        self.assertEqual(self.service.get_stats()["generation"]["embedding_model"], "StubEmbeddings")
+
+        self.service.chunk_tokens, self.service.chunk_overlap_tokens = 96, 16
+        version = self.service.rebuild_generation(v2)
+
+        self.assertIsNotNone(version)
+        stats = self.service.get_stats()
+        self.assertEqual(stats["generation"]["embedding_model"], "stub-v2")
+        self.assertIn(":96:16", stats["generation"]["chunk_params"])
+        self.assertGreater(stats["total_chunks"], chunks_before)
+        self.assertEqual(stats["rebuild"]["state"], "complete")
+        self.assertGreaterEqual(stats["rebuild"]["recall_new"], stats["rebuild"]["recall_live"] - 0.02)
+
+        self.assertTrue(worker.refresh(force=True))
+        self.assertIs(worker.embeddings, v2)
+        self.assertEqual(worker.store.version, version)
+        for topic in TOPICS:
+            result = worker.search(_document(topic)[200:400], k=1, mode="vector")[0]
+            self.assertEqual(result["metadata"]["title"], f"{topic.title()} Protocol")
+            self.assertLessEqual(result["metadata"]["token_count"], 96)
+            # Chunk ids are never reused by the new generation
+            self.assertGreater(result["metadata"]["document_id"], max(self.document_ids.values()))
+            document = worker.get_document(result["metadata"]["document_id"])
+            content = " ".join(chunk["content"] for chunk in document["chunks"])
+            for paragraph in _document(topic).split("\n\n"):
+                self.assertIn(paragraph[:80], content)
+
+    def test_rebuild_catches_up_with_concurrent_commits(self):
+        """Documents added and deleted by another worker during the build are in the swapped generation"""
+        writer = make_service(self.tmp.name, KNOWLEDGE_CHUNK_CACHE=False)
+        service = self.service
+        doomed = self.document_ids["nausea"]
+
+        class InterleavedEmbeddings(StubEmbeddingsV2):
+            """Commits from another worker while the first batch is embedded."""
+
+            def embed_documents(self, texts):
+                if not self.document_calls:
+                    writer.add_document(_document("hiccups"), title="Hiccups Protocol")
+                    writer.delete_document(doomed)
+                return super().embed_documents(texts)
+
+        version = service.rebuild_generation(InterleavedEmbeddings())
+
+        self.assertIsNotNone(version)
+        titles = {r["metadata"]["title"] for r in service.search(_document("hiccups")[:300], k=3, mode="vector")}
+        self.assertIn("Hiccups Protocol", titles)
+        self.assertNotIn(
+            "Nausea Protocol",
+            {r["metadata"]["title"] for r in service.search(_document("nausea")[:300], k=6, mode="lexical")},
+        )
+        self.assertEqual(service.get_stats()["deleted_chunks"], 0)
+
+    def test_ingestion_under_a_swapped_generation_is_not_committed(self):
+        """Chunks embedded by the old model are refused once another worker swaps in a new generation"""
+        v2 = StubEmbeddingsV2()
+        worker = make_service(self.tmp.name, KNOWLEDGE_CHUNK_CACHE=False)
+        worker.embeddings_factory = lambda model: v2 if model == "stub-v2" else None
+        rebuilder = self.service
+
+        class SwappingEmbeddings(StubEmbeddings):
+            """Old model whose first batch is embedded while another worker swaps generations."""
+
+            def embed_documents(self, texts):
+                if not self.document_calls:
+                    self.version = rebuilder.rebuild_generation(v2)
+                return super().embed_documents(texts)
+
+        worker.embeddings = old = SwappingEmbeddings()
+        with self.assertLogs("palliative_care", level="WARNING") as logs:
+            self.assertFalse(worker.add_document(_document("hiccups"), title="Hiccups Protocol"))
+        self.assertIsNotNone(old.version)
+        self.assertTrue(any("cannot be committed to generation" in line for line in logs.output))
+
+        # Nothing of the old model reached the store and the worker now embeds for the new generation
+        self.assertEqual(worker.store.version, old.version)
+        self.assertFalse(worker.store.has_pending)
+        self.assertIs(worker.embeddings, v2)
+        self.assertNotIn(
+            "Hiccups Protocol",
+            {r["metadata"]["title"] for r in worker.search(_document("hiccups")[:300], k=6, mode="lexical")},
+        )
+
+        self.assertTrue(worker.add_document(_document("hiccups"), title="Hiccups Protocol"))
+        result = worker.search(_document("hiccups")[:300], k=1, mode="vector")[0]
+        self.assertEqual(result["metadata"]["title"], "Hiccups Protocol")
+        self.assertEqual(worker.get_stats()["generation"]["embedding_model"], "stub-v2")
+
+    def test_rejects_generation_with_worse_recall(self):
+        """A generation that loses held-out recall is not swapped in"""
+        version = self.service.store.version
+
+        self.assertIsNone(self.service.rebuild_generation(NoiseEmbeddings()))
+        stats = self.service.get_stats()
+        self.assertEqual(stats["rebuild"]["state"], "rejected")
+        self.assertLess(stats["rebuild"]["recall_new"], stats["rebuild"]["recall_live"])
+        self.assertEqual(self.service.store.version, version)
+        self.assertEqual(stats["generation"]["embedding_model"], "StubEmbeddings")
+
+    def test_only_configuration_changes_outdate_the_generation(self):
+        """A worker whose tokenizer fails to load sees the live generation as current; outdated ones wait to be asked"""
+        service = self.service
+        service.embedding_model = "StubEmbeddings"
+        with patch("tiktoken.get_encoding", side_effect=OSError("no network")):
+            self.assertFalse(service.generation_outdated())
+            self.assertFalse(service.get_stats()["generation_outdated"])
+
+        service.chunk_tokens = 96
+        self.assertTrue(service.generation_outdated())
+        with self.assertLogs("palliative_care", level="WARNING"):
+            self.assertFalse(service._maybe_rebuild_generation())
+        self.assertIsNone(service._rebuild_thread)
+
+
+class TestRebuildEndpoint(unittest.TestCase):
+    """Test cases for the index rebuild endpoint"""
+
+    def test_unavailable_service_answers_503(self):
+        """Like its sibling routes, a rebuild without a knowledge service is refused with 503"""
+        app = Flask(__name__)
+        app.config.update(JWT_SECRET_KEY="knowledge-rebuild-test-secret-key")
+        JWTManager(app)
+        app.register_blueprint(knowledge_bp, url_prefix="/api/v1/knowledge")
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+        admin = SimpleNamespace(is_admin=True, username="admin")
+        with patch("src.api.knowledge.get_knowledge_service", return_value=None):
+            with patch("src.api.knowledge.User") as user_model:
+                user_model.query.get.return_value = admin
+                response = app.test_client().post("/api/v1/knowledge/rebuild", headers=headers)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json(), {"error": "Knowledge base service not available"})
+
+
+if __name__ == "__main__":
+    unittest.main()
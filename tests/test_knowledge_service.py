@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+
+import pytest
+
+from tests.knowledge_helpers import StubEmbeddings, make_service
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+LONG_DOCUMENT = "\n\n".join(
+    f"Section {i}: Morphine and oxycodone dosing guidance for breakthrough pain, paragraph {i}. " * 4 for i in range(12)
+)
+
+
+class TestKnowledgeBaseService(unittest.TestCase):
+    """Test cases for KnowledgeBaseService"""
+
+    def setUp(self):
+        """Set up a service rooted in a temporary directory"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.embeddings = StubEmbeddings()
+        self.service = make_service(
+            self.tmp.name,
+            embeddings=self.embeddings,
+            KNOWLEDGE_EMBED_BATCH_SIZE=4,
+            KNOWLEDGE_EMBED_CONCURRENCY=2,
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_add_document_embeds_in_batches(self):
+        """add_document embeds chunks in configured batches and indexes every chunk"""
+        progress = []
+        success = self.service.add_document(
+            LONG_DOCUMENT,
+            title="Opioid Guide",
+            category="pain_management",
+            progress_callback=lambda done, total: progress.append((done, total)),
+        )
+
+        self.assertTrue(success)
+        total_chunks = len(self.service.documents)
+        self.assertGreater(total_chunks, 4)
+        self.assertEqual(self.service.index.ntotal, total_chunks)
+        self.assertEqual(self.embeddings.query_calls, 0)
+        self.assertTrue(all(size <= 4 for size in self.embeddings.document_calls))
+        self.assertEqual(progress[-1], (total_chunks, total_chunks))
+        self.assertEqual([meta["chunk_index"] for meta in self.service.metadata], list(range(total_chunks)))
+
+    def test_search_returns_added_document(self):
+        """Search finds the chunk that matches the query"""
+        self.service.add_document("Daily weights and leg elevation for edema", title="Edema", category="heart_failure")
+        self.service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD", category="copd")
+
+        results = self.service.search("edema leg elevation", k=1)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["metadata"]["title"], "Edema")
+
+    def test_search_many_matches_single_searches(self):
+        """Batched search embeds once, applies per-query filters and drops duplicate content"""
+        self.service.add_document("Daily weights and leg elevation for edema", title="Edema", category="heart_failure")
+        self.service.add_document(
+            "Daily weights and leg elevation for edema", title="Edema copy", category="heart_failure"
+        )
+        self.service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD", category="copd")
+        queries = ["edema leg elevation", "pursed-lip breathing", "daily weights"]
+        expected = [
+            self.service.search(queries[0], k=3),
+            self.service.search(queries[1], k=3),
+            self.service.search(queries[2], k=3, category_filter="copd"),
+        ]
+        self.service.query_cache = None
+        document_calls = len(self.embeddings.document_calls)
+
+        results = self.service.search_many(queries, k=3, filters=[None, {}, {"category": "copd"}])
+
+        self.assertEqual(results, expected)
+        self.assertEqual(self.embeddings.document_calls[document_calls:], [3])
+        self.assertEqual([r["metadata"]["title"] for r in results[0]][:1], ["Edema"])
+        self.assertEqual(len([r for r in results[0] if r["metadata"]["category"] == "heart_failure"]), 1)
+        self.assertEqual([r["metadata"]["title"] for r in results[2]], ["COPD"])
+        self.assertEqual(self.service.search_many(queries[:1], k=1, filters={"category": "missing"}), [[]])
+
+    def test_bulk_add_commits_once(self):
+        """Staged documents are only persisted by an explicit commit"""
+        self.service.add_document("Pain scale review", title="Pain", commit=False)
+        self.service.add_document("Sputum colour review", title="COPD", commit=False)
+        self.assertFalse((self.service.knowledge_dir / "manifest.json").exists())
+
+        version = self.service.commit()
+
+        reloaded = make_service(self.tmp.name)
+        self.assertEqual(version, 1)
+        self.assertEqual(list(reloaded.documents), list(self.service.documents))
+        self.assertEqual(reloaded.index.ntotal, self.service.index.ntotal)
+
+    def test_worker_picks_up_commit_from_another_worker(self):
+        """A second service on the same store hot-swaps to newly committed documents"""
+        self.service.add_document("Daily weights and leg elevation for edema", title="Edema")
+        other_worker = make_service(self.tmp.name)
+        self.assertEqual(len(other_worker.documents), len(self.service.documents))
+
+        self.service.add_document("Pursed-lip breathing for COPD dyspnea", title="COPD")
+
+        self.assertTrue(other_worker.refresh(force=True))
+        results = other_worker.search("pursed-lip breathing", k=1)
+        self.assertEqual(results[0]["metadata"]["title"], "COPD")
+
+    def test_add_document_without_embeddings(self):
+        """add_document fails cleanly when embeddings are unavailable"""
+        self.service.embeddings = None
+        self.assertFalse(self.service.add_document("content", title="No embeddings"))
@@ -0,0 +1,243 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import faiss
+import numpy as np
+import pytest
+
+from src.core.knowledge_store import KnowledgeStore, KnowledgeStoreError, file_checksum
+
+# Mark all tests as nondestructive
+pytestmark = pytest.mark.nondestructive
+
+DIMENSION = 8
+
+
+def make_chunks(start, count):
+    """Build deterministic vectors, texts and metadata for chunk rows."""
+    rng = np.random.default_rng(start)
+    vectors = rng.random((count, DIMENSION), dtype=np.float32)
+    documents = [f"chunk {start + i}" for i in range(count)]
+    metadata = [{"id": start + i, "title": "Doc"} for i in range(count)]
+    return vectors, documents, metadata
+
+
+class TestKnowledgeStore(unittest.TestCase):
+    """Test cases for the snapshot + delta log knowledge store"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.store = KnowledgeStore(self.directory, compact_ratio=1.0, compact_min_records=10)
+        self.index = faiss.IndexFlatL2(DIMENSION)
+        self.documents = []
+        self.metadata = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def add(self, count, commit=True):
+        vectors, documents, metadata = make_chunks(len(self.documents), count)
+        self.index.add(vectors)
+        self.documents.extend(documents)
+        self.metadata.extend(metadata)
+        self.store.stage(vectors, documents, metadata)
+        if commit:
+            return self.store.commit(self.index, self.documents, self.metadata)
+
+    def test_commit_appends_to_delta_log(self):
+        """Small commits append to the delta log instead of rewriting the snapshot"""
+        self.add(4)
+        snapshot_name = self.store.manifest["snapshot"]["index"]
+        snapshot_mtime = (self.directory / snapshot_name).stat().st_mtime_ns
+
+        version = self.add(2)
+
+        self.assertEqual(version, 2)
+        self.assertEqual(self.store.manifest["snapshot"]["index"], snapshot_name)
+        self.assertEqual((self.directory / snapshot_name).stat().st_mtime_ns, snapshot_mtime)
+        self.assertEqual(self.store.manifest["delta"]["records"], 2)
+
+    def test_reload_replays_delta(self):
+        """Loading returns snapshot plus delta chunks in order"""
+        self.add(4)
+        self.add(3)
+
+        index, documents, metadata = KnowledgeStore(self.directory).load()
+
+        self.assertEqual(list(documents), self.documents)
+        # Loading records each chunk's stable id and its document's id
+        self.assertEqual(metadata, [dict(meta, document_id=meta["id"]) for meta in self.metadata])
+        self.assertEqual(index.ntotal, 7)
+        np.testing.assert_allclose(index.merged().reconstruct_n(0, 7), self.index.reconstruct_n(0, 7))
+
+    def test_uncommitted_chunks_are_not_persisted(self):
+        """Staged chunks are invisible on disk until commit"""
+        self.add(4)
+        self.add(2, commit=False)
+
+        _, documents, _ = KnowledgeStore(self.directory).load()
+
+        self.assertEqual(len(documents), 4)
+
+    def test_interrupted_delta_write_is_ignored(self):
+        """Bytes past the committed delta length are discarded on load and on the next commit"""
+        self.add(4)
+        self.add(1)
+        delta_path = self.directory / self.store.manifest["delta"]["path"]
+        with open(delta_path, "ab") as f:
+            f.write(b'deadbeef {"partial')
+
+        _, documents, _ = KnowledgeStore(self.directory).load()
+        self.assertEqual(len(documents), 5)
+
+        self.add(1)
+        _, documents, _ = KnowledgeStore(self.directory).load()
+        self.assertEqual(len(documents), 6)
+
+    def test_compaction_writes_new_snapshot(self):
+        """A large delta log triggers a new snapshot and removes old files"""
+        self.add(10)
+        old_files = {self.store.manifest["snapshot"]["index"], self.store.manifest["delta"]["path"]}
+
+        self.add(10)
+
+        self.assertEqual(self.store.manifest["delta"]["records"], 0)
+        self.assertEqual(self.store.manifest["snapshot"]["records"], 20)
+        for name in old_files:
+            self.assertFalse((self.directory / name).exists())
+        self.assertEqual(len(KnowledgeStore(self.directory).load()[1]), 20)
+
+    def test_corrupt_snapshot_is_detected(self):
+        """Checksum mismatches raise KnowledgeStoreError"""
+        self.add(4)
+        with open(self.directory / self.store.manifest["snapshot"]["rows"], "ab") as f:
+            f.write(b"corruption")
+
+        with self.assertRaises(KnowledgeStoreError):
+            KnowledgeStore(self.directory).load()
+
+    def test_loads_check_sizes_instead_of_hashing(self):
+        """Loads compare snapshot sizes; checksums are read in full only when asked for"""
+        self.add(4)
+        rows = self.directory / self.store.manifest["snapshot"]["rows"]
+        with open(rows, "r+b") as f:
+            f.seek(-1, 2)
+            f.write(b"\xff")
+
+        with patch("src.core.knowledge_store.file_checksum", wraps=file_checksum) as checksum:
+            KnowledgeStore(self.directory).load()
+            self.assertEqual(checksum.call_count, 0)
+            with self.assertRaises(KnowledgeStoreError):
+                KnowledgeStore(self.directory, verify_checksums=True).load()
+
+    def test_stores_without_sizes_are_hashed_once(self):
+        """Snapshot files of a manifest without sizes are hashed on the first load only"""
+        self.add(4)
+        manifest = json.loads((self.directory / "manifest.json").read_text())
+        manifest["snapshot"] = {k: v for k, v in manifest["snapshot"].items() if not k.endswith("_bytes")}
+        (self.directory / "manifest.json").write_text(json.dumps(manifest))
+
+        store = KnowledgeStore(self.directory)
+        with patch("src.core.knowledge_store.file_checksum", wraps=file_checksum) as checksum:
+            store.load()
+            store.load()
+        self.assertEqual(checksum.call_count, 3)
+
+    def test_corrupt_text_is_detected_on_read(self):
+        """Chunk texts are verified when they are read rather than when the store loads"""
+        self.add(4)
+        with open(self.directory / self.store.manifest["texts"]["path"], "r+b") as f:
+            f.seek(len("chunk 0"))
+            f.write(b"X")
+
+        _, documents, _ = KnowledgeStore(self.directory).load()
+        self.assertEqual(documents[0], "chunk 0")
+        with self.assertRaises(KnowledgeStoreError):
+            documents[1]
+
+    def test_manifest_records_version_and_checksums(self):
+        """The manifest carries a version and checksums for every snapshot file"""
+        self.add(3)
+        manifest = json.loads((self.directory / "manifest.json").read_text())
+
+        self.assertEqual(manifest["version"], 1)
+        self.assertEqual(len(manifest["snapshot"]["index_checksum"]), 64)
+        self.assertEqual(len(manifest["snapshot"]["metadata_checksum"]), 64)
+
+    def test_text_blob_is_append_only(self):
+        """Delta commits and compaction snapshots append to one blob; a rebuild writes a fresh one"""
+        self.add(10)
+        self.add(2)
+        blob = self.store.manifest["texts"]["path"]
+        self.index, self.documents, self.metadata = self.store.load()
+        self.add(10)
+
+        self.assertEqual(self.store.manifest["delta"]["records"], 0)
+        self.assertEqual(self.store.manifest["texts"]["path"], blob)
+        self.assertEqual((self.directory / blob).stat().st_size, self.store.manifest["texts"]["bytes"])
+        _, documents, _ = KnowledgeStore(self.directory).load()
+        self.assertEqual(documents, [f"chunk {i}" for i in range(22)])
+
+        self.store.write_snapshot(self.index, list(documents), self.metadata)
+        self.assertNotEqual(self.store.manifest["texts"]["path"], blob)
+        self.assertFalse((self.directory / blob).exists())
+        self.assertEqual(KnowledgeStore(self.directory).load()[1], documents)
+
+    def test_snapshot_texts_are_memory_mapped(self):
+        """Snapshot chunk texts are read lazily from the shared text file"""
+        self.add(10)
+
+        _, documents, _ = KnowledgeStore(self.directory).load()
+
+        self.assertEqual(documents.snapshot_size, 10)
+        self.assertEqual(documents[3], "chunk 3")
+        self.assertEqual(documents[-1], "chunk 9")
+
+    def test_other_process_sees_incremental_commit(self):
+        """A second store instance detects and applies new delta records"""
+        self.add(10)
+        reader = KnowledgeStore(self.directory)
+        reader.load()
+        self.assertFalse(reader.has_update())
+
+        self.add(2)
+
+        self.assertTrue(reader.has_update())
+        vectors, documents, _ = reader.read_update()
+        self.assertEqual(documents, ["chunk 10", "chunk 11"])
+        self.assertEqual(vectors.shape, (2, DIMENSION))
+        self.assertEqual(reader.version, self.store.version)
+
+    def test_other_process_reloads_after_new_snapshot(self):
+        """A new snapshot requires a full load rather than a delta read"""
+        self.add(10)
+        reader = KnowledgeStore(self.directory)
+        reader.load()
+
+        self.add(10)
+
+        self.assertTrue(reader.has_update())
+        self.assertIsNone(reader.read_update())
+        self.assertEqual(len(reader.load()[1]), 20)
+
+    def test_concurrent_commit_requests_reload(self):
+        """Committing on top of another process's commit keeps both and flags a reload"""
+        self.add(10)
+        other = KnowledgeStore(self.directory)
+        other_index, other_documents, other_metadata = other.load()
+        vectors, documents, metadata = make_chunks(100, 1)
+        other_index.add(vectors)
+        other_documents.extend(documents)
+        other_metadata.extend(metadata)
+        other.stage(vectors, documents, metadata)
+
+        self.add(2)
+        other.commit(other_index, other_documents, other_metadata)
+
+        self.assertTrue(other.needs_reload)
+        _, documents, _ = KnowledgeStore(self.directory).load()
+        self.assertEqual(list(documents)[-3:], ["chunk 10", "chunk 11", "chunk 100"])